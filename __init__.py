@@ -1,26 +1,2 @@
-from .dbAgent import DBAgent
-from .server_client import ServerClient
-from .db_server_integration import DBServerIntegration
-from .server_api import app, start_server
-from haruni.llm import llm, ModelProvider, extract_json_between_markers
-from haruni.Model_deepseek_r1 import Model_deepseek_r1
-from haruni.classifierAgent import ClassifierAgent
-from haruni.memoryAgent import MemoryAgent
-from haruni.responesAgent import ResponseAgent
-from haruni.styleAgent import StyleAgent
-
-__all__ = [
-    'DBAgent',
-    'ServerClient',
-    'DBServerIntegration',
-    'app',
-    'start_server',
-    'llm',
-    'ModelProvider',
-    'Model_deepseek_r1',
-    'extract_json_between_markers',
-    'ClassifierAgent',
-    'MemoryAgent',
-    'ResponseAgent',
-    'StyleAgent'
-] 
\ No newline at end of file
+# 모듈들은 저장소 루트를 작업 디렉터리로 두고 바로 실행/임포트한다 (예: python app.py, from dbAgent import DBAgent).
+# 예전 패키지 구조의 모듈(server_client, haruni.* 등)은 더 이상 없으므로 여기서 미리 임포트하지 않는다.
@@ -1,24 +1,35 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file, url_for, abort, g, Response
 import os
 import json
+import time
+import uuid
 import logging
+from datetime import datetime
+from logging_setup import setup_logging, log_payload
+
+# 로깅 설정 (진입점에서 한 번만 설치, 다른 모듈은 로거만 가져옴)
+# 가져오는 모듈들이 import 중에 남기는 로그도 기록되도록 다른 모듈보다 먼저 설치
+setup_logging()
+
+import metrics
 from dbAgent import DBAgent
 from memoryAgent import MemoryAgent
 from responseAgent import ResponseAgent
 from llm import llm
-from create_diary import summarize_conversation, create_daily_diary_image, analyze_weekly_sentiment_separated
+from create_diary import (create_day_diary_cached, analyze_weekly_sentiment_cached, precompute_weekly_analysis,
+                          record_week_entry)
+from diary_draft import DiaryDraftStore, DIARY_DRAFT
+from image_store import ImageStore
+from user_lock import KeyedLock, QueueFullError
+from speculation import speculate, SPECULATIVE_REPLY
+from single_flight import SingleFlight
+from cache_store import stable_hash
+from mood_classifier import get_classifier
+from mood_trend import MoodSeriesStore, PERIOD_DAYS, trend_summary, weekly_trend_stats, parse_date
 from dotenv import load_dotenv
 
-# 로깅 설정
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("haruni.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("FlaskApp")
+request_logger = logging.getLogger("RequestLog")
 
 load_dotenv()
 logger.info("환경 변수 로드 완료")
@@ -30,7 +41,8 @@ logger.info("Flask 앱 초기화")
 # model = llm("google/gemma-3-4b-it")
 # model = llm("google/gemma-3-1b-it")
 logger.info("LLM 모델 초기화 시작")
-model = llm("ollama-gemma3:4b-it-qat")
+# HARUNI_MODEL_ID=fake 로 실제 모델 없이 실행 가능 (fake_llm.py)
+model = llm(os.getenv("HARUNI_MODEL_ID", "ollama-gemma3:4b-it-qat"))
 #model = llm("google/gemma-3-4b-it-qat-q4_0-gguf")
 logger.info("LLM 모델 초기화 완료")
 
@@ -48,9 +60,60 @@ memory_agent = MemoryAgent(model)
 response_agent = ResponseAgent(model)
 logger.info("에이전트 객체 초기화 완료")
 
+# 일기 이미지 로컬 저장소 (DALL·E 임시 URL 대신 사용)
+image_store = ImageStore(os.getenv("IMAGE_STORE_DIR", "image_store"))
+
+# 저장된 이미지는 내용이 바뀌지 않으므로 1년 동안 캐시
+IMAGE_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+# 사용자별 일간 기분 시계열 저장소
+mood_store = MoodSeriesStore(os.getenv("MOOD_SERIES_DIR", "mood_series"))
+
 # 전역 메시지 히스토리 관리 (사용자 ID별)
 message_histories = {}
 
+# 같은 사용자의 대화 요청은 도착 순서대로 하나씩, 다른 사용자끼리는 병렬로 처리
+user_locks = KeyedLock()
+
+# 모바일 재시도로 들어온 같은 메시지(userId + sendingDate + sendingTime + 내용)는 한 번만 처리
+chat_flight = SingleFlight()
+
+# 대화 중에 하루치 일기 초안(구간 요약)을 미리 만들어 두는 저장소 (HARUNI_DIARY_DRAFT=1)
+diary_drafts = DiaryDraftStore()
+
+
+@app.before_request
+def start_request_trace():
+    g.request_start = time.perf_counter()
+    metrics.start_request(request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+
+
+@app.after_request
+def finish_request_trace(response):
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    if endpoint != '/metrics':
+        metrics.REQUEST_SECONDS.observe(elapsed, endpoint, request.method, str(response.status_code))
+    trace = metrics.finish_request() or {}
+    if trace.get("request_id"):
+        response.headers['X-Request-ID'] = trace["request_id"]
+    # 요청당 한 줄의 구조화된 로그 (단계별 시간/이벤트 포함)
+    request_logger.info("request", extra={"request_id": trace.get("request_id"), "fields": {
+        "method": request.method,
+        "endpoint": endpoint,
+        "status": response.status_code,
+        "duration_ms": round(elapsed * 1000, 1),
+        "stages": trace.get("stages", {}),
+        "events": trace.get("events", {}),
+        "llm_calls": trace.get("llm_calls", [])
+    }})
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/v1/question', methods=['POST'])
 def chat():
     logger.info("질문 API 요청 수신")
@@ -78,86 +141,188 @@ def chat():
         logger.warning("필수 매개변수 누락: user_id 또는 question")
         return jsonify({'error': 'user_id와 question이 필요합니다.'}), 400
     
-    try:
-        logger.info(f"사용자 ID: {user_id}")
-        # 질문 전체 내용 로깅
-        logger.info(f"질문 내용: {question}")
-        
-        # 사용자별 메시지 히스토리 가져오기 (없으면 빈 리스트 생성)
-        msg_history = message_histories.get(user_id, [])
-        
-        # 현재 대화 컨텍스트에 필요한 히스토리만 필터링
-        if len(msg_history) > 0:
-            filtered_history = memory_agent.filter_context(msg_history, question)
-        else:
-            filtered_history = []
+    def answer():
+        with user_locks.hold(str(user_id)):
+            return _answer_question(user_id, question, user_info, user_mbti, sendingDate, sendingTime)
 
-        # 1. DB Agent 처리 (사용자 정보 및 관련 컨텍스트 가져오기)
-        db_agent.set_user_id(user_id)  # 사용자 ID 설정
-        needs_db, db_result = db_agent.process_question(question, sendingDate, sendingTime)     
-        
-        # 응답 생성
-        if needs_db:
-            #logger.info(f"DB 참조 결과: {db_result[:200]}..." if len(db_result) > 200 else f"DB 참조 결과: {db_result}")
-            #logger.info(f"DB 참조 결과: {db_result}")
-            response, updated_history = response_agent.generate_response(question, filtered_history, db_result, user_info, user_mbti)
+    try:
+        if sendingDate and sendingTime:
+            # 재시도 요청은 사용자 잠금 밖에서 진행 중인 처리에 합류하거나 저장된 결과를 받음
+            key = stable_hash([str(user_id), sendingDate, sendingTime, stable_hash(question)])
+            response_data, kind = chat_flight.do(key, answer)
+            metrics.count_coalesced(kind)
+            if kind != "leader":
+                logger.info(f"중복 요청 처리 (사용자 {user_id}): {kind}")
         else:
-            response, updated_history = response_agent.generate_response(question, filtered_history, None, user_info, user_mbti)
-
-        # 메시지 히스토리 업데이트
-        message_histories[user_id] = updated_history
-        
-        # 응답 데이터 구성
-        response_data = {
-            'user_id': user_id,
-            'response': response,
-        }
-
-        # 응답 내용 로깅
-        logger.info(f"응답 내용: {response}")
-        
-        return jsonify(response_data)
-    
+            # 보낸 시각이 없으면 같은 메시지를 다시 보낸 것과 구분할 수 없으므로 합치지 않음
+            response_data, kind = answer(), "leader"
+        response = jsonify(response_data)
+        if kind != "leader":
+            response.headers['X-Idempotent-Replay'] = kind
+        return response
+    except QueueFullError as e:
+        logger.warning(f"대화 요청 거절 (사용자 {user_id}): {str(e)}")
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '1'
+        return response, 429
     except Exception as e:
         logger.error(f"질문 처리 중 오류 발생: {str(e)}", exc_info=True)
         print(e)
         return jsonify({'error': str(e)}), 500
 
 
+def _answer_question(user_id, question, user_info, user_mbti, sendingDate, sendingTime):
+    """사용자 잠금 안에서 한 턴의 대화를 처리하고 응답 데이터(dict)를 반환하는 함수"""
+    logger.info(f"사용자 ID: {user_id}")
+    # 질문 전체 내용 로깅
+    log_payload(logger, "질문 내용", question)
+    
+    # 사용자별 메시지 히스토리 가져오기 (없으면 빈 리스트 생성)
+    msg_history = message_histories.get(user_id, [])
+    
+    # 현재 대화 컨텍스트에 필요한 히스토리만 필터링
+    if len(msg_history) > 0:
+        filtered_history = memory_agent.filter_context(msg_history, question)
+    else:
+        filtered_history = []
+
+    # 추측 모드: DB 판단과 병렬로 DB 없는 응답을 미리 생성 (DB 가 필요하면 폐기)
+    speculation = None
+    on_relevance = None
+    if SPECULATIVE_REPLY:
+        speculation = speculate(response_agent.generate_response, question, filtered_history, None, user_info, user_mbti)
+
+    if speculation is not None:
+        def on_relevance(needs_db):
+            if needs_db:
+                speculation.discard()
+
+    # 1. DB Agent 처리 (사용자 정보 및 관련 컨텍스트 가져오기)
+    needs_db, db_result = db_agent.process_question(question, sendingDate, sendingTime, user_id, on_relevance)
+    
+    # 응답 생성
+    response = None
+    if needs_db:
+        if speculation is not None:
+            speculation.discard()
+        #logger.info(f"DB 참조 결과: {db_result[:200]}..." if len(db_result) > 200 else f"DB 참조 결과: {db_result}")
+        #logger.info(f"DB 참조 결과: {db_result}")
+        response, updated_history = response_agent.generate_response(question, filtered_history, db_result, user_info, user_mbti)
+    elif speculation is not None and not speculation.discarded:
+        try:
+            response, updated_history = speculation.use()
+        except Exception as e:
+            logger.warning(f"추측 응답 실패, 다시 생성: {e}")
+            response = None
+    if response is None:
+        # DB 판단 후 조회 결과가 없어 이미 폐기한 추측 응답도 여기서 다시 생성
+        response, updated_history = response_agent.generate_response(question, filtered_history, None, user_info, user_mbti)
+
+    # 메시지 히스토리 업데이트
+    message_histories[user_id] = updated_history
+    
+    # 응답 데이터 구성
+    response_data = {
+        'user_id': user_id,
+        'response': response,
+    }
+
+    # 응답 내용 로깅
+    log_payload(logger, "응답 내용", response)
+
+    if DIARY_DRAFT:
+        # 일기 초안 기록 (구간이 다 차면 백그라운드에서 요약)
+        try:
+            diary_drafts.record_turn(str(user_id), sendingDate or datetime.now().strftime("%Y-%m-%d"), question, response)
+        except Exception as e:
+            logger.error(f"일기 초안 기록 실패: {str(e)}", exc_info=True)
+    
+    return response_data
+
+
 @app.route('/api/v1/day-diary', methods=['POST'])
 def day_diary():
     logger.info("일일 일기 API 요청 수신")
     try:
         conversation = request.json.get("conversation", [])
+        user_id = request.json.get("userId")
+        diary_date = request.json.get("date") or datetime.now().strftime("%Y-%m-%d")
         logger.info(f"대화 내역 수신: {len(conversation)}개 메시지")
+        # regenerate: 같은 대화라도 캐시를 무시하고 일기와 이미지를 새로 생성
+        regenerate = bool(request.json.get("regenerate"))
+
+        # 대화 중에 만든 초안이 이 대화와 맞으면 구간 요약 캐시를 쓰도록 구간 요약 방식으로 마무리
+        # (맞지 않으면 DIARY_SUMMARY_MODE 를 따름)
+        chunked = None
+        if DIARY_DRAFT and user_id:
+            if not conversation:
+                conversation = diary_drafts.messages(str(user_id), diary_date)
+                logger.info(f"기록된 대화 사용: {len(conversation)}개 메시지")
+            if diary_drafts.matches_draft(str(user_id), diary_date, conversation):
+                chunked = True
+
+        result = create_day_diary_cached(conversation, image_store, regenerate, chunked)
+        mood, diary = result["mood"], result["diary"]
+        logger.info(f"요약 결과 - 감정: {mood} (캐시: {result['cache']})")
+        log_payload(logger, "일기 내용", diary)
+
+        if user_id and diary:
+            # 추세 분석용 기분 시계열 기록 (점수는 로컬 분류기로 계산)
+            score = get_classifier().classify_day(conversation).score
+            mood_store.record(user_id, diary_date, mood, score)
+            # 한 주의 마지막 일기면 주간 분석을 미리 계산
+            record_week_entry(user_id, diary_date, mood, diary, mood_store)
         
-        mood, diary, illustration = summarize_conversation(conversation)
-        logger.info(f"요약 결과 - 감정: {mood}")
-        logger.info(f"일기 내용: {diary}")
-        
-        image_url = create_daily_diary_image(illustration)
+        digest = result["image_digest"]
+        image_url = result["image_url"]
+        thumbnails = {}
+        if digest:
+            image_url = url_for('diary_image', digest=digest, _external=True)
+            thumbnails = {
+                str(size): url_for('diary_image', digest=digest, size=size, _external=True)
+                for size in image_store.thumbnail_sizes
+            }
         
         response_data = {
             "mood": mood,
             "daySummaryDescription": diary,
             "daySummaryImage": image_url,
-            "date" : "2025-05-09"
+            "daySummaryThumbnails": thumbnails,
+            "date" : diary_date
         }
         logger.info("일일 일기 응답 생성 완료")
-        return jsonify(response_data) # 수정해야함
+        response = jsonify(response_data)
+        response.headers['X-Diary-Cache'] = result["cache"]
+        return response
     except Exception as e:
         logger.error(f"일일 일기 처리 중 오류 발생: {str(e)}", exc_info=True)
         return jsonify({"error": f"처리 중 오류 발생: {str(e)}"}), 500
 
 
+@app.route('/api/v1/images/<digest>', methods=['GET'])
+def diary_image(digest):
+    size = request.args.get('size', type=int)
+    path = image_store.path_for(digest, size)
+    if path is None or not os.path.exists(path):
+        abort(404)
+    response = send_file(path, mimetype=image_store.mimetype, conditional=True, etag=digest if size is None else f"{digest}-{size}")
+    response.headers['Cache-Control'] = f"public, max-age={IMAGE_CACHE_MAX_AGE}, immutable"
+    return response
+
+
 @app.route('/api/v1/week-status', methods=['POST'])
 def week_status():
     logger.info("주간 분석 API 요청 수신")
     try:
         weekly_data = request.json.get("weekly_data", [])
+        refresh = bool(request.json.get("refresh", False))
+        user_id = request.json.get("userId")
         logger.info(f"주간 데이터 수신: {len(weekly_data)}일치")
+
+        # 사용자 ID가 있으면 최근 한 달 기분 추세를 압축된 통계로 함께 전달 (날짜 형식이 틀리면 생략)
+        trend_stats = weekly_trend_stats(mood_store, user_id, weekly_data)
         
-        feedback, summary, suggestions, recs = analyze_weekly_sentiment_separated(weekly_data)
+        feedback, summary, suggestions, recs = analyze_weekly_sentiment_cached(weekly_data, refresh=refresh, trend_stats=trend_stats)
         logger.info(f"주간 분석 결과 - 피드백: {feedback[:200]}..." if len(feedback) > 200 else f"주간 분석 결과 - 피드백: {feedback}")
         
         response_data = {
@@ -173,7 +338,42 @@ def week_status():
         return jsonify({"error": f"처리 중 오류 발생: {str(e)}"}), 500
 
 
+@app.route('/api/v1/mood-trend', methods=['GET'])
+def mood_trend():
+    logger.info("기분 추세 API 요청 수신")
+    user_id = request.args.get('userId')
+    period = request.args.get('period', 'month')
+    end_date = request.args.get('endDate')
+    if not user_id or period not in PERIOD_DAYS:
+        return jsonify({"error": "userId와 올바른 period(week/month/year)가 필요합니다."}), 400
+    if end_date and parse_date(end_date) is None:
+        return jsonify({"error": "endDate는 YYYY-MM-DD 형식이어야 합니다."}), 400
+    try:
+        summary = trend_summary(mood_store.load(str(user_id)), period, parse_date(end_date) if end_date else None)
+        return jsonify(summary)
+    except Exception as e:
+        logger.error(f"기분 추세 처리 중 오류 발생: {str(e)}", exc_info=True)
+        return jsonify({"error": f"처리 중 오류 발생: {str(e)}"}), 500
+
+
+@app.route('/api/v1/week-status/precompute', methods=['POST'])
+def week_status_precompute():
+    logger.info("주간 분석 사전 계산 요청 수신")
+    try:
+        weekly_data = request.json.get("weekly_data", [])
+        user_id = request.json.get("userId")
+        if not weekly_data:
+            return jsonify({"error": "weekly_data가 필요합니다."}), 400
+        # week-status 와 같은 추세 통계를 넣어야 같은 캐시 키가 됨
+        trend_stats = weekly_trend_stats(mood_store, user_id, weekly_data)
+        key = precompute_weekly_analysis(weekly_data, trend_stats)
+        return jsonify({"key": key}), 202
+    except Exception as e:
+        logger.error(f"주간 분석 사전 계산 요청 처리 중 오류 발생: {str(e)}", exc_info=True)
+        return jsonify({"error": f"처리 중 오류 발생: {str(e)}"}), 500
+
+
 if __name__ == '__main__':
     logger.info("하루니 서버 시작")
-    app.run(host='0.0.0.0', port=5000, debug=True) 
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
     logger.info("하루니 서버 종료") 
\ No newline at end of file
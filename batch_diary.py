@@ -0,0 +1,369 @@
+import argparse
+import json
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import mysql.connector
+from mysql.connector import Error
+from dotenv import load_dotenv
+from image_store import ImageStore
+from mood_classifier import get_classifier
+from mood_trend import MoodSeriesStore
+from logging_setup import setup_logging
+
+logger = logging.getLogger("BatchDiary")
+
+load_dotenv()
+
+# 하루치 대화를 사용자별로 읽어오는 쿼리 (chats 테이블)
+CHATS_QUERY = """
+    SELECT user_id, sender, content, sending_date, sending_time
+    FROM chats
+    WHERE sending_date = %s
+    ORDER BY user_id, sending_time
+"""
+
+# 결과를 DB에 일괄 저장할 때 사용하는 쿼리 (--write-db)
+# diaries 의 (user_id, date) 고유 키 기준으로 덮어쓰므로, 체크포인트 저장 전에 중단된 배치를 다시 돌려도 중복 행이 생기지 않음
+DIARY_INSERT_QUERY = """
+    INSERT INTO diaries (user_id, date, mood, content, image_url)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        mood = VALUES(mood), content = VALUES(content), image_url = VALUES(image_url)
+"""
+
+# DB에 저장할 이미지 주소 앞부분 (비워 두면 "/api/v1/images/<digest>" 상대 경로)
+IMAGE_PUBLIC_BASE_URL = os.getenv("IMAGE_PUBLIC_BASE_URL", "").rstrip("/")
+
+# 사용자 발화로 취급할 sender 값
+USER_SENDERS = ("user", "member")
+
+
+def _to_role(sender):
+    return "user" if str(sender).lower() in USER_SENDERS else "assistant"
+
+
+def stored_image_url(digest):
+    """로컬 저장소에 저장된 이미지를 app.py 의 이미지 API 로 가리키는 주소"""
+    return f"{IMAGE_PUBLIC_BASE_URL}/api/v1/images/{digest}"
+
+
+def load_conversations(db_config, date):
+    """
+    chats 테이블에서 지정한 날짜의 대화를 사용자별로 묶어서 가져오는 함수
+
+    반환값:
+    - conversations: {user_id: [{"role": ..., "content": ...}, ...]} 형식의 딕셔너리
+    """
+    logger.info(f"대화 내역 조회 시작: {date}")
+    conversations = {}
+    connection = mysql.connector.connect(**db_config)
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(CHATS_QUERY, (date,))
+        for row in cursor.fetchall():
+            conversations.setdefault(str(row["user_id"]), []).append({
+                "role": _to_role(row["sender"]),
+                "content": row["content"]
+            })
+        cursor.close()
+    finally:
+        connection.close()
+    logger.info(f"대화 내역 조회 완료: 사용자 {len(conversations)}명")
+    return conversations
+
+
+class RateLimiter:
+    """
+    OpenAI 호출 속도를 제한하는 클래스
+
+    분당 호출 수(rpm)에 맞춰 호출 간격을 벌린다.
+    429/5xx 재시도와 Retry-After 대기는 create_diary 의 ResilientOpenAI 에서만 한다.
+    """
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm and rpm > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Checkpoint:
+    """
+    완료된 사용자 ID를 파일에 기록하여 중단된 배치를 이어서 실행할 수 있게 하는 클래스
+    """
+    def __init__(self, path, date):
+        self.path = path
+        self.date = date
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("date") == date:
+                self.done = set(data.get("done", []))
+                logger.info(f"체크포인트 로드: {len(self.done)}명 완료 상태")
+            else:
+                logger.info("다른 날짜의 체크포인트 - 새로 시작")
+
+    def save(self, user_ids):
+        self.done.update(user_ids)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"date": self.date, "done": sorted(self.done)}, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class ResultWriter:
+    """
+    생성된 일기를 모아두었다가 batch_size 단위로 한 번에 기록하는 클래스
+
+    결과 파일(JSONL)에 먼저 기록한 뒤 체크포인트를 갱신하므로,
+    체크포인트에 있는 사용자는 항상 결과가 저장된 상태이다.
+    결과 파일 기록 후 체크포인트 저장 전에 중단되었다면, 시작할 때 결과 파일에 이미 있는
+    같은 날짜의 사용자를 체크포인트에 반영해 다시 생성하거나 중복 기록하지 않는다.
+    """
+    def __init__(self, output_path, checkpoint, batch_size=50, db_config=None):
+        self.output_path = output_path
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.db_config = db_config
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._recover()
+
+    def _recover(self):
+        if not os.path.exists(self.output_path):
+            return
+        with open(self.output_path, "r", encoding="utf-8") as file:
+            text = file.read()
+        if text and not text.endswith("\n"):
+            # 쓰는 도중에 중단되어 잘린 마지막 줄은 버림 (다음 기록이 그 뒤에 붙지 않도록)
+            text = text[:text.rfind("\n") + 1]
+            with open(self.output_path, "w", encoding="utf-8") as file:
+                file.write(text)
+            logger.warning(f"결과 파일의 잘린 마지막 줄 제거: {self.output_path}")
+        recovered = {}
+        for line in text.splitlines():
+            result = json.loads(line)
+            if result.get("date") == self.checkpoint.date and result["user_id"] not in self.checkpoint.done:
+                recovered[result["user_id"]] = result
+        if not recovered:
+            return
+        if self.db_config:
+            # DB 저장 전에 중단되었을 수 있으므로 다시 저장 (ON DUPLICATE KEY UPDATE 라 중복되지 않음)
+            self._write_db(list(recovered.values()))
+        self.checkpoint.save(recovered)
+        logger.info(f"체크포인트에 없던 결과 {len(recovered)}건을 결과 파일에서 복구")
+
+    def add(self, result):
+        with self._lock:
+            self._buffer.append(result)
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        with open(self.output_path, "a", encoding="utf-8") as file:
+            file.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch))
+        if self.db_config:
+            self._write_db(batch)
+        self.checkpoint.save(r["user_id"] for r in batch)
+        logger.info(f"결과 {len(batch)}건 일괄 저장")
+
+    def _write_db(self, batch):
+        connection = mysql.connector.connect(**self.db_config)
+        try:
+            cursor = connection.cursor()
+            cursor.executemany(DIARY_INSERT_QUERY, [
+                (r["user_id"], r["date"], r["mood"], r["diary"], r["image_url"]) for r in batch
+            ])
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+
+
+def generate_diary_for_user(user_id, date, conversation, limiter, image_store=None):
+    """
+    한 사용자의 대화로 일기와 이미지를 생성하는 함수
+
+    재시도는 create_diary 의 OpenAI 클라이언트(ResilientOpenAI, OPENAI_MAX_RETRIES)에서만 하므로
+    여기서는 단계마다 한 번씩만 호출한다. summarize_conversation / create_daily_diary_image 가
+    None 을 돌려주면 재시도까지 모두 실패한 것이다.
+    이미지만 실패하면 일기는 이미지 없이(image_url=None) 저장한다.
+
+    반환값:
+    - result: 결과 딕셔너리, 일기 생성에 실패하면 None
+    """
+    from create_diary import summarize_conversation, create_daily_diary_image
+
+    limiter.acquire()
+    mood, diary, illustration = summarize_conversation(conversation)
+    if not diary:
+        logger.error(f"일기 생성 실패: 사용자 {user_id}")
+        return None
+
+    limiter.acquire()
+    image_url = create_daily_diary_image(illustration)
+    if not image_url:
+        logger.warning(f"일기 이미지 생성 실패, 이미지 없이 저장: 사용자 {user_id}")
+
+    image_digest = None
+    if image_store is not None and image_url:
+        try:
+            image_digest = image_store.store_url(image_url)
+        except Exception as e:
+            logger.error(f"일기 이미지 저장 실패: 사용자 {user_id} - {str(e)}")
+    # OpenAI 이미지 URL 은 몇 시간 뒤 만료되므로, 저장에 성공했으면 저장된 이미지 주소를 남김
+    if image_digest:
+        image_url = stored_image_url(image_digest)
+
+    return {
+        "user_id": user_id,
+        "date": date,
+        "mood": mood,
+        "mood_score": get_classifier().classify_day(conversation).score,
+        "diary": diary,
+        "illustration": illustration,
+        "image_url": image_url,
+        "image_digest": image_digest
+    }
+
+
+def run_batch(conversations, date, output_path, checkpoint_path,
+              concurrency=4, rpm=60, batch_size=50, db_config=None, image_store=None, mood_store=None):
+    """
+    사용자별 일기 생성을 병렬로 실행하는 함수
+
+    Args:
+        conversations (dict): {user_id: conversation} 형식의 대화 데이터
+        date (str): 일기 날짜 (YYYY-MM-DD)
+        output_path (str): 결과 JSONL 파일 경로
+        checkpoint_path (str): 체크포인트 파일 경로
+        concurrency (int): 동시에 처리할 사용자 수
+        rpm (int): 분당 최대 OpenAI 호출 수
+        batch_size (int): 결과를 한 번에 기록할 건수
+        db_config (dict, optional): 지정 시 결과를 diaries 테이블에도 일괄 저장
+        image_store (ImageStore, optional): 지정 시 생성된 이미지를 로컬 저장소에 저장
+        mood_store (MoodSeriesStore, optional): 지정 시 기분 시계열에 결과를 기록
+
+    Returns:
+        dict: 처리 통계 (처리량 포함)
+    """
+    from create_diary import record_week_entry
+
+    checkpoint = Checkpoint(checkpoint_path, date)
+    writer = ResultWriter(output_path, checkpoint, batch_size, db_config)
+    limiter = RateLimiter(rpm)
+
+    pending = {uid: conv for uid, conv in conversations.items() if uid not in checkpoint.done and conv}
+    logger.info(f"배치 시작: 대상 {len(pending)}명 (완료 {len(checkpoint.done)}명 건너뜀), 동시성 {concurrency}")
+
+    succeeded, failed = 0, 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(generate_diary_for_user, uid, date, conv, limiter, image_store=image_store): uid
+            for uid, conv in pending.items()
+        }
+        for future in as_completed(futures):
+            uid = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"사용자 {uid} 처리 중 오류 발생: {str(e)}", exc_info=True)
+                result = None
+            if result:
+                writer.add(result)
+                if mood_store is not None:
+                    mood_store.record(uid, date, result["mood"], result["mood_score"])
+                # 한 주의 마지막 일기면 주간 분석을 미리 계산 (백그라운드, 프로세스 종료 전에 끝남)
+                record_week_entry(uid, date, result["mood"], result["diary"], mood_store)
+                succeeded += 1
+            else:
+                failed += 1
+    writer.flush()
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        "date": date,
+        "total": len(pending),
+        "succeeded": succeeded,
+        "failed": failed,
+        "skipped": len(conversations) - len(pending),
+        "elapsed_sec": round(elapsed, 2),
+        "users_per_min": round(succeeded / elapsed * 60, 2) if elapsed > 0 else 0.0
+    }
+    logger.info(f"배치 완료: {json.dumps(stats, ensure_ascii=False)}")
+    return stats
+
+
+def main():
+    """메인 함수"""
+    setup_logging()
+    parser = argparse.ArgumentParser(description="하루니 야간 일기 일괄 생성")
+    parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="일기 날짜 (YYYY-MM-DD)")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시에 처리할 사용자 수")
+    parser.add_argument("--rpm", type=int, default=60, help="분당 최대 OpenAI 호출 수")
+    parser.add_argument("--batch-size", type=int, default=50, help="결과를 한 번에 기록할 건수")
+    parser.add_argument("--max-retries", type=int, default=None,
+                        help="OpenAI 호출당 최대 재시도 횟수 (기본값: OPENAI_MAX_RETRIES)")
+    parser.add_argument("--output", default=None, help="결과 JSONL 파일 경로")
+    parser.add_argument("--checkpoint", default=None, help="체크포인트 파일 경로")
+    parser.add_argument("--input", default=None, help="DB 대신 사용할 대화 JSON 파일 ({user_id: conversation})")
+    parser.add_argument("--write-db", action="store_true", help="결과를 diaries 테이블에도 저장")
+    parser.add_argument("--no-store-images", action="store_true", help="생성된 이미지를 로컬 저장소에 저장하지 않음")
+    args = parser.parse_args()
+    if args.max_retries is not None:
+        # create_diary 는 첫 일기 생성 때 불러오므로, 그 전에 OpenAI 클라이언트 재시도 횟수를 맞춰 둠
+        os.environ["OPENAI_MAX_RETRIES"] = str(args.max_retries)
+
+    db_config = {
+        "host": os.getenv("DB_HOST"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "database": os.getenv("DB_NAME")
+    }
+
+    output_path = args.output or f"diaries_{args.date}.jsonl"
+    checkpoint_path = args.checkpoint or f"{output_path}.checkpoint"
+
+    try:
+        if args.input:
+            with open(args.input, "r", encoding="utf-8") as file:
+                conversations = {str(k): v for k, v in json.load(file).items()}
+        else:
+            conversations = load_conversations(db_config, args.date)
+    except Error as e:
+        logger.error(f"대화 내역 조회 오류: {e}")
+        raise SystemExit(1)
+
+    stats = run_batch(
+        conversations, args.date, output_path, checkpoint_path,
+        concurrency=args.concurrency, rpm=args.rpm, batch_size=args.batch_size,
+        db_config=db_config if args.write_db else None,
+        image_store=None if args.no_store_images else ImageStore(os.getenv("IMAGE_STORE_DIR", "image_store")),
+        mood_store=MoodSeriesStore(os.getenv("MOOD_SERIES_DIR", "mood_series"))
+    )
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
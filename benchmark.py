@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import requests
+from logging_setup import setup_logging
+
+logger = logging.getLogger("Benchmark")
+
+# 여러 사용자가 동시에 대화/일기/주간 분석을 요청하는 부하 생성기
+# 실제 서버(--base-url) 또는 프로세스 내 Flask 테스트 클라이언트(--in-process)에 보낼 수 있다.
+# 실제 모델 없이 돌리려면 HARUNI_MODEL_ID=fake HARUNI_FAKE_OPENAI=1 과 함께 --in-process 로 실행한다.
+
+SMALL_TALK = (
+    "안녕! 오늘 하루 어땠어?",
+    "오늘 점심에 친구랑 떡볶이 먹었어",
+    "회사에서 발표했는데 생각보다 잘 끝났어",
+    "비가 와서 그런지 좀 피곤하네",
+    "퇴근하고 한강에서 산책했어",
+    "요즘 운동을 다시 시작했어",
+    "동생이랑 사소한 걸로 다퉜어",
+    "새로 산 책이 너무 재밌어",
+    "오늘은 아무것도 하기 싫은 날이야",
+    "저녁으로 김치찌개 끓여 먹었어",
+)
+
+RECALL_QUESTIONS = (
+    "나 어제 뭐 먹었는지 기억나?",
+    "지난주에 내가 뭐 했더라?",
+    "저번에 말했던 친구 이름이 뭐였지?",
+    "내가 언제 마지막으로 운동했다고 했지?",
+    "지난번 일기에 뭐라고 썼었어?",
+)
+
+WEEK_DIARIES = (
+    ("POSITIVE", "친구들과 맛있는 저녁을 먹으며 즐거운 시간을 보냈다."),
+    ("NEUTRAL", "평소처럼 출근하고 퇴근했다. 특별한 일은 없었다."),
+    ("NEGATIVE", "일이 많아서 지치고 힘든 하루였다."),
+    ("POSITIVE", "오랜만에 운동을 해서 개운했다."),
+)
+
+MBTIS = ("INTJ", "ENFP", "ISTJ", "ESFP", "INFP", "ENTJ")
+
+
+class HttpTransport:
+    """실제 서버로 요청을 보내는 전송 계층 (스레드별 세션 사용)"""
+    def __init__(self, base_url, timeout=120.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def request(self, method, path, body=None, params=None):
+        response = self._session().request(method, self.base_url + path, json=body, params=params, timeout=self.timeout)
+        return response.status_code, response.content
+
+
+class FlaskTransport:
+    """같은 프로세스의 Flask 앱에 테스트 클라이언트로 요청을 보내는 전송 계층"""
+    def __init__(self):
+        from app import app
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, params=None):
+        if not hasattr(self._local, "client"):
+            self._local.client = self.app.test_client()
+        response = self._local.client.open(path, method=method, json=body, query_string=params)
+        return response.status_code, response.data
+
+
+class Recorder:
+    """엔드포인트별 지연 시간과 오류를 모으는 클래스"""
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._errors = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def call(self, transport, name, method, path, body=None, params=None):
+        start = time.perf_counter()
+        try:
+            status, _ = transport.request(method, path, body, params)
+            error = None if status < 400 else str(status)
+        except Exception as e:
+            status, error = None, type(e).__name__
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._samples[name].append((elapsed, error is None))
+            if error:
+                self._errors[name][error] += 1
+        return status
+
+    def summary(self, wall_seconds):
+        endpoints = {}
+        all_latencies = []
+        total_errors = 0
+        for name, samples in sorted(self._samples.items()):
+            latencies = np.array([s[0] for s in samples], dtype=np.float64)
+            errors = sum(1 for s in samples if not s[1])
+            total_errors += errors
+            all_latencies.append(latencies)
+            endpoints[name] = {
+                "requests": len(samples),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4),
+                "error_kinds": dict(self._errors[name]),
+                "throughput_rps": round(len(samples) / wall_seconds, 3),
+                **latency_stats(latencies)
+            }
+        combined = np.concatenate(all_latencies) if all_latencies else np.array([])
+        return {
+            "total": {
+                "requests": int(combined.size),
+                "errors": total_errors,
+                "error_rate": round(total_errors / combined.size, 4) if combined.size else 0.0,
+                "throughput_rps": round(combined.size / wall_seconds, 3),
+                **latency_stats(combined)
+            },
+            "endpoints": endpoints
+        }
+
+
+def latency_stats(latencies):
+    if latencies.size == 0:
+        return {}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "mean_ms": round(float(latencies.mean() * 1000), 1),
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "p99_ms": round(float(p99), 1),
+        "max_ms": round(float(latencies.max() * 1000), 1)
+    }
+
+
+def run_user(user_index, transport, recorder, args, base_date):
+    """
+    한 사용자의 하루 대화를 흉내 내는 함수
+
+    turns 번 대화(일부는 과거 기록을 묻는 질문)를 보낸 뒤 day-diary 와 week-status 를 요청한다.
+    """
+    rng = random.Random(args.seed * 1000 + user_index)
+    user_id = f"bench-{user_index}"
+    mbti = rng.choice(MBTIS)
+    conversation = []
+    start_time = datetime.strptime("20:00:00", "%H:%M:%S")
+
+    for turn in range(args.turns):
+        content = rng.choice(RECALL_QUESTIONS) if rng.random() < args.recall_ratio else rng.choice(SMALL_TALK)
+        sending_time = (start_time + timedelta(minutes=turn)).strftime("%H:%M:%S")
+        recorder.call(transport, "question", "POST", "/api/v1/question", {
+            "userId": user_id,
+            "content": content,
+            "sendingDate": base_date.strftime("%Y-%m-%d"),
+            "sendingTime": sending_time,
+            "gender": rng.choice(("MALE", "FEMALE")),
+            "mbti": mbti,
+            "nickname": f"사용자{user_index}"
+        })
+        conversation.append({"role": "user", "content": content})
+        if args.think_time:
+            time.sleep(rng.uniform(0, args.think_time))
+
+    if args.diary:
+        recorder.call(transport, "day-diary", "POST", "/api/v1/day-diary", {
+            "userId": user_id,
+            "date": base_date.strftime("%Y-%m-%d"),
+            "conversation": conversation
+        })
+
+    if args.week:
+        weekly_data = []
+        for offset in range(6, -1, -1):
+            sentiment, diary = rng.choice(WEEK_DIARIES)
+            weekly_data.append({
+                "date": (base_date - timedelta(days=offset)).strftime("%Y-%m-%d"),
+                "sentiment": sentiment,
+                "diary": diary
+            })
+        recorder.call(transport, "week-status", "POST", "/api/v1/week-status", {
+            "userId": user_id,
+            "weekly_data": weekly_data
+        })
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current, previous):
+    """이전 결과와 엔드포인트별 p50/p95/p99 와 오류율 차이를 출력하는 함수"""
+    print(f"\n비교 기준: {previous.get('meta', {}).get('commit')} -> {current['meta'].get('commit')}")
+    for name, stats in current["endpoints"].items():
+        before = previous.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        parts = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if key in stats and key in before and before[key]:
+                change = (stats[key] - before[key]) / before[key] * 100
+                parts.append(f"{key} {before[key]} -> {stats[key]} ({change:+.1f}%)")
+        parts.append(f"error_rate {before['error_rate']} -> {stats['error_rate']}")
+        print(f"  {name}: " + ", ".join(parts))
+
+
+def main():
+    setup_logging()
+    parser = argparse.ArgumentParser(description="하루니 다중 사용자 부하 테스트")
+    parser.add_argument("--users", type=int, default=10, help="동시 사용자 수")
+    parser.add_argument("--turns", type=int, default=5, help="사용자당 대화 횟수")
+    parser.add_argument("--recall-ratio", type=float, default=0.3, help="과거 기록을 묻는 질문 비율 (0~1)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="대화 사이 최대 대기 시간(초)")
+    parser.add_argument("--no-diary", dest="diary", action="store_false", help="day-diary 요청 생략")
+    parser.add_argument("--no-week", dest="week", action="store_false", help="week-status 요청 생략")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000", help="실제 서버 주소")
+    parser.add_argument("--in-process", action="store_true", help="서버 대신 Flask 테스트 클라이언트 사용")
+    parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="대화 날짜 (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=42, help="시나리오 재현용 시드")
+    parser.add_argument("--output", default=None, help="결과 JSON 경로 (기본값: benchmarks/<시각>_<커밋>.json)")
+    parser.add_argument("--compare", default=None, help="비교할 이전 결과 JSON 경로")
+    args = parser.parse_args()
+
+    transport = FlaskTransport() if args.in_process else HttpTransport(args.base_url)
+    recorder = Recorder()
+    base_date = datetime.strptime(args.date, "%Y-%m-%d")
+
+    logger.info(f"부하 테스트 시작: 사용자 {args.users}명, 사용자당 {args.turns}턴 ({'in-process' if args.in_process else args.base_url})")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        futures = [executor.submit(run_user, i, transport, recorder, args, base_date) for i in range(args.users)]
+        for future in futures:
+            future.result()
+    wall_seconds = time.perf_counter() - start
+
+    commit = git_commit()
+    result = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "target": "in-process" if args.in_process else args.base_url,
+            "model_id": os.getenv("HARUNI_MODEL_ID"),
+            "wall_seconds": round(wall_seconds, 3),
+            "args": vars(args)
+        },
+        **recorder.summary(wall_seconds)
+    }
+
+    output = args.output or os.path.join("benchmarks", f"{datetime.now():%Y%m%d_%H%M%S}_{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(json.dumps({"total": result["total"], "endpoints": result["endpoints"]}, ensure_ascii=False, indent=2))
+    print(f"결과 저장: {output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import hashlib
+import json
+import os
+import threading
+import logging
+
+import diskcache
+
+logger = logging.getLogger("CacheStore")
+
+# 영구 캐시 저장 디렉터리
+CACHE_DIR = os.getenv("HARUNI_CACHE_DIR", "cache")
+
+_caches = {}
+_lock = threading.Lock()
+
+
+def get_cache(name):
+    """
+    이름별 영구 캐시(diskcache.Cache)를 반환하는 함수
+
+    같은 이름으로 여러 번 호출해도 하나의 인스턴스를 공유한다.
+    diskcache 는 스레드/프로세스 간에 안전하게 사용할 수 있다.
+    """
+    with _lock:
+        if name not in _caches:
+            path = os.path.join(CACHE_DIR, name)
+            logger.info(f"캐시 열기: {path}")
+            _caches[name] = diskcache.Cache(path)
+        return _caches[name]
+
+
+def stable_hash(value):
+    """
+    JSON 으로 직렬화 가능한 값의 안정적인 sha256 해시를 반환하는 함수
+
+    딕셔너리 키 순서나 공백 차이와 관계없이 같은 값이면 같은 해시가 나온다.
+    """
+    serialized = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
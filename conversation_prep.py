@@ -0,0 +1,145 @@
+import os
+import re
+import logging
+from tokens import estimate_tokens, truncate_to_tokens
+
+logger = logging.getLogger("ConversationPrep")
+
+# 일기 요약(OpenAI) 호출 전에 클라이언트가 보낸 대화 내역을 줄이는 도구
+# - role 정규화, role/content 외 필드 제거
+# - 하루니(assistant) 응답은 이모지/꾸밈을 빼고 앞쪽 몇 문장만 남긴 짧은 요지로 줄임
+# - 연속으로 반복된 같은 메시지 제거
+# - 입력 토큰 예산을 넘으면 오래된 하루니 응답부터 뺌
+# 사용자가 직접 쓴 말은 줄이거나 빼지 않는다.
+
+# 하루니 응답 요지의 최대 길이 (추정 토큰 수, 0 이면 응답을 그대로 둠)
+DIARY_ASSISTANT_GIST_TOKENS = int(os.getenv("DIARY_ASSISTANT_GIST_TOKENS", "40"))
+
+# 한 번에 요약할 때(single) 대화 입력의 토큰 예산 (0 이면 제한 없음)
+DIARY_INPUT_TOKEN_BUDGET = int(os.getenv("DIARY_INPUT_TOKEN_BUDGET", "4000"))
+
+# 클라이언트가 보내는 role 이름을 OpenAI role 로 맞춤 (목록에 없으면 user)
+ROLE_ALIASES = {
+    "user": "user", "human": "user", "me": "user",
+    "assistant": "assistant", "ai": "assistant", "bot": "assistant", "haruni": "assistant", "model": "assistant"
+}
+
+# 이모지, 장식 기호, 반복 문장부호
+EMOJI_PATTERN = re.compile(
+    "[\U0001F000-\U0001FAFF\U00002600-\U000027BF\U0000FE0F\U0000200D\U00002B00-\U00002BFF]+")
+REPEAT_PATTERN = re.compile(r"([~!?.ㅋㅎㅠㅜ♡♥])\1{2,}")
+SENTENCE_END = re.compile(r"(?<=[.!?。])\s+|\n+")
+
+
+def _text(content):
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content or "")
+
+
+def normalize_role(role):
+    return ROLE_ALIASES.get(str(role or "").strip().lower(), "user")
+
+
+def assistant_gist(text, max_tokens=None):
+    """
+    하루니 응답을 짧은 요지로 줄이는 함수
+
+    이모지/반복 문장부호를 지우고, 앞에서부터 max_tokens 안에 들어가는 문장까지만 남긴다.
+    첫 문장부터 넘치면 첫 문장을 잘라서 쓴다.
+    """
+    max_tokens = DIARY_ASSISTANT_GIST_TOKENS if max_tokens is None else max_tokens
+    text = REPEAT_PATTERN.sub(r"\1", EMOJI_PATTERN.sub(" ", text))
+    sentences = [" ".join(part.split()) for part in SENTENCE_END.split(text)]
+    sentences = [sentence for sentence in sentences if sentence]
+    if not max_tokens or not sentences:
+        return " ".join(sentences)
+    kept = []
+    for sentence in sentences:
+        if estimate_tokens(" ".join(kept + [sentence])) > max_tokens:
+            break
+        kept.append(sentence)
+    return " ".join(kept) if kept else truncate_to_tokens(sentences[0], max_tokens)
+
+
+def preprocess_conversation(conversation, budget=None):
+    """
+    대화 내역을 일기 요약 입력용으로 줄이는 함수
+
+    메시지 단위로만 바꾸므로(예산 적용 제외) 대화 앞부분의 결과는 뒤에 메시지가 추가되어도 같다.
+    구간 요약 캐시(create_diary)가 이 성질에 기대므로, 구간을 나눌 때는 budget 없이 호출한다.
+
+    Args:
+        conversation (list): 클라이언트가 보낸 대화 내역
+        budget (int, optional): 입력 토큰 예산. 주면 결과에 apply_budget 을 적용한다
+
+    Returns:
+        tuple: (messages, stats)
+               stats = {"messages_in", "messages_out", "tokens_in", "tokens_out", "tokens_saved"}
+    """
+    messages = []
+    tokens_in = 0
+    count_in = 0
+    for message in conversation or []:
+        if not isinstance(message, dict):
+            continue
+        count_in += 1
+        raw = _text(message.get("content"))
+        tokens_in += estimate_tokens(raw)
+        role = normalize_role(message.get("role"))
+        text = assistant_gist(raw) if role == "assistant" else " ".join(raw.split())
+        if not text:
+            continue
+        if messages and messages[-1]["role"] == role and messages[-1]["content"] == text:
+            # 재전송 등으로 연속해서 반복된 메시지
+            continue
+        messages.append({"role": role, "content": text})
+
+    tokens_out = sum(estimate_tokens(m["content"]) for m in messages)
+    stats = {
+        "messages_in": count_in,
+        "messages_out": len(messages),
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_saved": max(0, tokens_in - tokens_out)
+    }
+    if budget:
+        return apply_budget(messages, stats, budget)
+    return messages, stats
+
+
+def apply_budget(messages, stats, budget):
+    """
+    전처리한 대화가 입력 토큰 예산을 넘으면 오래된 하루니 응답부터 빼는 함수 (사용자 메시지는 유지)
+
+    Args:
+        messages (list): preprocess_conversation 결과 메시지
+        stats (dict): preprocess_conversation 결과 통계
+        budget (int): 입력 토큰 예산 (0 이면 그대로 반환)
+
+    Returns:
+        tuple: (messages, stats) - stats 의 messages_out/tokens_out/tokens_saved 는 예산 적용 후 값
+    """
+    tokens_out = stats["tokens_out"]
+    if not budget or tokens_out <= budget:
+        return messages, stats
+
+    kept = []
+    dropped = 0
+    for message in messages:
+        if tokens_out > budget and message["role"] == "assistant":
+            tokens_out -= estimate_tokens(message["content"])
+            dropped += 1
+            continue
+        kept.append(message)
+    if tokens_out > budget:
+        logger.warning(f"사용자 메시지만으로 입력 예산 초과: {tokens_out}/{budget} 토큰")
+    logger.info(f"입력 예산 적용: 하루니 응답 {dropped}개 제외")
+
+    stats = {
+        **stats,
+        "messages_out": len(kept),
+        "tokens_out": tokens_out,
+        "tokens_saved": max(0, stats["tokens_in"] - tokens_out)
+    }
+    return kept, stats
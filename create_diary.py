@@ -2,34 +2,56 @@ import json
 import openai
 import os
 import re
+import threading
 import logging
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
-from datetime import datetime
-
-# 로깅 설정
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("haruni.log"),
-        logging.StreamHandler()
-    ]
-)
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from cache_store import get_cache, stable_hash
+from mood_classifier import get_classifier
+from mood_trend import parse_date, weekly_trend_stats
+from openai_client import ResilientOpenAI
+from replay import LLM_MODE, wrap_openai
+from metrics import timed, count_cache, count_fallback, count_parse_failure, record_conversation_prep
+from conversation_prep import preprocess_conversation, apply_budget, DIARY_INPUT_TOKEN_BUDGET
+from logging_setup import setup_logging, log_payload
+
 logger = logging.getLogger("haruni")
 
 # .env 파일 로드
 load_dotenv()
 logger.info("환경변수 로드 완료")
 
-# OpenAI API 키 설정
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    logger.error("API Key가 설정되지 않았습니다. .env 파일을 확인하세요.")
-    raise ValueError("API Key가 설정되지 않았습니다. .env 파일을 확인하세요. ")
-logger.info("OpenAI API 키 설정 완료")
-
-client = openai.OpenAI(api_key=api_key)
+if os.getenv("HARUNI_FAKE_OPENAI") == "1":
+    # 오프라인 실행/테스트용 로컬 대체 클라이언트
+    from fake_openai import FakeOpenAI
+    logger.info("HARUNI_FAKE_OPENAI 설정 - FakeOpenAI 클라이언트 사용")
+    client = FakeOpenAI(latency=float(os.getenv("HARUNI_FAKE_OPENAI_LATENCY", "0")))
+elif LLM_MODE == "replay":
+    # 기록된 응답만 재생하므로 실제 클라이언트가 필요 없음
+    logger.info("HARUNI_LLM_MODE=replay - 기록된 OpenAI 응답 사용")
+    client = None
+else:
+    # OpenAI API 키 설정
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logger.error("API Key가 설정되지 않았습니다. .env 파일을 확인하세요.")
+        raise ValueError("API Key가 설정되지 않았습니다. .env 파일을 확인하세요. ")
+    logger.info("OpenAI API 키 설정 완료")
+
+    # 재시도는 ResilientOpenAI 에서만 하도록 SDK 자체 재시도는 끔
+    client = ResilientOpenAI(
+        openai.OpenAI(api_key=api_key, max_retries=0),
+        chat_deadline=float(os.getenv("OPENAI_CHAT_DEADLINE", "60")),
+        image_deadline=float(os.getenv("OPENAI_IMAGE_DEADLINE", "120")),
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "4")),
+        hedge=os.getenv("OPENAI_HEDGE") == "1",
+        hedge_max_in_flight=int(os.getenv("OPENAI_HEDGE_MAX_IN_FLIGHT", "4"))
+    )
+
+# HARUNI_LLM_MODE 가 record/replay 이면 호출을 기록/재생 (replay.py)
+client = wrap_openai(client)
 
 app = Flask(__name__)
 logger.info("Flask 앱 초기화 완료")
@@ -50,19 +72,26 @@ def load_conversation_from_json(file_path):
         print(f" JSON 파일 로드 실패: {e} ")
         return None
 
-def summarize_conversation(conversation_history):
+# True 이면 감정 분류를 GPT 대신 로컬 분류기(mood_classifier)로 수행
+USE_LOCAL_MOOD = os.getenv("HARUNI_LOCAL_MOOD") == "1"
+
+
+def build_diary_prompt(include_sentiment=True):
     """
-    하루 동안의 대화를 2~4개의 간결한 문장으로 요약하고 감정을 분류하는 함수.
+    일기 요약용 GPT 시스템 프롬프트를 만드는 함수
 
-    반환값:
-    1. 기분 분류: happy(긍정적), normal(중립적), sad(부정적) 중 하나
-    2. 일기 형식 요약: 사용자에게 반환되는 일기 형식의 요약문
-    3. 일러스트레이션 요약: 출력될 DALL-E 이미지를 더 잘 묘사하기 위해 생성하는 요약문
+    include_sentiment 가 False 이면 SENTIMENT 항목을 빼서 프롬프트/출력 토큰을 줄인다.
     """
-    logger.info("대화 요약 및 감정 분석 시작")
-    prompt_for_gpt = """
+    sentiment_goal = " and classify the overall sentiment" if include_sentiment else ""
+    sentiment_section = """
+    3. SENTIMENT:  
+    Classify the overall sentiment of the conversation as either POSITIVE, NEUTRAL, or NEGATIVE based on the emotional tone, user satisfaction, and general mood of the interaction.
+""" if include_sentiment else ""
+    sentiment_format = "\n    SENTIMENT: <POSITIVE/NEUTRAL/NEGATIVE>" if include_sentiment else ""
+
+    return f"""
     The following is a record of my conversation with the AI chatbot, HARUNI.
-    Based on this conversation, generate two summaries and classify the overall sentiment:
+    Based on this conversation, generate two summaries{sentiment_goal}:
 
     1. DIARY_SUMMARY:  
     Write a personal diary entry in 2 to 4 sentences, as if I were writing it myself at the end of the day.  
@@ -76,23 +105,235 @@ def summarize_conversation(conversation_history):
     Describe the lighting, colors, textures, and emotional mood of that moment.  
     Use soft, poetic visual language that helps capture the mood (e.g., "a quiet room bathed in golden light," "sunlight pooling on a wooden desk," "a gentle breeze rustling the curtains").  
     This description will be used to create a dreamy, atmospheric illustration—so focus on what makes the moment visually and emotionally special.
-
-    3. SENTIMENT:  
-    Classify the overall sentiment of the conversation as either POSITIVE, NEUTRAL, or NEGATIVE based on the emotional tone, user satisfaction, and general mood of the interaction.
-
+{sentiment_section}
     Return your response in the following format exactly:
 
     DIARY_SUMMARY: <your diary summary here>  
-    ILLUSTRATION_SUMMARY: <your illustration summary here>  
-    SENTIMENT: <POSITIVE/NEUTRAL/NEGATIVE>
+    ILLUSTRATION_SUMMARY: <your illustration summary here>  {sentiment_format}
 
     The summaries must be written in Korean.
     """
 
-    messages = [{"role": "system", "content": prompt_for_gpt}] + conversation_history
-    logger.info(f"GPT 분석 요청: 대화 내역 {len(conversation_history)}개 메시지 처리")
 
+def _parse_diary_response(full_response, conversation_history, use_local_mood):
+    """
+    일기 요약 GPT 응답에서 (기분, 일기 요약, 일러스트레이션 요약)을 꺼내는 함수
+    """
+    diary_marker = "DIARY_SUMMARY:"
+    illust_marker = "ILLUSTRATION_SUMMARY:"
+    sentiment_marker = "SENTIMENT:"
+
+    diary_summary = ""
+    illustration_summary = ""
+    mood = "normal"
+
+    if diary_marker in full_response:
+        diary_start = full_response.find(diary_marker) + len(diary_marker)
+        diary_end = full_response.find(illust_marker) if illust_marker in full_response else len(full_response)
+        diary_summary = full_response[diary_start:diary_end].strip()
+        logger.info("일기 요약 추출 완료")
+
+    if illust_marker in full_response:
+        illust_start = full_response.find(illust_marker) + len(illust_marker)
+        illust_end = full_response.find(sentiment_marker) if sentiment_marker in full_response else len(full_response)
+        illustration_summary = full_response[illust_start:illust_end].strip()
+        logger.info("일러스트레이션 요약 추출 완료")
+
+    if use_local_mood:
+        mood, score = get_classifier().classify_day(conversation_history)
+        logger.info(f"로컬 감정 분석 결과: {mood} ({score:.2f})")
+    elif sentiment_marker in full_response:
+        sentiment_start = full_response.find(sentiment_marker) + len(sentiment_marker)
+        sentiment_text = full_response[sentiment_start:].strip().upper()
+
+        if "POSITIVE" in sentiment_text:
+            mood = "happy"
+        elif "NEGATIVE" in sentiment_text:
+            mood = "sad"
+        else:
+            mood = "normal"
+        logger.info(f"감정 분석 결과: {mood}")
+
+    if not diary_summary and not illustration_summary:
+        logger.warning("요약 추출 실패, 전체 응답을 일기 요약으로 사용")
+        count_parse_failure("summarize_conversation")
+        diary_summary = full_response.strip()
+
+    return mood, diary_summary, illustration_summary
+
+
+# 일기 요약 방식: single(대화 전체를 한 번에), chunked(구간별 요약 후 합치기), auto(긴 대화만 chunked)
+DIARY_SUMMARY_MODE = os.getenv("DIARY_SUMMARY_MODE", "auto")
+
+# auto 모드에서 chunked 로 바꾸는 대화 길이 (추정 토큰 수)
+DIARY_CHUNK_THRESHOLD_TOKENS = int(os.getenv("DIARY_CHUNK_THRESHOLD_TOKENS", "6000"))
+
+# 한 구간에 넣을 메시지 수
+# 구간 경계를 메시지 개수로 고정해야 대화가 늘어나도 앞 구간의 요약 캐시를 그대로 쓸 수 있다.
+DIARY_SEGMENT_MESSAGES = int(os.getenv("DIARY_SEGMENT_MESSAGES", "20"))
+
+# 구간 요약(map)에 쓸 모델. "local:<모델 ID>" 이면 llm.py 의 로컬 모델을 사용
+# 예) gpt-4o-mini, local:ollama-gemma3:4b-it-qat
+DIARY_MAP_MODEL = os.getenv("DIARY_MAP_MODEL", "gpt-4o-mini")
+
+# 구간 요약을 동시에 요청할 수
+DIARY_MAP_WORKERS = int(os.getenv("DIARY_MAP_WORKERS", "4"))
+
+# 구간 요약 캐시 보관 기간 (기본 2일, 하루치 대화를 다시 요약하는 동안만 필요)
+DIARY_SEGMENT_CACHE_TTL = int(os.getenv("DIARY_SEGMENT_CACHE_TTL", str(60 * 60 * 24 * 2)))
+
+SEGMENT_SUMMARY_PROMPT = """
+    The following is one part of my conversation with the AI chatbot, HARUNI, in time order.
+    Write short notes in Korean (at most 5 lines) that keep what I did, how I felt,
+    and any concrete visual details (place, time of day, weather, lighting, objects).
+    Write only from my point of view, skip greetings and small talk, and do not add anything that is not in the conversation.
+    """
+
+_map_executor = ThreadPoolExecutor(max_workers=DIARY_MAP_WORKERS, thread_name_prefix="diary-map")
+_local_map_model = None
+_local_map_lock = threading.Lock()
+
+
+def use_chunked_summary(prepared_tokens):
+    """DIARY_SUMMARY_MODE 와 전처리한 대화의 추정 토큰 수로 구간 요약 방식을 쓸지 정하는 함수"""
+    if DIARY_SUMMARY_MODE == "chunked":
+        return True
+    if DIARY_SUMMARY_MODE == "auto":
+        return prepared_tokens > DIARY_CHUNK_THRESHOLD_TOKENS
+    return False
+
+
+def split_segments(conversation, size=None):
+    """
+    전처리한 대화를 size 개씩 고정된 구간으로 나누는 함수
+
+    메시지가 추가되면 마지막 구간만 바뀌고 앞 구간은 그대로 유지된다.
+    """
+    size = max(1, size or DIARY_SEGMENT_MESSAGES)
+    return [conversation[i:i + size] for i in range(0, len(conversation), size)]
+
+
+def segment_cache_key(segment, model=None):
+    return f"segment:{stable_hash([model or DIARY_MAP_MODEL, segment])}"
+
+
+def _get_local_map_model(model_id):
+    global _local_map_model
+    with _local_map_lock:
+        if _local_map_model is None:
+            # torch 등 무거운 의존성은 로컬 모델을 쓸 때만 로드
+            from llm import llm
+            _local_map_model = llm(model_id)
+        return _local_map_model
+
+
+def _format_segment(segment):
+    speakers = {"user": "나", "assistant": "하루니"}
+    return "\n".join(f"{speakers.get(m['role'], m['role'])}: {m['content']}" for m in segment)
+
+
+@timed("summarize_segment")
+def summarize_segment(segment, model=None):
+    """
+    대화 한 구간을 짧은 메모로 요약하는 함수 (map 단계)
+
+    반환값:
+    - notes: 구간 요약 메모 (실패 시 None)
+    """
+    model = model or DIARY_MAP_MODEL
+    text = _format_segment(segment)
     try:
+        if model.startswith("local:"):
+            notes, _ = _get_local_map_model(model[len("local:"):]).get_response_from_llm(SEGMENT_SUMMARY_PROMPT, text)
+        else:
+            response = client.chat.completions.create(
+                model=model,
+                messages=[{"role": "system", "content": SEGMENT_SUMMARY_PROMPT}, {"role": "user", "content": text}],
+                temperature=0.3,
+                max_tokens=200
+            )
+            notes = response.choices[0].message.content
+        return notes.strip() or None
+    except Exception as e:
+        logger.error(f"구간 요약 실패: {e}")
+        count_fallback("summarize_segment")
+        return None
+
+
+def summarize_segments_cached(segments, model=None):
+    """
+    구간별 요약을 병렬로 만들고, 이미 요약한 구간은 캐시에서 가져오는 함수
+
+    요약에 실패한 구간은 캐시하지 않고 None 으로 돌려준다.
+    """
+    cache = get_cache("diary_segments")
+    keys = [segment_cache_key(segment, model) for segment in segments]
+    notes = [cache.get(key) for key in keys]
+    for note in notes:
+        count_cache("diary_segment", note is not None)
+
+    missing = [i for i, note in enumerate(notes) if note is None]
+    if missing:
+        logger.info(f"구간 요약 요청: {len(missing)}/{len(segments)}개 구간")
+        futures = {i: _map_executor.submit(summarize_segment, segments[i], model) for i in missing}
+        for i, future in futures.items():
+            notes[i] = future.result()
+            if notes[i]:
+                cache.set(keys[i], notes[i], expire=DIARY_SEGMENT_CACHE_TTL)
+    return notes
+
+
+def conversation_segments(conversation):
+    """대화를 전처리(예산 없이)한 뒤 구간으로 나누는 함수 (diary_draft 도 같은 구간을 사용)"""
+    prepared, _ = preprocess_conversation(conversation)
+    return split_segments(prepared)
+
+
+def _chunked_messages(prepared):
+    """구간 요약 메모를 모아 reduce 단계의 사용자 메시지를 만드는 함수 (실패한 구간은 원문 사용)"""
+    segments = split_segments(prepared)
+    notes = summarize_segments_cached(segments)
+    parts = []
+    for i, (segment, note) in enumerate(zip(segments, notes), 1):
+        parts.append(f"[{i}] {note or _format_segment(segment)}")
+    content = ("Below are notes on my conversation with HARUNI, split into parts in time order.\n\n"
+               + "\n\n".join(parts))
+    return [{"role": "user", "content": content}]
+
+
+@timed("summarize_conversation")
+def summarize_conversation(conversation_history, use_local_mood=None, chunked=None):
+    """
+    하루 동안의 대화를 2~4개의 간결한 문장으로 요약하고 감정을 분류하는 함수.
+    use_local_mood 가 True 이면(기본값은 HARUNI_LOCAL_MOOD) 감정은 로컬 분류기로 계산한다.
+    chunked 가 True 이면(기본값은 DIARY_SUMMARY_MODE 에 따름) 대화를 구간별로 먼저 요약한 뒤 합친다.
+
+    반환값:
+    1. 기분 분류: happy(긍정적), normal(중립적), sad(부정적) 중 하나
+    2. 일기 형식 요약: 사용자에게 반환되는 일기 형식의 요약문
+    3. 일러스트레이션 요약: 출력될 DALL-E 이미지를 더 잘 묘사하기 위해 생성하는 요약문
+    """
+    logger.info("대화 요약 및 감정 분석 시작")
+    if use_local_mood is None:
+        use_local_mood = USE_LOCAL_MOOD
+    prompt_for_gpt = build_diary_prompt(include_sentiment=not use_local_mood)
+
+    try:
+        # 인사/꾸밈이 많은 하루니 응답과 메타데이터를 줄인 입력 (사용자 메시지는 그대로)
+        prepared, stats = preprocess_conversation(conversation_history)
+        if chunked is None:
+            chunked = use_chunked_summary(stats["tokens_out"])
+        if chunked:
+            logger.info(f"구간 요약 방식 사용: 대화 내역 {len(prepared)}개 메시지")
+            messages = [{"role": "system", "content": prompt_for_gpt}] + _chunked_messages(prepared)
+        else:
+            prepared, stats = apply_budget(prepared, stats, DIARY_INPUT_TOKEN_BUDGET)
+            messages = [{"role": "system", "content": prompt_for_gpt}] + prepared
+        record_conversation_prep(stats)
+        logger.info(f"대화 전처리: 메시지 {stats['messages_in']}개 -> {stats['messages_out']}개, "
+                    f"토큰 {stats['tokens_in']} -> {stats['tokens_out']} ({stats['tokens_saved']} 절약)")
+        logger.info(f"GPT 분석 요청: 대화 내역 {len(conversation_history)}개 메시지 처리")
+
         logger.info("GPT API 호출 시작")
         response = client.chat.completions.create(
             model="gpt-4o",
@@ -102,56 +343,26 @@ def summarize_conversation(conversation_history):
         )
         logger.info("GPT API 호출 완료")
         full_response = response.choices[0].message.content
-        logger.debug(f"GPT 응답 전문: {full_response}")
-
-        diary_marker = "DIARY_SUMMARY:"
-        illust_marker = "ILLUSTRATION_SUMMARY:"
-        sentiment_marker = "SENTIMENT:"
-
-        diary_summary = ""
-        illustration_summary = ""
-        mood = "normal"
-
-        if diary_marker in full_response:
-            diary_start = full_response.find(diary_marker) + len(diary_marker)
-            diary_end = full_response.find(illust_marker) if illust_marker in full_response else len(full_response)
-            diary_summary = full_response[diary_start:diary_end].strip()
-            logger.info("일기 요약 추출 완료")
-
-        if illust_marker in full_response:
-            illust_start = full_response.find(illust_marker) + len(illust_marker)
-            illust_end = full_response.find(sentiment_marker) if sentiment_marker in full_response else len(full_response)
-            illustration_summary = full_response[illust_start:illust_end].strip()
-            logger.info("일러스트레이션 요약 추출 완료")
-
-        if sentiment_marker in full_response:
-            sentiment_start = full_response.find(sentiment_marker) + len(sentiment_marker)
-            sentiment_text = full_response[sentiment_start:].strip().upper()
-
-            if "POSITIVE" in sentiment_text:
-                mood = "happy"
-            elif "NEGATIVE" in sentiment_text:
-                mood = "sad"
-            else:
-                mood = "normal"
-            logger.info(f"감정 분석 결과: {mood}")
-
-        if not diary_summary and not illustration_summary:
-            logger.warning("요약 추출 실패, 전체 응답을 일기 요약으로 사용")
-            diary_summary = full_response.strip()
+        log_payload(logger, "GPT 응답 전문", full_response, logging.DEBUG)
+
+        mood, diary_summary, illustration_summary = _parse_diary_response(
+            full_response, conversation_history, use_local_mood)
 
         logger.info("대화 요약 및 감정 분석 완료")
         return mood, diary_summary, illustration_summary
 
     except Exception as e:
         logger.error(f"GPT 요약 생성 실패: {e}")
+        count_fallback("summarize_conversation")
         print(f"GPT 요약 생성 실패: {e} ")
         return "normal", None, None
 
 
-def analyze_weekly_sentiment_separated(weekly_data):
+@timed("analyze_weekly")
+def analyze_weekly_sentiment_separated(weekly_data, trend_stats=None):
     """
     일주일간의 감정 분류와 일기 내용을 분석하여 4가지 피드백 항목으로 나누어 제공하는 함수
+    trend_stats 가 주어지면 장기 기분 추세 통계를 프롬프트에 함께 넣는다.
 
     반환값:
     - week_feedback: 전반적인 따뜻한 피드백
@@ -170,6 +381,9 @@ def analyze_weekly_sentiment_separated(weekly_data):
         sentiment = day_data.get("sentiment", "기록 없음")
         diary = day_data.get("diary", "기록 없음")
         formatted_data += f"Date: {date}\nSentiment: {sentiment}\nDiary Entry: {diary}\n\n"
+
+    if trend_stats:
+        formatted_data += f"최근 기분 추세 통계:\n{trend_stats}\n\n"
     
     logger.info(f"주간 분석 대상: {len(weekly_data)}일치 데이터")
 
@@ -239,7 +453,7 @@ Offer 3 small emotional comforts for the user, based on how they felt this week.
         )
         logger.info("주간 분석 GPT API 호출 완료")
         output = response.choices[0].message.content
-        logger.debug(f"GPT 주간 분석 응답 전문: {output}")
+        log_payload(logger, "GPT 주간 분석 응답 전문", output, logging.DEBUG)
 
         def extract_section(text, marker):
             import re
@@ -256,12 +470,227 @@ Offer 3 small emotional comforts for the user, based on how they felt this week.
 
     except Exception as e:
         logger.error(f"주간 분석 생성 실패: {e}")
+        count_fallback("analyze_weekly")
         print(f" 주간 분석 생성 실패: {e}")
         return "오류 발생", "", "", ""
 
 
 
+# 주간 분석 결과 캐시 유지 시간 (초)
+WEEKLY_CACHE_TTL = int(os.getenv("WEEKLY_CACHE_TTL", str(60 * 60 * 24 * 7)))
+
+# 주간 분석 사전 계산용 백그라운드 실행기
+_weekly_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weekly-precompute")
+_weekly_in_flight = set()
+_weekly_lock = threading.Lock()
+
+
+def normalize_weekly_data(weekly_data):
+    """
+    주간 데이터를 캐시 키 계산에 쓸 수 있도록 정규화하는 함수
+
+    날짜/감정/일기 외의 필드는 버리고, 공백을 정리한 뒤 날짜순으로 정렬한다.
+    """
+    normalized = []
+    for i, day_data in enumerate(weekly_data or []):
+        normalized.append({
+            "date": str(day_data.get("date") or f"Day {i+1}").strip(),
+            "sentiment": str(day_data.get("sentiment") or "기록 없음").strip(),
+            "diary": " ".join(str(day_data.get("diary") or "기록 없음").split())
+        })
+    normalized.sort(key=lambda day: day["date"])
+    return normalized
+
+
+def weekly_cache_key(weekly_data, trend_stats=None):
+    normalized = normalize_weekly_data(weekly_data)
+    if trend_stats:
+        return f"weekly:{stable_hash([normalized, trend_stats])}"
+    return f"weekly:{stable_hash(normalized)}"
+
+
+def analyze_weekly_sentiment_cached(weekly_data, refresh=False, trend_stats=None):
+    """
+    analyze_weekly_sentiment_separated 결과를 주간 데이터 해시 기준으로 캐시하는 함수
+
+    같은 주간 데이터로 다시 요청하면 GPT 호출 없이 캐시된 결과를 반환한다.
+    분석에 실패한 결과는 캐시하지 않는다.
+
+    Args:
+        weekly_data (list): 주간 데이터
+        refresh (bool): True 이면 캐시를 무시하고 다시 분석
+        trend_stats (str, optional): 프롬프트에 넣을 기분 추세 통계 (캐시 키에도 포함)
+
+    Returns:
+        tuple: (week_feedback, week_summary, suggestions, recommendation)
+    """
+    normalized = normalize_weekly_data(weekly_data)
+    if not normalized:
+        return analyze_weekly_sentiment_separated(normalized)
+
+    cache = get_cache("weekly")
+    key = weekly_cache_key(normalized, trend_stats)
+    if not refresh:
+        cached = cache.get(key)
+        count_cache("weekly", cached is not None)
+        if cached is not None:
+            logger.info(f"주간 분석 캐시 적중: {key[:19]}")
+            return tuple(cached)
+
+    result = analyze_weekly_sentiment_separated(normalized, trend_stats)
+    if result[1]:
+        cache.set(key, list(result), expire=WEEKLY_CACHE_TTL)
+        logger.info(f"주간 분석 결과 캐시 저장: {key[:19]}")
+    return result
+
+
+def precompute_weekly_analysis(weekly_data, trend_stats=None):
+    """
+    주간 분석을 백그라운드에서 미리 계산해 캐시에 넣어두는 함수
+
+    한 주의 마지막 일기가 작성된 직후 호출하면 이후 주간 분석 요청이 캐시에서 바로 반환된다.
+    이미 캐시에 있거나 계산 중인 주간 데이터는 다시 계산하지 않는다.
+    trend_stats 는 week-status 요청이 넣을 추세 통계와 같아야 캐시 키가 맞는다.
+
+    반환값:
+    - key: 주간 데이터 캐시 키
+    """
+    key = weekly_cache_key(weekly_data, trend_stats)
+    with _weekly_lock:
+        if key in get_cache("weekly") or key in _weekly_in_flight:
+            logger.info(f"주간 분석 사전 계산 생략 (캐시/진행 중): {key[:19]}")
+            return key
+        _weekly_in_flight.add(key)
+
+    def _run():
+        try:
+            analyze_weekly_sentiment_cached(weekly_data, trend_stats=trend_stats)
+        except Exception as e:
+            logger.error(f"주간 분석 사전 계산 실패: {e}")
+        finally:
+            with _weekly_lock:
+                _weekly_in_flight.discard(key)
+
+    _weekly_executor.submit(_run)
+    logger.info(f"주간 분석 사전 계산 예약: {key[:19]}")
+    return key
+
 
+# 한 주의 마지막 요일 (0=월 ... 6=일), 이 요일의 일기가 저장되면 주간 분석을 미리 계산
+WEEK_END_WEEKDAY = int(os.getenv("WEEKLY_PRECOMPUTE_WEEKDAY", "6"))
+
+
+def record_week_entry(user_id, date, mood, diary, mood_store=None):
+    """
+    사용자의 하루 일기를 주간 데이터로 기록하고, 한 주의 마지막 날이면 주간 분석을 미리 계산하는 함수
+
+    주간 데이터 항목은 week-status 의 weekly_data 와 같은 형식({"date", "sentiment", "diary"})이며
+    sentiment 에는 일일 일기의 mood 를 넣는다.
+
+    반환값:
+    - key: 사전 계산을 예약했으면 주간 캐시 키, 아니면 None
+    """
+    date = parse_date(date)
+    if not user_id or not date or not diary:
+        return None
+    cache = get_cache("week_entries")
+    entries_key = f"entries:{user_id}"
+    day = datetime.strptime(date, "%Y-%m-%d")
+    # 지난 2주 이내 기록만 유지
+    entries = {d: e for d, e in (cache.get(entries_key) or {}).items()
+               if 0 <= (day - datetime.strptime(d, "%Y-%m-%d")).days < 14}
+    entries[date] = {"date": date, "sentiment": mood, "diary": diary}
+    cache.set(entries_key, entries, expire=WEEKLY_CACHE_TTL * 2)
+
+    if day.weekday() != WEEK_END_WEEKDAY:
+        return None
+    week = [(day - timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(6, -1, -1)]
+    weekly_data = [entries[d] for d in week if d in entries]
+    trend_stats = weekly_trend_stats(mood_store, user_id, weekly_data) if mood_store is not None else None
+    return precompute_weekly_analysis(weekly_data, trend_stats)
+
+
+# 일일 일기 결과 캐시 보관 기간 (기본 30일)
+DAY_DIARY_CACHE_TTL = int(os.getenv("DAY_DIARY_CACHE_TTL", str(60 * 60 * 24 * 30)))
+
+
+def _message_text(content):
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content or "")
+
+
+def normalize_conversation(conversation):
+    """
+    대화 내역을 캐시 키 계산에 쓸 수 있도록 정규화하는 함수
+
+    role/content 외의 필드는 버리고, 공백을 정리하고, 내용이 없는 메시지는 뺀다.
+    """
+    normalized = []
+    for message in conversation or []:
+        if not isinstance(message, dict):
+            continue
+        text = " ".join(_message_text(message.get("content")).split())
+        if text:
+            normalized.append({"role": str(message.get("role") or "user"), "content": text})
+    return normalized
+
+
+def day_diary_cache_key(conversation, use_local_mood=None):
+    if use_local_mood is None:
+        use_local_mood = USE_LOCAL_MOOD
+    return f"day:{stable_hash([normalize_conversation(conversation), use_local_mood])}"
+
+
+def create_day_diary_cached(conversation, image_store, regenerate=False, chunked=None):
+    """
+    일일 일기(요약 + 이미지)를 대화 내역 해시 기준으로 캐시하는 함수
+
+    - 같은 대화로 다시 요청하면 GPT/DALL·E 호출 없이 저장된 일기와 이미지를 반환 (hit)
+    - 이전에 이미지 생성만 실패했으면 일기 글은 재사용하고 이미지만 다시 생성 (partial)
+    - 요약에 실패한 결과는 캐시하지 않음
+
+    Args:
+        conversation (list): 대화 내역
+        image_store (ImageStore): 생성된 이미지를 저장할 저장소
+        regenerate (bool): True 이면 캐시를 무시하고 다시 생성
+        chunked (bool, optional): 구간 요약 방식 사용 여부 (기본값은 DIARY_SUMMARY_MODE 에 따름)
+
+    Returns:
+        dict: {"mood", "diary", "illustration", "image_digest", "image_url", "cache"}
+              image_url 은 이미지 저장에 실패했을 때만 원본 URL, cache 는 "hit" | "partial" | "miss"
+    """
+    cache = get_cache("day_diary")
+    key = day_diary_cache_key(conversation)
+    cached = None if regenerate else cache.get(key)
+    count_cache("day_diary", cached is not None)
+
+    if cached is not None and cached.get("image_digest") and image_store.exists(cached["image_digest"]):
+        logger.info(f"일일 일기 캐시 적중: {key[:16]}")
+        return {**cached, "image_url": None, "cache": "hit"}
+
+    if cached is not None:
+        logger.info(f"일일 일기 글 재사용, 이미지만 다시 생성: {key[:16]}")
+        result = {**cached, "image_digest": None, "cache": "partial"}
+    else:
+        mood, diary, illustration = summarize_conversation(conversation, chunked=chunked)
+        result = {"mood": mood, "diary": diary, "illustration": illustration, "image_digest": None, "cache": "miss"}
+
+    image_url = create_daily_diary_image(result["illustration"]) if result["diary"] else None
+    if image_url:
+        try:
+            result["image_digest"] = image_store.store_url(image_url)
+        except Exception as e:
+            # 저장 실패 시 원본 URL 그대로 반환하고, 다음 요청에서 이미지만 다시 생성
+            logger.error(f"일기 이미지 저장 실패: {str(e)}", exc_info=True)
+    result["image_url"] = None if result["image_digest"] else image_url
+
+    if result["diary"]:
+        cache.set(key, {k: result[k] for k in ("mood", "diary", "illustration", "image_digest")}, expire=DAY_DIARY_CACHE_TTL)
+    return result
+
+
+@timed("create_diary_image")
 def create_daily_diary_image(illustration_summary):
     """
     사용자의 하루 중 가장 중요한 순간을 반영하여, 배경과 상황을 묘사하는 DALL·E 이미지 생성
@@ -296,7 +725,7 @@ def create_daily_diary_image(illustration_summary):
     Illustrate the moment described above in a visually compelling way.
     """
     
-    logger.debug(f"DALL-E 프롬프트: {prompt_for_dalle}")
+    log_payload(logger, "DALL-E 프롬프트", prompt_for_dalle, logging.DEBUG)
     image_url = None
     
     try:
@@ -312,6 +741,7 @@ def create_daily_diary_image(illustration_summary):
         logger.debug(f"생성된 이미지 URL: {image_url}")
     except Exception as e:
         logger.error(f"DALL-E 이미지 생성 실패: {e}")
+        count_fallback("create_diary_image")
         print(f"DALL·E 이미지 생성 실패: {e}")
     
     logger.info("이미지 생성 완료")
@@ -398,5 +828,6 @@ def today():
 # -------------------------------------- Flask Routes -------------------------------------- #
 
 if __name__ == '__main__':
+    setup_logging()
     logger.info("하루니 서버 시작")
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,23 +1,30 @@
 import json
+import os
+import threading
 import torch
 import mysql.connector
-from mysql.connector import Error
+from contextlib import contextmanager
+from mysql.connector import Error, pooling
 from typing import Dict, List, Optional
 from llm import llm, extract_json_between_markers
+from metrics import timed, count_cache, count_fallback, count_parse_failure
+from result_compaction import fetch_bounded, compact_results, format_context
+from sql_guard import SQLGuard, SQLGuardError
+from schema_catalog import load_catalog, select_tables, render_compact
 import re
 import logging
+from logging_setup import setup_logging
 
-# 로깅 설정
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("haruni.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("DBAgent")
 
+# 요청 스레드들이 나눠 쓸 DB 연결 수 (mysql-connector 풀 최대값은 32)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+# 쿼리 결과 전달 방식
+# - direct: 결과를 날짜별 텍스트 블록으로 바로 만들어 응답 생성에 전달 (analyze_results LLM 호출 생략)
+# - analyze: analyze_results 로 결과를 한 번 더 분석한 JSON 을 전달 (기존 방식)
+DB_RESULT_MODE = os.getenv("DB_RESULT_MODE", "direct")
+
 SQL_KEYWORDS = (
     "SELECT|INSERT|UPDATE|DELETE|CREATE|ALTER|DROP|WITH"
 )
@@ -34,120 +41,93 @@ class DBAgent:
         """데이터베이스 에이전트 초기화"""
         logger.info("DBAgent 초기화")
         self.connection_params = connection_params
-        self.connection = None
-        self.cursor = None
+        self.pool = None
+        self._pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+        self.sql_guard = SQLGuard()
         self.connect_to_database()
         self.model = model
         self.system_msg = "당신은 데이터베이스 전문가 AI 어시스턴트입니다. 사용자의 질문에 대한 정확한 SQL 쿼리를 생성하고, 결과를 분석하여 답변해주세요."
+        # 스키마는 시작할 때 한 번 읽고, 테이블 조합별로 렌더링 결과를 캐시함
+        self.catalog = {}
+        self._schema_cache = {}
+        self._schema_lock = threading.Lock()
         self.schema = self.get_schema()
         self.user_id = user_id
 
     def connect_to_database(self):
-        """데이터베이스에 연결"""
+        """
+        읽기 전용 데이터베이스 연결 풀 생성
+
+        DBAgent 는 조회만 하므로 DB_READONLY_USER 가 있으면 그 계정으로 접속하고,
+        모든 연결을 READ ONLY 트랜잭션 세션으로 연다.
+        """
+        params = dict(self.connection_params)
+        if os.getenv("DB_READONLY_USER"):
+            params["user"] = os.getenv("DB_READONLY_USER")
+            params["password"] = os.getenv("DB_READONLY_PASSWORD", "")
         try:
-            self.connection = mysql.connector.connect(**self.connection_params)
-            
-            if self.connection.is_connected():
-                self.cursor = self.connection.cursor(dictionary=True)
-                logger.info("MySQL 데이터베이스 연결 성공")
+            # 연결/커서는 스레드 간에 공유할 수 없으므로 요청마다 풀에서 빌려 씀
+            # consume_results: 한도에서 읽기를 멈춘 나머지 행은 커서를 닫을 때 버림
+            # pool_reset_session=False: 연결을 반납할 때 세션이 초기화되어 READ ONLY 설정이 풀리지 않도록 함
+            self.pool = pooling.MySQLConnectionPool(
+                pool_name="haruni", pool_size=DB_POOL_SIZE, pool_reset_session=False, consume_results=True,
+                init_command="SET SESSION TRANSACTION READ ONLY", **params
+            )
+            logger.info(f"MySQL 데이터베이스 연결 풀 생성 성공 (크기 {DB_POOL_SIZE})")
                 
         except Error as e:
             logger.error(f"데이터베이스 연결 오류: {e}")
 
-    def get_schema(self) -> str:
-        """information_schema를 활용한 데이터베이스 스키마 정보 가져오기"""
-        try:
-            # 테이블 목록 및 기본 정보 가져오기
-            self.cursor.execute("""
-                SELECT 
-                    t.TABLE_NAME, 
-                    t.TABLE_COMMENT,
-                    t.TABLE_ROWS,
-                    t.CREATE_TIME 
-                FROM 
-                    information_schema.TABLES t 
-                WHERE 
-                    t.TABLE_SCHEMA = %s
-                ORDER BY 
-                    t.TABLE_NAME
-            """, (self.connection_params['database'],))
-            
-            tables = self.cursor.fetchall()
-            schema_info = []
-            
-            for table in tables:
-                table_name = table['TABLE_NAME']
-                
-                # 각 테이블의 컬럼 정보 가져오기
-                self.cursor.execute("""
-                    SELECT 
-                        c.COLUMN_NAME,
-                        c.COLUMN_TYPE,
-                        c.IS_NULLABLE,
-                        c.COLUMN_KEY,
-                        c.COLUMN_DEFAULT,
-                        c.EXTRA,
-                        c.COLUMN_COMMENT
-                    FROM 
-                        information_schema.COLUMNS c
-                    WHERE 
-                        c.TABLE_SCHEMA = %s AND
-                        c.TABLE_NAME = %s
-                    ORDER BY 
-                        c.ORDINAL_POSITION
-                """, (self.connection_params['database'], table_name))
-                
-                columns = self.cursor.fetchall()
-                
-                # 외래 키 정보 가져오기 (있는 경우)
-                self.cursor.execute("""
-                    SELECT
-                        k.COLUMN_NAME,
-                        k.REFERENCED_TABLE_NAME,
-                        k.REFERENCED_COLUMN_NAME
-                    FROM
-                        information_schema.KEY_COLUMN_USAGE k
-                    WHERE
-                        k.TABLE_SCHEMA = %s AND
-                        k.TABLE_NAME = %s AND
-                        k.REFERENCED_TABLE_NAME IS NOT NULL
-                """, (self.connection_params['database'], table_name))
-                
-                foreign_keys = self.cursor.fetchall()
-                
-                # 테이블 정보 구성
-                table_info = [f"Table: {table_name}"]
-                if table['TABLE_COMMENT']:
-                    table_info.append(f"Description: {table['TABLE_COMMENT']}")
-                
-                # 컬럼 정보 추가
-                table_info.append("Columns:")
-                for col in columns:
-                    col_info = f"  - {col['COLUMN_NAME']} ({col['COLUMN_TYPE']})"
-                    if col['COLUMN_KEY'] == 'PRI':
-                        col_info += " [PRIMARY KEY]"
-                    if col['IS_NULLABLE'] == 'NO':
-                        col_info += " [NOT NULL]"
-                    if col['COLUMN_DEFAULT'] is not None:
-                        col_info += f" [DEFAULT: {col['COLUMN_DEFAULT']}]"
-                    if col['COLUMN_COMMENT']:
-                        col_info += f" - {col['COLUMN_COMMENT']}"
-                    table_info.append(col_info)
-                
-                # 외래 키 정보 추가
-                if foreign_keys:
-                    table_info.append("Foreign Keys:")
-                    for fk in foreign_keys:
-                        table_info.append(f"  - {fk['COLUMN_NAME']} -> {fk['REFERENCED_TABLE_NAME']}.{fk['REFERENCED_COLUMN_NAME']}")
-                
-                schema_info.append("\n".join(table_info))
-            
-            return "\n\n".join(schema_info)
+    @contextmanager
+    def cursor(self):
+        """풀에서 연결을 빌려 dictionary 커서를 제공하는 컨텍스트 매니저"""
+        # 풀이 비어 있으면 get_connection 이 바로 실패하므로 빈 연결이 생길 때까지 기다림
+        with self._pool_slots:
+            connection = self.pool.get_connection()
+            cursor = connection.cursor(dictionary=True)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+                connection.close()
 
+    def refresh_schema(self):
+        """information_schema 에서 스키마 정보를 다시 읽고 렌더링 캐시를 비우는 메서드"""
+        if self.pool is None:
+            logger.warning("데이터베이스 연결 없음 - 스키마 정보 생략")
+            return
+        try:
+            with self.cursor() as cursor:
+                catalog = load_catalog(cursor, self.connection_params['database'])
         except Error as e:
             logger.error(f"스키마 정보 가져오기 오류: {e}")
-            return "스키마 정보를 가져올 수 없습니다."
-        
+            return
+        with self._schema_lock:
+            self.catalog = catalog
+            self._schema_cache.clear()
+
+    def get_schema(self, tables: Optional[List[str]] = None) -> str:
+        """
+        프롬프트용 스키마 문자열을 반환하는 메서드
+
+        Args:
+            tables (list, optional): check_db_relevance 의 possible_tables.
+                지정하면 해당 테이블과 외래 키로 연결된 테이블만 넣고, 없으면 모든 테이블을 넣는다.
+        """
+        if not self.catalog:
+            self.refresh_schema()
+            if not self.catalog:
+                return "스키마 정보를 가져올 수 없습니다."
+        selected = select_tables(self.catalog, tables)
+        with self._schema_lock:
+            schema = self._schema_cache.get(selected)
+        count_cache("schema", schema is not None)
+        if schema is None:
+            schema = render_compact(self.catalog, selected)
+            with self._schema_lock:
+                self._schema_cache[selected] = schema
+        return schema
+
     def get_user_id(self) -> str:
         """사용자 ID 가져오기"""
         return self.user_id
@@ -156,16 +136,44 @@ class DBAgent:
         """사용자 ID 설정"""
         self.user_id = user_id
     
-    def run_query(self, query: str) -> str:
-        """SQL 쿼리 실행"""
+    @timed("run_query")
+    def fetch_rows(self, query: str):
+        """
+        SQL 쿼리를 실행하고 결과 행을 읽는 메서드
+
+        쿼리는 SQLGuard 검사(SELECT 만 허용, LIMIT/실행 시간 제한, EXPLAIN 비용 확인)를 거쳐 실행하고,
+        결과는 fetchmany 로 행/바이트 한도까지만 읽는다.
+
+        반환값:
+        - rows: 결과 행 목록 (오류 시 빈 리스트)
+        - truncated: 한도 때문에 읽기를 멈췄으면 True
+        - error: 실행하지 못한 이유 (성공 시 None)
+        """
+        if self.pool is None:
+            return [], False, "쿼리 실행 오류: 데이터베이스 연결 없음"
         try:
-            self.cursor.execute(query)
-            results = self.cursor.fetchall()
-            return json.dumps(results, ensure_ascii=False, default=str)
+            with self.cursor() as cursor:
+                self.sql_guard.execute(cursor, query)
+                rows, truncated = fetch_bounded(cursor)
+            return rows, truncated, None
+        except SQLGuardError as e:
+            return [], False, f"쿼리 실행 거부: {e}"
         except Error as e:
             logger.error(f"쿼리 실행 오류: {e}")
-            return f"쿼리 실행 오류: {e}"
+            return [], False, f"쿼리 실행 오류: {e}"
+
+    def run_query(self, query: str) -> str:
+        """
+        SQL 쿼리 실행
+
+        결과를 프롬프트에 넣을 수 있도록 토큰 예산 안으로 압축한 JSON 문자열로 반환한다.
+        """
+        rows, truncated, error = self.fetch_rows(query)
+        if error:
+            return error
+        return compact_results(rows, truncated)
     
+    @timed("check_db_relevance")
     def check_db_relevance(self, question: str) -> Dict:
         """질문이 DB 참조가 필요한지 판단"""
         schema = self.get_schema()
@@ -196,15 +204,23 @@ class DBAgent:
             return response_json
         else:
             logger.warning("DB 관련성 분석 결과 파싱 실패")
+            count_parse_failure("check_db_relevance")
             return {
                 "needs_db": False,
                 "explanation": "응답 형식 오류로 판단 불가",
                 "possible_tables": []
             }
     
-    def generate_sql_query(self, question: str, sendingDate, sendingTime) -> str:
-        """SQL 쿼리 생성"""
-        schema = self.get_schema()
+    @timed("generate_sql_query")
+    def generate_sql_query(self, question: str, sendingDate, sendingTime, user_id=None, tables=None) -> str:
+        """
+        SQL 쿼리 생성 (user_id 를 생략하면 set_user_id 로 설정한 값 사용)
+
+        tables 를 넘기면 스키마에 해당 테이블(과 외래 키로 연결된 테이블)만 넣는다.
+        """
+        if user_id is None:
+            user_id = self.user_id
+        schema = self.get_schema(tables)
         prompt = f"""
         다음 데이터베이스 스키마와 사용자 질문을 바탕으로 적절한 MySQL의 쿼리를 생성하세요.
         
@@ -220,7 +236,7 @@ class DBAgent:
         6. 날짜와 시간을 조회하는 SQL 쿼리는 함수를 이용하지 말고, 직접 형식을 맞춰서 조회해야 합니다.
 
         user_id: 
-        {self.user_id}
+        {user_id}
 
         sendingDate: {sendingDate}
         sendingTime: {sendingTime}
@@ -240,11 +256,13 @@ class DBAgent:
             return response[0]
         else:
             logger.warning("유효한 SQL 쿼리를 생성하지 못함")
+            count_parse_failure("generate_sql_query")
             return ""
     
-    def analyze_results(self, question: str, query: str, results: str) -> str:
+    @timed("analyze_results")
+    def analyze_results(self, question: str, query: str, results: str, tables=None) -> str:
         """쿼리 결과 분석 및 응답 생성"""
-        schema = self.get_schema()
+        schema = self.get_schema(tables)
         prompt = f"""
         데이터베이스에서 조회한 결과를 바탕으로 분석 결과를 JSON 형식으로 제공하세요.
         
@@ -278,6 +296,7 @@ class DBAgent:
         
         if not result_json:
             logger.warning("쿼리 결과 분석 실패 - JSON 파싱 오류")
+            count_parse_failure("analyze_results")
             # JSON 파싱 실패 시 기본 JSON 응답
             result_json = {
                 "is_sufficient": False,
@@ -288,12 +307,20 @@ class DBAgent:
             
         return json.dumps(result_json, ensure_ascii=False)
     
-    def process_question(self, question: str, sendingDate, sendingTime) -> str:
-        """사용자 질문 처리"""
+    def process_question(self, question: str, sendingDate, sendingTime, user_id=None, on_relevance=None) -> str:
+        """
+        사용자 질문 처리
+
+        여러 요청이 동시에 같은 DBAgent 를 쓰므로 user_id 는 공유 상태 대신 인자로 넘긴다.
+        DB_RESULT_MODE 가 direct 이면 analyze_results 호출 없이 결과를 텍스트 블록으로 반환한다.
+        on_relevance 를 넘기면 DB 참조 필요성 판단 직후 needs_db 값으로 호출한다 (추측 응답 조기 폐기용).
+        """
         try:
             # 1. DB 참조 필요성 판단
             relevance_data = self.check_db_relevance(question)
             needs_db = relevance_data.get("needs_db", False)
+            if on_relevance is not None:
+                on_relevance(needs_db)
             
             if not needs_db:
                 return False, json.dumps({
@@ -303,15 +330,29 @@ class DBAgent:
                     "analysis": "데이터베이스 조회 없이 처리된 질문입니다."
                 }, ensure_ascii=False)
             
-            # 2. SQL 쿼리 생성
-            sql_query = self.generate_sql_query(question, sendingDate, sendingTime)
+            # 2. SQL 쿼리 생성 (관련 테이블의 스키마만 사용)
+            possible_tables = relevance_data.get("possible_tables") or []
+            sql_query = self.generate_sql_query(question, sendingDate, sendingTime, user_id, possible_tables)
+
+            if DB_RESULT_MODE == "direct":
+                # 3. 쿼리 실행 후 결과를 날짜별 텍스트 블록으로 바로 전달
+                rows, truncated, error = self.fetch_rows(sql_query)
+                if rows:
+                    return True, format_context(rows, truncated)
+                logger.warning(f"쿼리 결과 없음: {error}" if error else "쿼리 결과 없음")
+                return False, json.dumps({
+                    "is_sufficient": False,
+                    "explanation": error or "쿼리 결과가 없습니다.",
+                    "query_results": [],
+                    "analysis": "쿼리 결과가 없습니다."
+                }, ensure_ascii=False)
 
             # 3. 쿼리 실행
             query_results = self.run_query(sql_query)
             
             # 4. 응답 생성
             if len(query_results) > 0:
-                final_response = self.analyze_results(question, sql_query, query_results)
+                final_response = self.analyze_results(question, sql_query, query_results, possible_tables)
             else:
                 logger.warning("쿼리 결과 없음")
                 return False, json.dumps({
@@ -325,6 +366,7 @@ class DBAgent:
             
         except Exception as e:
             logger.error(f"질문 처리 중 오류 발생: {str(e)}", exc_info=True)
+            count_fallback("process_question")
             return False, json.dumps({
                 "is_sufficient": False,
                 "explanation": f"질문 처리 중 오류 발생: {str(e)}",
@@ -334,15 +376,15 @@ class DBAgent:
     
     def close_connection(self):
         """데이터베이스 연결 종료"""
-        if self.cursor:
-            self.cursor.close()
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
+        if self.pool is not None:
+            # 빌려 간 연결은 반납 시 닫히고, 풀에 남은 연결만 정리됨
+            self.pool._remove_connections()
             logger.info("MySQL 연결 종료")
 
 
 def main():
     """메인 함수"""
+    setup_logging()
     logger.info("DBAgent 메인 함수 시작")
     # 데이터베이스 연결 정보
 
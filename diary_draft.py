@@ -0,0 +1,113 @@
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from cache_store import get_cache
+from create_diary import (DIARY_SEGMENT_CACHE_TTL, DIARY_SEGMENT_MESSAGES, normalize_conversation,
+                          conversation_segments, summarize_segments_cached)
+
+logger = logging.getLogger("DiaryDraft")
+
+# 대화가 오가는 동안 하루치 일기 초안(구간 요약)을 미리 만들어 두는 모드
+# 밤에 한꺼번에 요약하지 않고, 구간이 찰 때마다 백그라운드에서 구간 요약 캐시를 채운다.
+DIARY_DRAFT = os.getenv("HARUNI_DIARY_DRAFT", "0") == "1"
+
+# 초안을 만드는 스레드 수
+DIARY_DRAFT_WORKERS = int(os.getenv("HARUNI_DIARY_DRAFT_WORKERS", "2"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DIARY_DRAFT_WORKERS, thread_name_prefix="diary-draft")
+        return _executor
+
+
+class DiaryDraftStore:
+    """
+    사용자/날짜별 대화 기록과 구간 요약 진행 상황을 저장하는 클래스
+
+    - record_turn: 대화 한 턴(질문/응답)을 기록하고, 새로 다 찬 구간이 있으면 백그라운드에서 요약
+    - messages: 기록된 대화 (일기 API 에 대화 내역이 없을 때 사용)
+    - matches_draft: 일기로 만들 대화가 초안의 구간 요약과 같은 구간으로 시작하는지 여부
+
+    같은 사용자의 턴은 app.py 의 사용자 잠금 안에서 순서대로 기록된다고 가정한다.
+    구간 요약은 create_diary 의 구간 요약 캐시에 저장되므로, 일기 생성 시에는
+    마지막(덜 찬) 구간과 합치기 단계만 남는다.
+    """
+    def __init__(self, ttl=DIARY_SEGMENT_CACHE_TTL):
+        self.ttl = ttl
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id, date):
+        return f"draft:{user_id}:{date}"
+
+    def _load(self, user_id, date):
+        return get_cache("diary_draft").get(self._key(user_id, date)) or {"messages": [], "drafted": 0}
+
+    def messages(self, user_id, date):
+        return self._load(user_id, date)["messages"]
+
+    def matches_draft(self, user_id, date, conversation):
+        """
+        conversation 의 앞 구간들이 초안에서 요약한 구간과 같은지 확인하는 메서드
+
+        클라이언트가 보낸 대화가 기록된 대화와 다르면(다른 기기, 편집 등) 구간 요약 캐시가 맞지 않으므로
+        구간 요약 방식을 강제하지 않는다.
+        """
+        draft = self._load(user_id, date)
+        drafted = draft["drafted"]
+        if not drafted:
+            return False
+        drafted_segments = conversation_segments(draft["messages"])[:drafted]
+        return conversation_segments(conversation)[:drafted] == drafted_segments
+
+    def record_turn(self, user_id, date, question, response):
+        """
+        대화 한 턴을 기록하고 필요하면 구간 요약을 예약하는 메서드
+
+        Returns:
+            bool: 구간 요약을 예약했으면 True
+        """
+        key = self._key(user_id, date)
+        draft = self._load(user_id, date)
+        draft["messages"] = draft["messages"] + normalize_conversation([
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": response}
+        ])
+        # 일기 생성 때와 같은 전처리/구간 나누기를 사용해야 구간 요약 캐시가 맞음
+        segments = conversation_segments(draft["messages"])
+        complete = sum(1 for segment in segments if len(segment) == max(1, DIARY_SEGMENT_MESSAGES))
+        scheduled = complete > draft["drafted"]
+        if scheduled:
+            draft["drafted"] = complete
+        get_cache("diary_draft").set(key, draft, expire=self.ttl)
+        if scheduled:
+            self._schedule(key, segments[:complete])
+        return scheduled
+
+    def _schedule(self, key, segments):
+        with self._lock:
+            if key in self._in_flight:
+                # 진행 중인 작업이 끝나지 않았으면 이번 구간은 다음 예약(또는 일기 생성 시)에 요약
+                logger.info(f"초안 작성 중이라 생략: {key}")
+                return
+            self._in_flight.add(key)
+
+        def _run():
+            try:
+                notes = summarize_segments_cached(segments)
+                logger.info(f"일기 초안 갱신: {key}, 구간 {sum(1 for n in notes if n)}/{len(segments)}개")
+            except Exception as e:
+                logger.error(f"일기 초안 갱신 실패: {e}")
+            finally:
+                with self._lock:
+                    self._in_flight.discard(key)
+
+        _get_executor().submit(_run)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import logging
+from tokens import estimate_tokens, message_text
+
+logger = logging.getLogger("FakeLLM")
+
+# 실제 모델 없이 /api/v1/question 파이프라인을 돌리기 위한 가짜 LLM 백엔드
+# llm("fake") 로 사용하며, 에이전트별로 형식이 맞는 고정 응답을 돌려준다.
+
+# DB 조회가 필요하다고 판단할 질문 키워드
+DB_KEYWORDS = ("어제", "그저께", "지난", "저번", "전에", "기억", "언제", "일기", "했었", "말했")
+
+FAKE_REPLIES = (
+    "그랬구나, 오늘 하루 정말 바빴겠다. 그중에서 제일 기억에 남는 순간은 뭐였어?",
+    "이야기해줘서 고마워요. 그때 기분은 어땠는지 조금 더 들려줄 수 있어요?",
+    "와, 좋은 시간을 보냈네요. 다음에도 또 해보고 싶은 일이 있어요?",
+    "힘든 하루였겠어요. 오늘 스스로에게 해주고 싶은 말이 있다면 뭐예요?",
+)
+
+STYLE_SUFFIXES = (" 😊", " 😆", " 🥲")
+
+
+def _digest(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+class FakeLLM:
+    """
+    에이전트별 고정 응답을 돌려주는 가짜 LLM 클라이언트
+
+    응답 내용은 입력 해시로 정해져 항상 같고, 지연 시간만 설정한 분포를 따른다.
+    prefill 은 프롬프트 토큰 수에 비례해 한 번에, decode 는 토큰마다 나누어 기다리므로
+    stream() 으로 토큰 단위 스트리밍을 흉내 낼 수 있다.
+
+    Args:
+        prefill_tps (float): 프롬프트 처리 속도(초당 토큰), 0 이면 지연 없음
+        decode_tps (float): 생성 속도(초당 토큰), 0 이면 지연 없음
+        jitter (float): 지연 시간에 곱하는 로그정규 분포의 sigma
+        seed (int, optional): 지연 시간 재현을 위한 난수 시드
+    """
+    def __init__(self, prefill_tps=800.0, decode_tps=30.0, jitter=0.2, seed=None):
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        logger.info(f"FakeLLM 초기화 (prefill {prefill_tps} tok/s, decode {decode_tps} tok/s, jitter {jitter})")
+
+    @classmethod
+    def from_env(cls):
+        seed = os.getenv("FAKE_LLM_SEED")
+        return cls(
+            prefill_tps=float(os.getenv("FAKE_LLM_PREFILL_TPS", "800")),
+            decode_tps=float(os.getenv("FAKE_LLM_DECODE_TPS", "30")),
+            jitter=float(os.getenv("FAKE_LLM_JITTER", "0.2")),
+            seed=int(seed) if seed else None
+        )
+
+    def _factor(self):
+        if not self.jitter:
+            return 1.0
+        with self._lock:
+            return self._random.lognormvariate(0.0, self.jitter)
+
+    def stream(self, system_message, messages, stats=None):
+        """
+        응답을 토큰 단위로 돌려주는 제너레이터
+
+        Args:
+            system_message (str): 시스템 메시지
+            messages (list): {"role", "content"} 메시지 목록 (마지막이 현재 입력)
+            stats (dict, optional): 넘기면 토큰 수와 prefill/decode 시간을 채워 줌
+        """
+        prompt_text = system_message + "".join(message_text(m) for m in messages)
+        prompt_tokens = max(1, estimate_tokens(prompt_text))
+        text = self.respond(system_message, message_text(messages[-1]) if messages else "")
+        tokens = re.findall(r"\S+\s*", text) or [text]
+
+        prefill_seconds = prompt_tokens / self.prefill_tps * self._factor() if self.prefill_tps else 0.0
+        if prefill_seconds:
+            time.sleep(prefill_seconds)
+
+        decode_start = time.perf_counter()
+        per_token = self._factor() / self.decode_tps if self.decode_tps else 0.0
+        for token in tokens:
+            if per_token:
+                time.sleep(per_token)
+            yield token
+
+        if stats is not None:
+            stats.update({
+                "prompt_tokens": prompt_tokens,
+                "eval_tokens": max(1, estimate_tokens(text)),
+                "prompt_seconds": prefill_seconds,
+                "eval_seconds": time.perf_counter() - decode_start
+            })
+
+    def complete(self, system_message, messages, stats=None):
+        """stream() 결과를 모두 이어 붙여 반환하는 메서드"""
+        return "".join(self.stream(system_message, messages, stats))
+
+    def respond(self, system_message, msg):
+        """
+        프롬프트 모양으로 어떤 에이전트의 호출인지 판단해 고정 응답을 만드는 메서드
+        """
+        if '"needs_db"' in msg:
+            return self._routing(msg)
+        if "MySQL의 쿼리" in msg:
+            return self._sql(msg)
+        if '"is_sufficient"' in msg:
+            return self._analysis(msg)
+        if "대화 문맥" in system_message:
+            return self._filtered_history(msg)
+        if "말투" in system_message:
+            return self._styled(msg)
+        return FAKE_REPLIES[_digest(msg) % len(FAKE_REPLIES)]
+
+    def _routing(self, msg):
+        match = re.search(r"사용자 질문:\s*(.*)", msg)
+        question = match.group(1).strip() if match else ""
+        needs_db = any(keyword in question for keyword in DB_KEYWORDS)
+        result = {
+            "needs_db": needs_db,
+            "explanation": "과거 기록을 참고해야 하는 질문입니다." if needs_db else "일상 대화이므로 조회가 필요하지 않습니다.",
+            "possible_tables": ["chats", "diaries"] if needs_db else []
+        }
+        return f"```json\n{json.dumps(result, ensure_ascii=False, indent=2)}\n```"
+
+    def _sql(self, msg):
+        user_match = re.search(r"user_id:\s*(\S+)", msg)
+        date_match = re.search(r"sendingDate:\s*(\S+)", msg)
+        user_id = user_match.group(1) if user_match else "0"
+        sending_date = date_match.group(1) if date_match else "2025-01-01"
+        return (
+            "```sql\n"
+            "SELECT sender, content, sending_date, sending_time FROM chats "
+            f"WHERE user_id = '{user_id}' AND sending_date < '{sending_date}' "
+            "ORDER BY sending_date DESC, sending_time DESC LIMIT 20;\n"
+            "```"
+        )
+
+    def _analysis(self, msg):
+        match = re.search(r"쿼리 결과:\s*(.*?)\n\s*\n", msg, re.DOTALL)
+        results = match.group(1).strip() if match else "[]"
+        try:
+            query_results = json.loads(results)
+        except json.JSONDecodeError:
+            query_results = []
+        if isinstance(query_results, dict):
+            query_results = query_results.get("rows", [])
+        result = {
+            "is_sufficient": bool(query_results),
+            "explanation": "조회 결과로 답변할 수 있습니다." if query_results else "조회 결과가 없습니다.",
+            "query_results": query_results[:5],
+            "analysis": f"관련 기록 {len(query_results)}건을 찾았습니다."
+        }
+        return f"```json\n{json.dumps(result, ensure_ascii=False, default=str)}\n```"
+
+    def _filtered_history(self, msg):
+        # 입력된 히스토리를 그대로 돌려줌 (필터링하지 않음)
+        history, _, _ = msg.rpartition("\n\n현재 메시지:")
+        return history or "[]"
+
+    def _styled(self, msg):
+        styled = msg.replace("요.", ".").replace("요?", "?").replace("어요", "어").replace("해요", "해")
+        return styled + STYLE_SUFFIXES[_digest(msg) % len(STYLE_SUFFIXES)]
@@ -0,0 +1,316 @@
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+import logging
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from logging_setup import setup_logging
+
+logger = logging.getLogger("FakeOpenAI")
+
+# OpenAI 없이 오프라인으로 일기 파이프라인을 돌리기 위한 대체 클라이언트
+# create_diary.client 와 같은 인터페이스(chat.completions.create, images.generate)를 제공한다.
+
+FAKE_DIARY_RESPONSE = """DIARY_SUMMARY: 오늘은 하루니와 이야기를 나누며 하루를 천천히 돌아봤다. 작은 일들이 모여 생각보다 괜찮은 하루였다는 걸 느꼈다.
+ILLUSTRATION_SUMMARY: 창가로 스며드는 따뜻한 오후 햇살 아래, 나무 책상 위에 놓인 머그컵에서 김이 피어오르는 조용한 방.
+SENTIMENT: {sentiment}"""
+
+FAKE_WEEKLY_RESPONSE = """[WEEK_FEEDBACK]
+이번 주도 정말 수고 많았어요. 작은 순간들 속에서 스스로를 잘 돌봐온 모습이 느껴져요.
+[WEEK_SUMMARY]
+이번 주에는 일상 속에서 소소한 즐거움을 찾으려는 모습이 자주 보였던 것 같아요.
+[SUGGESTIONS]
+1. 이번 주처럼 좋아하는 음악과 함께 산책을 해보는 건 어떨까요?
+2. 즐거웠던 순간을 짧게 기록해보면 좋을 것 같아요.
+3. 시간이 된다면 새로운 카페에 가보는 것도 고려해보세요.
+[RECOMMENDATION]
+1. 따뜻한 차 한 잔과 함께 하루를 마무리해보세요.
+2. 잠들기 전 가벼운 스트레칭으로 몸을 풀어주세요.
+3. 주말에는 가까운 공원에서 바람을 느껴보세요."""
+
+FAKE_SENTIMENTS = ("POSITIVE", "NEUTRAL", "NEGATIVE")
+
+
+def _digest(value):
+    return hashlib.sha256(str(value).encode("utf-8")).hexdigest()
+
+
+def fake_image_png(name, size=64):
+    """
+    이름에서 색을 정한 단색 PNG 바이트를 만드는 함수
+
+    같은 이름이면 항상 같은 바이트가 나오므로 ImageStore 의 내용 해시도 같다.
+    """
+    color = bytes.fromhex(_digest(name)[:6])
+    raw = b"".join(b"\x00" + color * size for _ in range(size))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    """/images/<이름>.png 요청에 가짜 이미지 바이트를 돌려주는 핸들러"""
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if "/images/" not in self.path or not self.path.endswith(".png"):
+            self.send_error(404)
+            return
+        payload = fake_image_png(self.path.rsplit("/", 1)[-1])
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+_image_host = None
+_image_host_lock = threading.Lock()
+
+
+def _get_image_base_url():
+    """FakeOpenAI 가 돌려주는 이미지 URL 을 실제로 내려받을 수 있도록 로컬 이미지 서버를 한 번만 띄우는 함수"""
+    global _image_host
+    with _image_host_lock:
+        if _image_host is None:
+            _image_host = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+            _image_host.daemon_threads = True
+            threading.Thread(target=_image_host.serve_forever, daemon=True).start()
+            logger.info(f"가짜 이미지 서버 시작: 포트 {_image_host.server_address[1]}")
+        host, port = _image_host.server_address[:2]
+        return f"http://{host}:{port}/images"
+
+
+class _FakeCompletions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, model=None, messages=None, **kwargs):
+        self._owner._before_call("chat")
+        messages = messages or []
+        system_prompt = messages[0].get("content", "") if messages else ""
+        key = _digest(messages)
+
+        if "DIARY_SUMMARY" in system_prompt:
+            # 같은 대화에는 항상 같은 감정을 돌려주도록 해시 기반으로 선택
+            sentiment = FAKE_SENTIMENTS[int(key[:8], 16) % len(FAKE_SENTIMENTS)]
+            content = FAKE_DIARY_RESPONSE.format(sentiment=sentiment)
+        elif "[WEEK_FEEDBACK]" in system_prompt:
+            content = FAKE_WEEKLY_RESPONSE
+        else:
+            content = "오늘 하루도 수고 많았어요."
+
+        message = SimpleNamespace(role="assistant", content=content)
+        usage = SimpleNamespace(
+            prompt_tokens=sum(len(str(m.get("content", ""))) for m in messages),
+            completion_tokens=len(content),
+            total_tokens=0
+        )
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        return SimpleNamespace(
+            id=f"chatcmpl-fake-{key[:12]}",
+            model=model,
+            choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+            usage=usage
+        )
+
+
+class _FakeChat:
+    def __init__(self, owner):
+        self.completions = _FakeCompletions(owner)
+
+
+class _FakeImages:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate(self, model=None, prompt="", n=1, size="1024x1024", **kwargs):
+        self._owner._before_call("image")
+        key = _digest(prompt)
+        base_url = self._owner.image_base_url or _get_image_base_url()
+        data = [SimpleNamespace(url=f"{base_url}/{key[:32]}-{i}.png") for i in range(n)]
+        return SimpleNamespace(created=int(time.time()), data=data)
+
+
+class FakeOpenAI:
+    """
+    openai.OpenAI 를 흉내 내는 로컬 대체 클라이언트
+
+    Args:
+        latency (float): 호출당 평균 지연 시간(초)
+        jitter (float): 지연 시간에 더해지는 무작위 편차(초)
+        failure_rate (float): 호출이 예외를 던질 확률 (0~1)
+        seed (int, optional): 지연/실패 재현을 위한 난수 시드
+        image_base_url (str, optional): 이미지 URL 앞부분, 없으면 로컬 가짜 이미지 서버 주소 사용
+    """
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, seed=None, image_base_url=None):
+        logger.info("FakeOpenAI 클라이언트 초기화")
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.image_base_url = image_base_url
+        self.calls = {"chat": 0, "image": 0}
+        self._random = random.Random(seed)
+        self.chat = _FakeChat(self)
+        self.images = _FakeImages(self)
+
+    def _before_call(self, kind):
+        self.calls[kind] += 1
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise RuntimeError(f"FakeOpenAI {kind} 호출 실패 (시뮬레이션)")
+
+
+class FakeOpenAIServer:
+    """
+    OpenAI REST API 를 흉내 내는 로컬 HTTP 서버
+
+    openai.OpenAI(base_url=server.base_url) 로 실제 SDK 를 그대로 붙여서
+    타임아웃, 재시도, Retry-After 처리를 네트워크 수준에서 시험할 수 있다.
+
+    사용 예:
+        server = FakeOpenAIServer().start()
+        server.fail_next(429, count=2, retry_after=1)
+        client = openai.OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+        ...
+        server.stop()
+
+    Args:
+        host (str): 바인딩 주소
+        port (int): 포트 (0 이면 빈 포트 자동 선택)
+        latency (float): 응답마다 추가할 지연 시간(초)
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.backend = FakeOpenAI()
+        self.latency = latency
+        self.requests = []
+        self._faults = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+        # 생성된 이미지 URL 은 이 서버의 GET /images/... 로 내려받음
+        server_host, server_port = self._server.server_address[:2]
+        self.backend.image_base_url = f"http://{server_host}:{server_port}/images"
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def fail_next(self, status, count=1, retry_after=None, delay=0.0):
+        """
+        다음 count 개의 요청을 지정한 상태 코드로 실패시키는 메서드
+
+        Args:
+            status (int): 응답 상태 코드 (예: 429, 500, 503)
+            count (int): 실패시킬 요청 수
+            retry_after (float, optional): Retry-After 헤더 값(초)
+            delay (float): 실패 응답 전에 기다릴 시간(초), 타임아웃 시험용
+        """
+        with self._lock:
+            for _ in range(count):
+                self._faults.append((status, retry_after, delay))
+
+    def delay_next(self, seconds, count=1):
+        """다음 count 개의 요청을 seconds 만큼 늦게 성공시키는 메서드 (헤지 요청 시험용)"""
+        with self._lock:
+            for _ in range(count):
+                self._faults.append((200, None, seconds))
+
+    def _next_fault(self):
+        with self._lock:
+            return self._faults.popleft() if self._faults else None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"FakeOpenAIServer 시작: {self.base_url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        logger.info("FakeOpenAIServer 종료")
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None):
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                _ImageHandler.do_GET(self)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server.requests.append((self.path, body))
+
+                fault = server._next_fault()
+                delay = server.latency + (fault[2] if fault else 0.0)
+                if delay:
+                    time.sleep(delay)
+                if fault and fault[0] != 200:
+                    status, retry_after, _ = fault
+                    headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+                    self._send_json(status, {"error": {"message": f"fake error {status}", "type": "fake_error"}}, headers)
+                    return
+
+                if self.path.endswith("/chat/completions"):
+                    result = server.backend.chat.completions.create(**body)
+                    self._send_json(200, {
+                        "id": result.id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model"),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": result.choices[0].message.content},
+                            "finish_reason": "stop"
+                        }],
+                        "usage": {
+                            "prompt_tokens": result.usage.prompt_tokens,
+                            "completion_tokens": result.usage.completion_tokens,
+                            "total_tokens": result.usage.total_tokens
+                        }
+                    })
+                elif self.path.endswith("/images/generations"):
+                    result = server.backend.images.generate(**body)
+                    self._send_json(200, {"created": result.created, "data": [{"url": d.url} for d in result.data]})
+                else:
+                    self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    setup_logging()
+    # 로컬에서 create_diary 를 붙여볼 때: OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=test
+    fake_server = FakeOpenAIServer(port=8089).start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake_server.stop()
@@ -0,0 +1,106 @@
+import hashlib
+import io
+import os
+import re
+import threading
+import logging
+
+import requests
+from PIL import Image, features
+from metrics import count_cache
+
+logger = logging.getLogger("ImageStore")
+
+# 썸네일 한 변의 크기 (픽셀)
+THUMBNAIL_SIZES = (256, 512)
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ImageStore:
+    """
+    일기 이미지를 내용 해시(sha256) 기준으로 로컬에 저장하는 클래스
+
+    DALL·E 가 돌려주는 임시 URL 은 만료되므로 생성 직후 한 번만 내려받아
+    WebP(지원되지 않으면 JPEG)로 변환하고 썸네일과 함께 저장한다.
+    같은 이미지는 같은 해시를 가지므로 중복 저장되지 않는다.
+
+    Args:
+        root (str): 이미지 저장 디렉터리
+        thumbnail_sizes (tuple): 생성할 썸네일 크기 목록
+        quality (int): 인코딩 품질 (1~100)
+    """
+    def __init__(self, root="image_store", thumbnail_sizes=THUMBNAIL_SIZES, quality=80):
+        self.root = root
+        self.thumbnail_sizes = tuple(thumbnail_sizes)
+        self.quality = quality
+        if features.check("webp"):
+            self.format, self.ext, self.mimetype = "WEBP", "webp", "image/webp"
+        else:
+            self.format, self.ext, self.mimetype = "JPEG", "jpg", "image/jpeg"
+        os.makedirs(root, exist_ok=True)
+        logger.info(f"ImageStore 초기화: {root} ({self.format})")
+
+    def path_for(self, digest, size=None):
+        """
+        저장된 이미지 파일 경로를 반환하는 메서드
+
+        Args:
+            digest (str): 이미지 해시
+            size (int, optional): 썸네일 크기, None 이면 원본 크기
+
+        Returns:
+            str: 파일 경로, 유효하지 않은 요청이면 None
+        """
+        if not DIGEST_PATTERN.match(digest or ""):
+            return None
+        if size is not None and size not in self.thumbnail_sizes:
+            return None
+        name = f"{digest}_{size}.{self.ext}" if size else f"{digest}.{self.ext}"
+        return os.path.join(self.root, digest[:2], name)
+
+    def exists(self, digest):
+        path = self.path_for(digest)
+        return path is not None and os.path.exists(path)
+
+    def store_bytes(self, data):
+        """
+        이미지 바이트를 변환하여 저장하고 해시를 반환하는 메서드
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        stored = self.exists(digest)
+        count_cache("image_store", stored)
+        if stored:
+            logger.info(f"이미 저장된 이미지: {digest[:12]}")
+            return digest
+
+        with Image.open(io.BytesIO(data)) as image:
+            image = image.convert("RGB")
+            os.makedirs(os.path.join(self.root, digest[:2]), exist_ok=True)
+            self._save(image, self.path_for(digest))
+            for size in self.thumbnail_sizes:
+                thumbnail = image.copy()
+                thumbnail.thumbnail((size, size), Image.LANCZOS)
+                self._save(thumbnail, self.path_for(digest, size))
+
+        logger.info(f"이미지 저장 완료: {digest[:12]} ({len(data)} bytes 원본)")
+        return digest
+
+    def store_url(self, url, timeout=30):
+        """
+        URL 의 이미지를 내려받아 저장하고 해시를 반환하는 메서드
+        """
+        logger.info("이미지 다운로드 시작")
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        return self.store_bytes(response.content)
+
+    def _save(self, image, path):
+        # 쓰는 도중 읽히지 않도록 임시 파일에 쓴 뒤 교체
+        # 같은 이미지를 여러 스레드가 동시에 저장할 수 있으므로 임시 파일 이름은 쓰는 쪽마다 다르게 한다
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if self.format == "WEBP":
+            image.save(tmp_path, format=self.format, quality=self.quality, method=6)
+        else:
+            image.save(tmp_path, format=self.format, quality=self.quality, optimize=True, progressive=True)
+        os.replace(tmp_path, path)
@@ -0,0 +1,398 @@
+import argparse
+import json
+import os
+import re
+import logging
+from collections import Counter, defaultdict
+
+import mysql.connector
+from dotenv import load_dotenv
+from logging_setup import setup_logging
+from sql_guard import SQL_QUERY_LOG
+
+logger = logging.getLogger("IndexAdvisor")
+
+load_dotenv()
+
+# sql_guard 가 기록한 정규화 SQL 과 EXPLAIN 결과를 모양별로 모아 인덱스를 추천하는 CLI
+#   python index_advisor.py --log sql_log/queries.jsonl --db --ddl migrations/add_indexes.sql
+
+# 추천 대상 테이블
+TARGET_TABLES = tuple(
+    t.strip() for t in os.getenv("INDEX_ADVISOR_TABLES", "chats,diaries,users").split(",") if t.strip()
+)
+
+# 카탈로그(--db)가 없을 때 기본 키로 가정할 컬럼 (이 스키마는 모든 테이블이 id 기본 키를 씀)
+ASSUMED_PRIMARY_KEY = tuple(
+    c.strip() for c in os.getenv("INDEX_ADVISOR_PRIMARY_KEY", "id").split(",") if c.strip()
+)
+
+# 인덱스 하나에 넣을 최대 컬럼 수
+MAX_INDEX_COLUMNS = 4
+
+# 범위 조건(<, >, BETWEEN, LIKE)이 남기는 행 비율 추정치 (통계가 없을 때 MySQL 옵티마이저가 쓰는 값과 같은 1/3)
+RANGE_SELECTIVITY = 1 / 3
+
+SQL_KEYWORDS = frozenset((
+    "WHERE", "JOIN", "ON", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "STRAIGHT_JOIN", "ORDER", "GROUP",
+    "HAVING", "LIMIT", "USING", "AND", "OR", "NOT", "AS", "UNION"
+))
+TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?", re.IGNORECASE)
+CLAUSE_END = r"(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bHAVING\b|\bLIMIT\b|\bUNION\b|$)"
+WHERE_CLAUSE = re.compile(r"\bWHERE\b(.*?)" + CLAUSE_END, re.IGNORECASE | re.DOTALL)
+ON_CLAUSE = re.compile(r"\bON\b(.*?)(?=\bJOIN\b|\bLEFT\b|\bRIGHT\b|\bINNER\b|\bWHERE\b|\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|$)", re.IGNORECASE | re.DOTALL)
+ORDER_CLAUSE = re.compile(r"\bORDER\s+BY\b(.*?)(?=\bLIMIT\b|$)", re.IGNORECASE | re.DOTALL)
+PREDICATE = re.compile(r"(?<![\w.(])(?:`?(\w+)`?\.)?`?(\w+)`?\s*(<=>|<=|>=|<>|!=|=|<|>|\bNOT\s+IN\b|\bIN\b|\bBETWEEN\b|\bLIKE\b)", re.IGNORECASE)
+JOIN_EQUALITY = re.compile(r"`?(\w+)`?\.`?(\w+)`?\s*=\s*`?(\w+)`?\.`?(\w+)`?")
+WRAPPED_COLUMN = re.compile(r"\b(\w+)\s*\(\s*(?:`?\w+`?\.)?`?(\w+)`?\s*\)\s*(?:=|<|>|\bBETWEEN\b|\bIN\b)", re.IGNORECASE)
+
+EQUALITY_OPERATORS = ("=", "<=>", "IN")
+RANGE_OPERATORS = ("<", ">", "<=", ">=", "BETWEEN", "LIKE")
+
+
+def load_shapes(path):
+    """
+    쿼리 기록 파일을 정규화 SQL 별로 묶는 함수
+
+    반환값:
+    - shapes: {sql: {"count", "rejected", "rows": [...], "plan": {table: {"rows": [...], "types": Counter, "keys": Counter}}}}
+    """
+    shapes = {}
+    if not os.path.exists(path):
+        logger.warning(f"쿼리 기록 파일 없음: {path}")
+        return shapes
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            shape = shapes.setdefault(entry["sql"], {"count": 0, "rejected": 0, "rows": [], "plan": {}})
+            shape["count"] += 1
+            shape["rejected"] += 1 if entry.get("rejected") else 0
+            shape["rows"].append(entry.get("rows") or 0)
+            for step in entry.get("plan") or []:
+                table_plan = shape["plan"].setdefault(step.get("table"), {"rows": [], "types": Counter(), "keys": Counter()})
+                table_plan["rows"].append(int(step.get("rows") or 0))
+                table_plan["types"][step.get("type")] += 1
+                table_plan["keys"][step.get("key") or "(없음)"] += 1
+    return shapes
+
+
+def parse_shape(sql):
+    """
+    정규화 SQL 에서 테이블, 조건 컬럼, 정렬 컬럼을 뽑는 함수
+
+    반환값:
+    - tables: {별칭: 테이블} (별칭이 없으면 테이블 이름 자신)
+    - predicates: [(별칭 또는 None, 컬럼, "eq" | "range" | "join")] ("join" 은 ON 절의 동등 조인 조건)
+    - order_by: [(별칭 또는 None, 컬럼)]
+    - wrapped: 함수로 감싸 인덱스를 쓸 수 없는 조건 컬럼 목록
+    """
+    tables = {}
+    for table, alias in TABLE_REF.findall(sql):
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            tables[alias] = table
+        tables[table] = table
+
+    predicates = []
+    where = WHERE_CLAUSE.search(sql)
+    where_text = where.group(1) if where else ""
+    for qualifier, column, operator in PREDICATE.findall(where_text):
+        operator = re.sub(r"\s+", " ", operator.upper())
+        if column.upper() in SQL_KEYWORDS:
+            continue
+        if operator in EQUALITY_OPERATORS:
+            predicates.append((qualifier or None, column, "eq"))
+        elif operator in RANGE_OPERATORS:
+            predicates.append((qualifier or None, column, "range"))
+
+    # 조인 조건은 조인되는 쪽 테이블의 동등 조건으로 취급
+    for on_text in ON_CLAUSE.findall(sql):
+        for left_alias, left_column, right_alias, right_column in JOIN_EQUALITY.findall(on_text):
+            predicates.append((left_alias, left_column, "join"))
+            predicates.append((right_alias, right_column, "join"))
+
+    order_by = []
+    order = ORDER_CLAUSE.search(sql)
+    if order:
+        for item in order.group(1).split(","):
+            match = re.match(r"\s*(?:`?(\w+)`?\.)?`?(\w+)`?", item)
+            if match:
+                order_by.append((match.group(1), match.group(2)))
+
+    wrapped = [column for function, column in WRAPPED_COLUMN.findall(where_text) if function.upper() not in SQL_KEYWORDS]
+    return tables, predicates, order_by, wrapped
+
+
+def _resolve(qualifier, column, tables, catalog):
+    """별칭/컬럼 이름을 실제 테이블 이름으로 바꾸는 함수 (모르면 None)"""
+    if qualifier:
+        return tables.get(qualifier)
+    names = set(tables.values())
+    if len(names) == 1:
+        return next(iter(names))
+    owners = [name for name in names if column in catalog.get(name, {}).get("columns", ())]
+    return owners[0] if len(owners) == 1 else None
+
+
+def load_catalog(db_config, tables):
+    """
+    information_schema 에서 대상 테이블의 컬럼, 기존 인덱스, 행 수를 읽는 함수
+
+    반환값:
+    - catalog: {table: {"columns": set, "indexes": {name: [컬럼, ...]}, "rows": int}}
+    """
+    catalog = {}
+    connection = mysql.connector.connect(**db_config)
+    try:
+        cursor = connection.cursor(dictionary=True)
+        for table in tables:
+            cursor.execute(
+                "SELECT COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+                (db_config["database"], table)
+            )
+            columns = {row["COLUMN_NAME"] for row in cursor.fetchall()}
+            if not columns:
+                continue
+            cursor.execute(
+                "SELECT INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY INDEX_NAME, SEQ_IN_INDEX",
+                (db_config["database"], table)
+            )
+            indexes = defaultdict(list)
+            for row in cursor.fetchall():
+                indexes[row["INDEX_NAME"]].append(row["COLUMN_NAME"])
+            cursor.execute(f"SELECT COUNT(*) AS n FROM `{table}`")
+            catalog[table] = {"columns": columns, "indexes": dict(indexes), "rows": cursor.fetchone()["n"]}
+        cursor.close()
+    finally:
+        connection.close()
+    return catalog
+
+
+def count_distinct(db_config, table, columns):
+    """컬럼 조합의 서로 다른 값 개수를 세는 함수 (동등 조건 하나당 평균 행 수 추정용)"""
+    connection = mysql.connector.connect(**db_config)
+    try:
+        cursor = connection.cursor()
+        column_list = ", ".join(f"`{c}`" for c in columns)
+        cursor.execute(f"SELECT COUNT(DISTINCT {column_list}) FROM `{table}`")
+        return cursor.fetchone()[0] or 0
+    finally:
+        connection.close()
+
+
+def _primary_key(table, catalog):
+    """테이블의 기본 키 컬럼 (카탈로그에 없으면 ASSUMED_PRIMARY_KEY)"""
+    info = catalog.get(table)
+    if info:
+        return tuple(info["indexes"].get("PRIMARY", ()))
+    return ASSUMED_PRIMARY_KEY
+
+
+def _candidate(table, predicates, order_by, eq_frequency):
+    """쿼리 하나에 대해 동등 조건 → 범위 조건 1개 → 정렬 컬럼 순서의 인덱스 후보를 만드는 함수"""
+    eq_columns = sorted({c for t, c, kind in predicates if t == table and kind in ("eq", "join")},
+                        key=lambda c: (-eq_frequency[(table, c)], c))
+    range_columns = [c for t, c, kind in predicates if t == table and kind == "range" and c not in eq_columns]
+    columns = list(eq_columns)
+    if range_columns:
+        # 범위 조건 뒤의 컬럼은 인덱스 탐색에 쓰이지 않으므로 첫 번째 범위 컬럼까지만 사용
+        columns.append(range_columns[0])
+    elif order_by and all(t == table for t, _ in order_by):
+        columns.extend(c for _, c in order_by if c not in columns)
+    return tuple(columns[:MAX_INDEX_COLUMNS]), len(eq_columns), bool(range_columns)
+
+
+def advise(shapes, catalog=None, db_config=None, min_count=1, tables=TARGET_TABLES):
+    """
+    쿼리 모양별 통계와 인덱스 추천 목록을 만드는 함수
+
+    Args:
+        shapes (dict): load_shapes() 결과
+        catalog (dict, optional): load_catalog() 결과 (없으면 기존 인덱스 확인과 행 수 추정을 건너뜀)
+        db_config (dict, optional): 지정 시 COUNT(DISTINCT) 로 인덱스 적용 후 검사 행 수를 추정
+        min_count (int): 이 횟수 미만으로 실행된 쿼리 모양은 무시
+        tables (tuple): 추천 대상 테이블
+
+    반환값:
+    - report: {"shapes": [...], "recommendations": [...]} 딕셔너리
+    """
+    catalog = catalog or {}
+    parsed = {}
+    eq_frequency = Counter()
+    for sql, shape in shapes.items():
+        if shape["count"] < min_count:
+            continue
+        table_map, predicates, order_by, wrapped = parse_shape(sql)
+        resolved = [(_resolve(q, c, table_map, catalog), c, kind) for q, c, kind in predicates]
+        resolved_order = [(_resolve(q, c, table_map, catalog), c) for q, c in order_by]
+        parsed[sql] = (table_map, resolved, resolved_order, wrapped)
+        for table, column, kind in resolved:
+            if kind in ("eq", "join"):
+                eq_frequency[(table, column)] += shape["count"]
+
+    shape_report = []
+    candidates = {}
+    for sql, (table_map, predicates, order_by, wrapped) in parsed.items():
+        shape = shapes[sql]
+        shape_report.append({
+            "sql": sql,
+            "count": shape["count"],
+            "rejected": shape["rejected"],
+            "avg_rows": round(sum(shape["rows"]) / len(shape["rows"]), 1),
+            "plan": {
+                str(table): {"type": plan["types"].most_common(1)[0][0], "key": plan["keys"].most_common(1)[0][0],
+                             "avg_rows": round(sum(plan["rows"]) / len(plan["rows"]), 1)}
+                for table, plan in shape["plan"].items()
+            },
+            "wrapped_columns": wrapped
+        })
+        for table in sorted(set(table_map.values())):
+            if table not in tables:
+                continue
+            primary_key = set(_primary_key(table, catalog))
+            if primary_key and primary_key <= {c for t, c, kind in predicates if t == table and kind == "eq"}:
+                # WHERE 에서 기본 키 전체가 동등 조건이면 기본 키로 한 행만 찾으므로 인덱스가 필요 없음
+                continue
+            # 조인에서 참조되는 쪽의 기본 키 컬럼(c.user_id = u.id 의 u.id)은 이미 기본 키로 찾을 수 있음
+            table_predicates = [(t, c, kind) for t, c, kind in predicates
+                                if not (t == table and kind == "join" and c in primary_key)]
+            columns, eq_count, has_range = _candidate(table, table_predicates, order_by, eq_frequency)
+            if not columns:
+                continue
+            # EXPLAIN 의 table 항목은 별칭으로 나올 수 있음
+            plan = next((shape["plan"][name] for name, real in table_map.items()
+                         if real == table and name in shape["plan"]), None)
+            candidate = candidates.setdefault((table, columns), {
+                "table": table, "columns": list(columns), "eq_columns": eq_count, "range": has_range,
+                "count": 0, "observed_rows": [], "shapes": []
+            })
+            candidate["count"] += shape["count"]
+            candidate["shapes"].append(sql)
+            if plan:
+                candidate["observed_rows"].extend(plan["rows"])
+
+    # 다른 후보의 앞부분(prefix)과 같은 후보는 긴 인덱스 하나로 합침
+    for key in sorted(candidates, key=lambda k: (len(k[1]), k)):
+        table, columns = key
+        longer = [other for other in candidates if other[0] == table and len(other[1]) > len(columns)
+                  and other[1][:len(columns)] == columns]
+        if longer:
+            target = candidates[max(longer, key=lambda k: candidates[k]["count"])]
+            merged = candidates.pop(key)
+            target["count"] += merged["count"]
+            target["shapes"].extend(merged["shapes"])
+            target["observed_rows"].extend(merged["observed_rows"])
+
+    recommendations = []
+    # 실행 횟수가 같으면 테이블/컬럼 순으로 정렬해 보고서와 DDL 순서가 실행마다 같도록 함
+    for (table, columns), candidate in sorted(candidates.items(), key=lambda item: (-item[1]["count"], item[0][0], item[0][1])):
+        info = catalog.get(table)
+        existing = None
+        if info:
+            existing = next((name for name, index_columns in info["indexes"].items()
+                             if tuple(index_columns[:len(columns)]) == columns), None)
+        observed = candidate.pop("observed_rows")
+        candidate["observed_avg_rows"] = round(sum(observed) / len(observed), 1) if observed else None
+        candidate["existing_index"] = existing
+        candidate["expected_rows"] = None
+        if info and db_config and not existing:
+            candidate["expected_rows"] = _expected_rows(db_config, table, columns, candidate, info["rows"])
+        if candidate["observed_avg_rows"] and candidate["expected_rows"]:
+            candidate["reduction"] = round(candidate["observed_avg_rows"] / max(candidate["expected_rows"], 1), 1)
+        name = f"idx_{table}_" + "_".join(columns)
+        candidate["name"] = name[:64]
+        candidate["ddl"] = f"ALTER TABLE `{table}` ADD INDEX `{candidate['name']}` ({', '.join(f'`{c}`' for c in columns)});"
+        recommendations.append(candidate)
+
+    return {"shapes": sorted(shape_report, key=lambda s: -s["count"]), "recommendations": recommendations}
+
+
+def _expected_rows(db_config, table, columns, candidate, total_rows):
+    eq_columns = list(columns[:candidate["eq_columns"]])
+    rows = float(total_rows)
+    if eq_columns:
+        distinct = count_distinct(db_config, table, eq_columns)
+        rows = total_rows / distinct if distinct else rows
+    if candidate["range"]:
+        rows *= RANGE_SELECTIVITY
+    return max(1, round(rows))
+
+
+def format_report(report):
+    """advise() 결과를 사람이 읽기 쉬운 텍스트로 만드는 함수"""
+    lines = ["== 쿼리 모양별 실행 현황 =="]
+    for shape in report["shapes"]:
+        lines.append(f"[{shape['count']}회, 거부 {shape['rejected']}회, 평균 예상 검사 {shape['avg_rows']}행] {shape['sql']}")
+        for table, plan in shape["plan"].items():
+            lines.append(f"    {table}: type={plan['type']}, key={plan['key']}, 평균 {plan['avg_rows']}행")
+        if shape["wrapped_columns"]:
+            lines.append(f"    주의: 함수로 감싼 조건 컬럼은 인덱스를 사용할 수 없음 ({', '.join(shape['wrapped_columns'])})")
+
+    lines.append("")
+    lines.append("== 인덱스 추천 ==")
+    if not report["recommendations"]:
+        lines.append("추천할 인덱스가 없습니다.")
+    for rec in report["recommendations"]:
+        header = f"{rec['table']} ({', '.join(rec['columns'])}) - 관련 쿼리 {rec['count']}회"
+        if rec["existing_index"]:
+            lines.append(f"{header}: 기존 인덱스 {rec['existing_index']} 로 충분함")
+            continue
+        lines.append(header)
+        if rec["observed_avg_rows"] is not None:
+            estimate = f"현재 평균 {rec['observed_avg_rows']}행 검사"
+            if rec["expected_rows"]:
+                estimate += f" -> 약 {rec['expected_rows']}행 예상 ({rec.get('reduction', 1)}배 감소)"
+            lines.append(f"    {estimate}")
+        lines.append(f"    {rec['ddl']}")
+    return "\n".join(lines)
+
+
+def write_ddl(report, path):
+    """기존 인덱스로 해결되지 않는 추천만 마이그레이션 SQL 파일로 저장하는 함수"""
+    statements = [rec for rec in report["recommendations"] if not rec["existing_index"]]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("-- index_advisor.py 가 관찰된 쿼리 모양으로 만든 인덱스 추천\n")
+        for rec in statements:
+            f.write(f"-- 관련 쿼리 {rec['count']}회, 현재 평균 {rec['observed_avg_rows']}행 검사\n")
+            f.write(rec["ddl"] + "\n")
+    logger.info(f"마이그레이션 DDL 저장: {path} ({len(statements)}개)")
+
+
+def main():
+    setup_logging()
+    parser = argparse.ArgumentParser(description="관찰된 LLM 생성 쿼리 기반 인덱스 추천")
+    parser.add_argument("--log", default=SQL_QUERY_LOG, help="sql_guard 쿼리 기록 파일 경로")
+    parser.add_argument("--db", action="store_true", help="DB_* 환경 변수의 MySQL 에 접속해 기존 인덱스와 행 수를 확인")
+    parser.add_argument("--min-count", type=int, default=1, help="이 횟수 미만으로 실행된 쿼리 모양은 무시")
+    parser.add_argument("--ddl", help="추천 인덱스 DDL 을 저장할 파일 경로")
+    parser.add_argument("--json", action="store_true", help="텍스트 대신 JSON 으로 출력")
+    args = parser.parse_args()
+
+    shapes = load_shapes(args.log)
+    catalog, db_config = None, None
+    if args.db:
+        db_config = {
+            "host": os.getenv("DB_HOST"),
+            "user": os.getenv("DB_USER"),
+            "password": os.getenv("DB_PASSWORD"),
+            "database": os.getenv("DB_NAME")
+        }
+        catalog = load_catalog(db_config, TARGET_TABLES)
+
+    report = advise(shapes, catalog, db_config, args.min_count)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    else:
+        print(format_report(report))
+    if args.ddl:
+        write_ddl(report, args.ddl)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,19 +9,16 @@ import torch
 #import google.generativeai as genai
 #from google.generativeai.types import GenerationConfig
 from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers.generation.streamers import BaseStreamer
 import requests
 import subprocess
+import time
+import metrics
+from replay import get_replay_log, llm_key
+from speculation import check_cancelled, SpeculationCancelled
+from logging_setup import setup_logging
 #from agent.Model_deepseek_r1 import Model_deepseek_r1
 
-# 로깅 설정
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("haruni.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("LLM")
 
 MAX_NUM_TOKENS = 4096
@@ -48,14 +45,23 @@ class ModelProvider:
             # 모델이 아직 로드되지 않은 경우 새로 로드
             logger.info(f"모델 로드: {model_id}")
             print(f"Loading model: {model_id}")
+            start = time.perf_counter()
             cls._instances[model_id] = cls._create_model(model_id)
+            if not model_id.startswith("ollama-") and model_id != "fake":
+                # Ollama 는 서버 쪽에서 로드하므로 호출마다 load_duration 으로 기록
+                metrics.record_model_load(get_backend_name(model_id), time.perf_counter() - start)
         
         return cls._instances[model_id]
     
     @staticmethod
     def _create_model(model_id):
         try:
-            if model_id.startswith("ollama-gemma3:4b-it-qat"):
+            if model_id == "fake":
+                # 부하 테스트용 가짜 모델 (실제 모델 없이 파이프라인 실행)
+                from fake_llm import FakeLLM
+                logger.info("가짜 LLM 초기화")
+                return FakeLLM.from_env(), model_id, None
+            elif model_id.startswith("ollama-gemma3:4b-it-qat"):
                 # import subprocess
                 # import atexit
                 # # 서브프로세스 실행 (예: ollama 모델)
@@ -113,25 +119,125 @@ class ModelProvider:
             logger.error(f"모델 로드 실패: {model_id} - {str(e)}", exc_info=True)
             raise
 
+def _ns_to_seconds(value):
+    return value / 1e9 if value is not None else None
+
+
+class _FirstTokenTimer(BaseStreamer):
+    """
+    transformers generate() 에 streamer 로 넘겨 prefill 과 decode 시간을 나눠 재는 클래스
+
+    generate() 는 프롬프트 토큰을 먼저 put() 한 뒤 토큰이 생성될 때마다 put() 하므로
+    두 번째 put() 까지가 prefill(첫 토큰까지의 시간), 그 뒤부터 end() 까지가 decode 이다.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.end_at = None
+        self._puts = 0
+
+    def put(self, value):
+        self._puts += 1
+        if self._puts == 2:
+            self.first_token_at = time.perf_counter()
+
+    def end(self):
+        self.end_at = time.perf_counter()
+
+    def seconds(self):
+        """(prefill 시간, decode 시간)을 반환, 토큰이 하나도 생성되지 않았으면 decode 는 None"""
+        end_at = self.end_at or time.perf_counter()
+        if self.first_token_at is None:
+            return end_at - self.start, None
+        return self.first_token_at - self.start, end_at - self.first_token_at
+
+
+def get_backend_name(model_id):
+    """모델 ID로 지표 라벨에 쓸 백엔드 이름을 반환하는 함수"""
+    if model_id.startswith("ollama-"):
+        return "ollama"
+    if model_id == "fake":
+        return "fake"
+    if model_id.startswith("google/gemma-3-4b-it-qat-q4_0-gguf"):
+        return "llama_cpp"
+    return "transformers"
+
+
 class llm():
     def __init__(self, model_id):
         logger.info(f"LLM 인스턴스 초기화: {model_id}")
         self.system_message = None
         self.msg_history = []
-        
-        # ModelProvider를 통해 모델 인스턴스 가져오기
-        self.client, self.model_id, self.tokenizer = ModelProvider.get_model(model_id)
+        self.replay = get_replay_log()
+
+        if self.replay is not None and self.replay.mode == "replay":
+            # 재생 모드에서는 기록된 응답만 사용하므로 모델을 로드하지 않음
+            self.client, self.model_id, self.tokenizer = None, model_id, None
+        else:
+            # ModelProvider를 통해 모델 인스턴스 가져오기
+            self.client, self.model_id, self.tokenizer = ModelProvider.get_model(model_id)
+        self.backend = get_backend_name(self.model_id)
 
     def get_model_id(self):
         return self.model_id
 
-    #@backoff.on_exception(backoff.expo)
     def get_response_from_llm(
             self, system_message, msg, msg_history=None
+    ):
+        """
+        LLM 응답을 생성하고 백엔드별 호출 시간을 기록하는 메서드
+
+        Returns:
+            tuple: (응답 문자열, 업데이트된 메시지 히스토리)
+        """
+        if self.replay is None:
+            start = time.perf_counter()
+            try:
+                return self._get_response_from_llm(system_message, msg, msg_history)
+            finally:
+                metrics.observe_llm_call(self.backend, time.perf_counter() - start)
+
+        key = llm_key(self.model_id, system_message, msg, msg_history)
+        if self.replay.mode == "replay":
+            content = self.replay.lookup(key)["response"]
+            msg_history = [] if msg_history is None else msg_history
+            msg_history.append({"role": "user", "content": msg})
+            msg_history.append({"role": "assistant", "content": content})
+            return content, msg_history
+
+        # 기록 모드: 호출 중에 히스토리가 바뀌므로 키와 길이는 호출 전에 계산
+        prompt_chars = len(system_message) + len(msg) + len(json.dumps(msg_history or [], ensure_ascii=False))
+        start = time.perf_counter()
+        try:
+            content, msg_history = self._get_response_from_llm(system_message, msg, msg_history)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe_llm_call(self.backend, elapsed)
+        self.replay.record(key, "llm", self.backend, content, elapsed, prompt_chars)
+        return content, msg_history
+
+    #@backoff.on_exception(backoff.expo)
+    def _get_response_from_llm(
+            self, system_message, msg, msg_history=None
     ):
         if msg_history is None:
             msg_history = []
 
+        # 폐기된 추측 응답이면 호출하지 않음 (speculation.py)
+        check_cancelled()
+
+        if self.model_id == "fake":
+            msg_history.append({"role": "user", "content": msg})
+            stats = {}
+            content = ""
+            for token in self.client.stream(system_message, msg_history, stats):
+                check_cancelled()
+                content += token
+            metrics.record_llm_stats(self.backend, **stats)
+            msg_history.append({"role": "assistant", "content": content})
+            return content, msg_history
+
         if self.model_id in ["ollama-gemma3:4b-it-qat"]:
             msg_history.append({
                 "role": "user",
@@ -150,19 +256,36 @@ class llm():
             }
 
             try:
-                response = requests.post("http://localhost:11434/api/chat", json=payload, stream=False)
+                # 줄 단위로 받아 추측 응답이 폐기되면 연결을 끊어 생성을 멈춤
+                response = requests.post("http://localhost:11434/api/chat", json=payload, stream=True)
                 content = ""
                 if response.status_code == 200:
-                    for line in response.text.strip().splitlines():
+                    for line in response.iter_lines():
+                        check_cancelled()
+                        if not line:
+                            continue
                         data = json.loads(line)
                         message_data = data.get("message", {})
                         content += message_data.get("content", "")
+                        if data.get("done"):
+                            # 마지막 줄에 토큰 수와 처리 시간(나노초)이 담겨 옴
+                            metrics.record_llm_stats(
+                                self.backend,
+                                prompt_tokens=data.get("prompt_eval_count"),
+                                eval_tokens=data.get("eval_count"),
+                                prompt_seconds=_ns_to_seconds(data.get("prompt_eval_duration")),
+                                eval_seconds=_ns_to_seconds(data.get("eval_duration")),
+                                load_seconds=_ns_to_seconds(data.get("load_duration"))
+                            )
                 else:
                     logger.error(f"Ollama API 요청 실패. 상태 코드: {response.status_code}")
                     print("API 요청 실패. 상태 코드:", response.status_code)
 
                 msg_history.append({"role": "assistant", "content": content})
                 return content, msg_history
+            except SpeculationCancelled:
+                response.close()
+                raise
             except Exception as e:
                 logger.error(f"Ollama 응답 생성 중 오류: {str(e)}", exc_info=True)
                 raise
@@ -181,6 +304,7 @@ class llm():
                     ]
                 
                 # 채팅 완성 생성
+                start = time.perf_counter()
                 response = self.client.create_chat_completion(
                     messages=prompt,
                     max_tokens=10000,
@@ -190,6 +314,16 @@ class llm():
                 
                 # 응답 추출
                 decoded = response["choices"][0]["message"]["content"]
+
+                # llama.cpp 는 prefill/decode 시간을 따로 주지 않으므로 전체 시간만 기록하고
+                # decode 속도는 집계하지 않음 (prefill 이 섞여 tokens/s 가 낮게 잡히므로)
+                usage = response.get("usage") or {}
+                metrics.record_llm_stats(
+                    self.backend,
+                    prompt_tokens=usage.get("prompt_tokens"),
+                    eval_tokens=usage.get("completion_tokens"),
+                    total_seconds=time.perf_counter() - start
+                )
                 
                 # 히스토리에 응답 추가
                 assistant_message = {"role": "assistant", "content": [{"type": "text", "text": decoded}]}
@@ -220,9 +354,19 @@ class llm():
 
                 input_len = inputs["input_ids"].shape[-1]
 
+                # 첫 토큰 시각으로 prefill 과 decode 를 나눠 decode 속도에 prefill 이 섞이지 않게 함
+                timer = _FirstTokenTimer()
                 with torch.inference_mode():
-                    generation = self.client.generate(**inputs, max_new_tokens=1000, do_sample=True)
+                    generation = self.client.generate(**inputs, max_new_tokens=1000, do_sample=True, streamer=timer)
                     generation = generation[0][input_len:]
+                prompt_seconds, eval_seconds = timer.seconds()
+                metrics.record_llm_stats(
+                    self.backend,
+                    prompt_tokens=int(input_len),
+                    eval_tokens=int(generation.shape[-1]),
+                    prompt_seconds=prompt_seconds,
+                    eval_seconds=eval_seconds
+                )
 
                 decoded = self.tokenizer.decode(generation, skip_special_tokens=True)
 
@@ -255,9 +399,19 @@ class llm():
 
                 input_len = inputs["input_ids"].shape[-1]
 
+                # 첫 토큰 시각으로 prefill 과 decode 를 나눠 decode 속도에 prefill 이 섞이지 않게 함
+                timer = _FirstTokenTimer()
                 with torch.inference_mode():
-                    generation = self.client.generate(**inputs, max_new_tokens=1000, do_sample=True)
+                    generation = self.client.generate(**inputs, max_new_tokens=1000, do_sample=True, streamer=timer)
                     generation = generation[0][input_len:]
+                prompt_seconds, eval_seconds = timer.seconds()
+                metrics.record_llm_stats(
+                    self.backend,
+                    prompt_tokens=int(input_len),
+                    eval_tokens=int(generation.shape[-1]),
+                    prompt_seconds=prompt_seconds,
+                    eval_seconds=eval_seconds
+                )
 
                 decoded = self.tokenizer.decode(generation, skip_special_tokens=True)
 
@@ -298,6 +452,7 @@ def extract_json_between_markers(llm_output):
     return None  # No valid JSON found
 
 if __name__ == "__main__":
+    setup_logging()
     logger.info("LLM 모듈 테스트 시작")
     llm = llm("ollama-gemma3:4b")
     result, _= llm.get_response_from_llm("너는 하루니야!","안녕?")
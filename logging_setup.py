@@ -0,0 +1,144 @@
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import zlib
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# 모든 모듈이 공유하는 로깅 설정
+# 요청 스레드에서는 큐에 넣기만 하고, 파일/콘솔 쓰기는 QueueListener 스레드에서 처리한다.
+
+LOG_FILE = os.getenv("HARUNI_LOG_FILE", "haruni.log")
+LOG_LEVEL = os.getenv("HARUNI_LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("HARUNI_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("HARUNI_LOG_BACKUP_COUNT", "5"))
+
+# 질문/응답/일기 원문 같은 큰 내용을 남길 요청 비율 (0~1)
+PAYLOAD_SAMPLE_RATE = float(os.getenv("HARUNI_LOG_PAYLOAD_SAMPLE", "0.1"))
+PAYLOAD_MAX_CHARS = int(os.getenv("HARUNI_LOG_PAYLOAD_MAX_CHARS", "500"))
+
+_listener = None
+_lock = threading.Lock()
+
+
+class RequestIdFilter(logging.Filter):
+    """로그 레코드에 현재 요청 ID 를 붙이는 필터 (요청을 처리하는 스레드에서 실행됨)"""
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            # metrics 가 이 모듈을 import 하므로 순환 import 를 피하려고 여기서 가져옴
+            from metrics import current_request_id
+            record.request_id = current_request_id()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """한 줄에 하나의 JSON 객체로 로그를 출력하는 포매터"""
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """콘솔용 사람이 읽기 쉬운 포매터 (기존 형식 + 요청 ID/필드)"""
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def formatMessage(self, record):
+        # 예외 traceback 이 붙기 전의 첫 줄에 요청 ID 와 필드를 덧붙임
+        text = super().formatMessage(record)
+        if getattr(record, "request_id", None):
+            text = f"{text} [{record.request_id}]"
+        fields = getattr(record, "fields", None)
+        if fields:
+            text = f"{text} {json.dumps(fields, ensure_ascii=False, default=str)}"
+        return text
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # 기본 구현은 메시지를 포맷하면서 exc_info 를 지우므로 JSON 포매터가 쓸 수 있게 그대로 둠
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+def setup_logging():
+    """
+    루트 로거에 큐 기반 핸들러를 한 번만 설치하는 함수
+
+    여러 모듈에서 호출해도 처음 한 번만 적용된다.
+    파일은 JSON 줄 형식으로 크기 기준 회전하고, 콘솔은 기존 텍스트 형식을 유지한다.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+
+        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(ConsoleFormatter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(RequestIdFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(LOG_LEVEL)
+
+        _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def should_log_payload(request_id=None):
+    """
+    큰 내용을 로그에 남길지 결정하는 함수
+
+    요청 ID 가 있으면 그 해시로 결정하므로 한 요청의 질문/응답은 함께 남거나 함께 빠진다.
+    """
+    if PAYLOAD_SAMPLE_RATE >= 1.0:
+        return True
+    if PAYLOAD_SAMPLE_RATE <= 0.0:
+        return False
+    if request_id is None:
+        from metrics import current_request_id
+        request_id = current_request_id()
+    if request_id is None:
+        return random.random() < PAYLOAD_SAMPLE_RATE
+    return zlib.crc32(request_id.encode("utf-8")) % 10000 < PAYLOAD_SAMPLE_RATE * 10000
+
+
+def log_payload(logger, label, payload, level=logging.INFO):
+    """
+    질문/응답/프롬프트 같은 큰 내용을 샘플링하고 길이를 제한해 기록하는 함수
+
+    샘플에서 빠진 요청은 길이만 DEBUG 로 남긴다.
+    """
+    text = str(payload)
+    if not should_log_payload():
+        logger.debug(f"{label}: ({len(text)}자, 샘플링 제외)")
+        return
+    if len(text) > PAYLOAD_MAX_CHARS:
+        text = f"{text[:PAYLOAD_MAX_CHARS]}... ({len(text)}자)"
+    logger.log(level, f"{label}: {text}")
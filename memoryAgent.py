@@ -2,16 +2,8 @@ import json
 import re
 import logging
 from llm import llm, ModelProvider
+from metrics import timed, count_fallback, count_parse_failure
 
-# 로깅 설정
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("haruni.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("MemoryAgent")
 
 # 현재 미사용
@@ -34,6 +26,7 @@ class MemoryAgent:
 너의 출력은 필터링된 메시지 히스토리이며, 형식은 원래와 동일하게 유지해야 한다. 절대로 구조나 포맷을 변경하지 마라.
 """
         
+    @timed("filter_context")
     def filter_context(self, message_history, current_message):
         """
         대화 히스토리에서 현재 메시지와 관련된 문맥만 필터링하는 메서드
@@ -66,6 +59,7 @@ class MemoryAgent:
             if isinstance(filtered_history, list) and all(isinstance(item, dict) for item in filtered_history):
                 return filtered_history
             else:
+                count_fallback("filter_context")
                 return message_history  # 유효하지 않은 형식이면 원본 반환
                 
         except json.JSONDecodeError:
@@ -79,10 +73,13 @@ class MemoryAgent:
                     return filtered_history
                 else:
                     logger.warning("JSON 패턴을 찾지 못함 - 원본 히스토리 반환")
+                    count_parse_failure("filter_context")
                     return message_history  # JSON 패턴을 찾지 못하면 원본 반환
             except Exception as e:
                 logger.error(f"컨텍스트 필터링 중 오류 발생: {str(e)}", exc_info=True)
+                count_parse_failure("filter_context")
                 return message_history  # 예외 발생 시 원본 반환
         except Exception as e:
             logger.error(f"컨텍스트 필터링 중 오류 발생: {str(e)}", exc_info=True)
+            count_fallback("filter_context")
             return message_history  # 예외 발생 시 원본 반환
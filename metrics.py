@@ -0,0 +1,385 @@
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger("Metrics")
+
+# 지연 시간 히스토그램 구간 (초) - LLM 호출까지 담을 수 있도록 넓게 잡음
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# 토큰 수 히스토그램 구간
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192)
+
+# 모델 로드 시간이 이 값(초)을 넘으면 콜드 로드로 집계
+COLD_LOAD_SECONDS = float(os.getenv("LLM_COLD_LOAD_SECONDS", "1.0"))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """라벨별로 누적되는 카운터"""
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """
+    라벨별 관측값 분포를 구간(bucket) 단위로 세는 히스토그램
+
+    관측 시에는 해당 구간 하나만 증가시키고, 누적 값은 출력할 때 계산한다.
+    """
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, label_values, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {total:.6f}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Throughput:
+    """
+    라벨별 토큰 수와 소요 시간을 누적해 초당 토큰 수(gauge)로 출력하는 집계기
+    """
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, tokens, seconds, *label_values):
+        with self._lock:
+            totals = self._totals.setdefault(label_values, [0, 0.0])
+            totals[0] += tokens
+            totals[1] += seconds
+
+    def rate(self, *label_values):
+        tokens, seconds = self._totals.get(label_values, (0, 0.0))
+        return tokens / seconds if seconds > 0 else 0.0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted((k, tuple(v)) for k, v in self._totals.items())
+        for label_values, (tokens, seconds) in items:
+            if seconds > 0:
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {tokens / seconds:.3f}")
+        return lines
+
+
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+REQUEST_SECONDS = _register(Histogram(
+    "haruni_request_duration_seconds", "HTTP 요청 처리 시간", ("endpoint", "method", "status")))
+STAGE_SECONDS = _register(Histogram(
+    "haruni_stage_duration_seconds", "파이프라인 단계별 처리 시간", ("stage",)))
+LLM_CALL_SECONDS = _register(Histogram(
+    "haruni_llm_call_duration_seconds", "LLM 백엔드 호출 시간", ("backend",)))
+CACHE_TOTAL = _register(Counter(
+    "haruni_cache_requests_total", "캐시 조회 횟수", ("cache", "result")))
+FALLBACK_TOTAL = _register(Counter(
+    "haruni_fallbacks_total", "기본값으로 대체된 횟수", ("component",)))
+PARSE_FAILURE_TOTAL = _register(Counter(
+    "haruni_parse_failures_total", "LLM 출력 파싱 실패 횟수", ("component",)))
+SQL_GUARD_TOTAL = _register(Counter(
+    "haruni_sql_guard_total", "LLM 생성 SQL 검사 결과", ("result",)))
+COALESCED_TOTAL = _register(Counter(
+    "haruni_coalesced_requests_total", "중복 대화 요청 처리 방식 (leader: 직접 처리, joined: 진행 중인 처리에 합류, replayed: 저장된 결과)", ("result",)))
+SPECULATION_TOTAL = _register(Counter(
+    "haruni_speculation_total", "DB 판단과 병렬로 미리 만든 응답의 사용 결과", ("result",)))
+SPECULATION_HEAD_START = _register(Histogram(
+    "haruni_speculation_head_start_seconds", "사용된 추측 응답이 DB 판단보다 먼저 시작한 시간"))
+SPECULATION_WASTED_SECONDS = _register(Counter(
+    "haruni_speculation_wasted_seconds_total", "버려진 추측 응답에 쓴 시간(초)"))
+SPECULATION_WASTED_TOKENS = _register(Counter(
+    "haruni_speculation_wasted_tokens_total", "버려진 추측 응답의 LLM 토큰 수", ("kind",)))
+LLM_PROMPT_TOKENS = _register(Histogram(
+    "haruni_llm_prompt_tokens", "LLM 호출당 프롬프트 토큰 수", ("backend", "agent"), TOKEN_BUCKETS))
+LLM_EVAL_TOKENS = _register(Histogram(
+    "haruni_llm_eval_tokens", "LLM 호출당 생성 토큰 수", ("backend", "agent"), TOKEN_BUCKETS))
+LLM_PREFILL_RATE = _register(Throughput(
+    "haruni_llm_prefill_tokens_per_second", "프롬프트 처리(prefill) 초당 토큰 수", ("backend", "agent")))
+LLM_DECODE_RATE = _register(Throughput(
+    "haruni_llm_decode_tokens_per_second", "생성(decode) 초당 토큰 수", ("backend", "agent")))
+DIARY_INPUT_TOKENS = _register(Histogram(
+    "haruni_diary_input_tokens", "일기 요약 대화 입력의 추정 토큰 수 (raw: 전처리 전, prepared: 전처리 후)", ("stage",), TOKEN_BUCKETS))
+DIARY_TOKENS_SAVED = _register(Counter(
+    "haruni_diary_input_tokens_saved_total", "일기 요약 전처리로 줄인 추정 토큰 수"))
+LLM_COLD_LOADS = _register(Counter(
+    "haruni_llm_cold_loads_total", "LLM 모델 콜드 로드 횟수", ("backend",)))
+LLM_LOAD_SECONDS = _register(Counter(
+    "haruni_llm_load_seconds_total", "LLM 모델 로드에 쓴 시간(초)", ("backend",)))
+
+
+def render():
+    """등록된 모든 지표를 Prometheus 텍스트 형식으로 반환하는 함수"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------------------- 요청 단위 추적 -------------------------------------- #
+
+# 현재 요청의 단계별 시간과 이벤트를 모으는 딕셔너리 (요청 밖에서는 None)
+_request_trace = contextvars.ContextVar("haruni_request_trace", default=None)
+
+# 현재 실행 중인 단계 이름 (LLM 호출 통계의 agent 라벨로 사용)
+_current_stage = contextvars.ContextVar("haruni_current_stage", default=None)
+
+
+def start_request(request_id):
+    """요청 시작 시 추적 정보를 초기화하는 함수"""
+    _request_trace.set({"request_id": request_id, "stages": {}, "events": {}, "llm_calls": []})
+
+
+def current_stage():
+    return _current_stage.get() or "unknown"
+
+
+def finish_request():
+    """요청 종료 시 추적 정보를 꺼내고 초기화하는 함수"""
+    trace = _request_trace.get()
+    _request_trace.set(None)
+    return trace
+
+
+def current_request_id():
+    trace = _request_trace.get()
+    return trace["request_id"] if trace else None
+
+
+def _trace_event(name):
+    trace = _request_trace.get()
+    if trace is not None:
+        trace["events"][name] = trace["events"].get(name, 0) + 1
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _request_trace.get()
+    if trace is not None:
+        trace["stages"][stage] = round(trace["stages"].get(stage, 0.0) + seconds * 1000, 1)
+
+
+@contextmanager
+def stage_timer(stage):
+    """
+    블록 실행 시간을 단계별 히스토그램과 현재 요청 추적 정보에 기록하는 컨텍스트 매니저
+    """
+    token = _current_stage.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+        _current_stage.reset(token)
+
+
+def timed(stage):
+    """
+    함수 실행 시간을 단계별로 기록하는 데코레이터
+
+    사용 예:
+        @timed("check_db_relevance")
+        def check_db_relevance(self, question): ...
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_llm_call(backend, seconds):
+    LLM_CALL_SECONDS.observe(seconds, backend)
+    _trace_event(f"llm_call:{backend}")
+
+
+def count_cache(cache, hit):
+    result = "hit" if hit else "miss"
+    CACHE_TOTAL.inc(cache, result)
+    _trace_event(f"cache_{result}:{cache}")
+
+
+def count_fallback(component):
+    FALLBACK_TOTAL.inc(component)
+    _trace_event(f"fallback:{component}")
+
+
+def count_parse_failure(component):
+    PARSE_FAILURE_TOTAL.inc(component)
+    _trace_event(f"parse_failure:{component}")
+
+
+def count_sql_guard(result):
+    SQL_GUARD_TOTAL.inc(result)
+    _trace_event(f"sql_guard:{result}")
+
+
+def count_coalesced(result):
+    COALESCED_TOTAL.inc(result)
+    _trace_event(f"coalesced:{result}")
+
+
+def count_speculation(result):
+    SPECULATION_TOTAL.inc(result)
+    _trace_event(f"speculation:{result}")
+
+
+def observe_speculation_head_start(seconds):
+    SPECULATION_HEAD_START.observe(seconds)
+
+
+def record_speculation_waste(seconds, llm_calls):
+    """버려진 추측 응답의 실행 시간과 LLM 토큰 수를 낭비량으로 기록하는 함수"""
+    SPECULATION_WASTED_SECONDS.inc(amount=seconds)
+    for call in llm_calls:
+        if call.get("prompt_tokens"):
+            SPECULATION_WASTED_TOKENS.inc("prompt", amount=call["prompt_tokens"])
+        if call.get("eval_tokens"):
+            SPECULATION_WASTED_TOKENS.inc("eval", amount=call["eval_tokens"])
+
+
+def record_conversation_prep(stats):
+    """일기 요약 입력 전처리 전후의 토큰 수와 줄인 양을 기록하는 함수"""
+    DIARY_INPUT_TOKENS.observe(stats["tokens_in"], "raw")
+    DIARY_INPUT_TOKENS.observe(stats["tokens_out"], "prepared")
+    DIARY_TOKENS_SAVED.inc(amount=stats["tokens_saved"])
+    _trace_event("diary_prep")
+
+
+def merge_trace(sub_trace):
+    """다른 스레드에서 따로 모은 추적 정보(단계 시간, 이벤트, LLM 호출)를 현재 요청에 더하는 함수"""
+    trace = _request_trace.get()
+    if trace is None or not sub_trace:
+        return
+    for stage, ms in sub_trace["stages"].items():
+        trace["stages"][stage] = round(trace["stages"].get(stage, 0.0) + ms, 1)
+    for name, count in sub_trace["events"].items():
+        trace["events"][name] = trace["events"].get(name, 0) + count
+    trace["llm_calls"].extend(sub_trace["llm_calls"])
+
+
+def record_llm_stats(backend, prompt_tokens=None, eval_tokens=None, prompt_seconds=None,
+                     eval_seconds=None, load_seconds=None, total_seconds=None, agent=None):
+    """
+    LLM 호출 한 번의 토큰/시간 통계를 기록하는 함수
+
+    agent 를 생략하면 현재 실행 중인 단계 이름(stage_timer)을 사용한다.
+    값을 알 수 없는 항목은 None 으로 두면 집계에서 제외된다.
+
+    Args:
+        backend (str): LLM 백엔드 이름
+        prompt_tokens (int): 프롬프트 토큰 수
+        eval_tokens (int): 생성 토큰 수
+        prompt_seconds (float): 프롬프트 처리(prefill) 시간(초)
+        eval_seconds (float): 생성(decode) 시간(초)
+        load_seconds (float): 모델 로드 시간(초)
+        total_seconds (float): prefill/decode 를 나눌 수 없을 때의 호출 전체 시간(초), 속도 집계에는 쓰지 않음
+        agent (str, optional): 호출한 에이전트/단계 이름
+    """
+    agent = agent or current_stage()
+    if prompt_tokens is not None:
+        LLM_PROMPT_TOKENS.observe(prompt_tokens, backend, agent)
+        if prompt_seconds:
+            LLM_PREFILL_RATE.add(prompt_tokens, prompt_seconds, backend, agent)
+    if eval_tokens is not None:
+        LLM_EVAL_TOKENS.observe(eval_tokens, backend, agent)
+        if eval_seconds:
+            LLM_DECODE_RATE.add(eval_tokens, eval_seconds, backend, agent)
+    if load_seconds is not None:
+        record_model_load(backend, load_seconds)
+
+    stats = {
+        "agent": agent,
+        "backend": backend,
+        "prompt_tokens": prompt_tokens,
+        "eval_tokens": eval_tokens,
+        "prefill_tps": round(prompt_tokens / prompt_seconds, 1) if prompt_tokens and prompt_seconds else None,
+        "decode_tps": round(eval_tokens / eval_seconds, 1) if eval_tokens and eval_seconds else None,
+        "load_ms": round(load_seconds * 1000, 1) if load_seconds is not None else None,
+        "total_ms": round(total_seconds * 1000, 1) if total_seconds is not None else None
+    }
+    trace = _request_trace.get()
+    if trace is not None:
+        trace["llm_calls"].append(stats)
+    logger.info(f"LLM 호출 통계: {stats}")
+    return stats
+
+
+def record_model_load(backend, seconds):
+    """모델 로드 시간을 기록하고 기준을 넘으면 콜드 로드로 집계하는 함수"""
+    LLM_LOAD_SECONDS.inc(backend, amount=seconds)
+    if seconds >= COLD_LOAD_SECONDS:
+        LLM_COLD_LOADS.inc(backend)
+        logger.warning(f"LLM 콜드 로드 감지: {backend} ({seconds:.2f}초)")
@@ -0,0 +1,10 @@
+-- batch_diary.py --write-db 의 INSERT ... ON DUPLICATE KEY UPDATE 가 기대는 (user_id, date) 고유 키
+-- 이미 같은 사용자/날짜의 일기가 여러 개 있으면 고유 키를 만들 수 없으므로, 가장 최근(id 가 큰) 행만 남긴다.
+
+DELETE older FROM diaries AS older
+JOIN diaries AS newer
+  ON newer.user_id = older.user_id
+ AND newer.date = older.date
+ AND newer.id > older.id;
+
+ALTER TABLE diaries ADD UNIQUE KEY uq_diaries_user_date (user_id, date);
@@ -0,0 +1,253 @@
+import re
+import logging
+from collections import namedtuple
+
+import numpy as np
+from logging_setup import setup_logging
+
+logger = logging.getLogger("MoodClassifier")
+
+# 감정 어휘 사전 (어간 -> 가중치), 양수는 긍정 / 음수는 부정
+SENTIMENT_LEXICON = {
+    # 긍정
+    "좋": 1.0, "행복": 1.5, "기쁘": 1.5, "기뻤": 1.5, "기뻐": 1.5, "신나": 1.2, "신났": 1.2,
+    "즐거": 1.2, "즐겁": 1.2, "재밌": 1.0, "재미있": 1.0, "최고": 1.5, "뿌듯": 1.3, "설레": 1.2,
+    "설렜": 1.2, "감사": 1.0, "고마": 1.0, "고맙": 1.0, "편안": 0.8, "편했": 0.8, "맛있": 0.8,
+    "웃었": 0.6, "웃겼": 0.6, "사랑": 1.2, "만족": 1.0, "다행": 0.8, "상쾌": 0.8, "여유": 0.6,
+    "힐링": 1.0, "성공": 0.8, "칭찬": 0.8, "멋있": 0.8, "예쁘": 0.6, "귀여": 0.6, "설렘": 1.2,
+    "ㅋㅋ": 0.5, "ㅎㅎ": 0.5, "😊": 0.8, "😆": 0.8, "😄": 0.8, "🥰": 1.0, "❤": 0.8,
+    # 부정
+    "슬프": -1.5, "슬펐": -1.5, "슬퍼": -1.5, "우울": -1.5, "힘들": -1.2, "힘든": -1.2, "힘드": -1.2,
+    "피곤": -0.8, "지치": -1.0, "지쳤": -1.0, "짜증": -1.3, "화나": -1.3, "화났": -1.3,
+    "속상": -1.3, "외롭": -1.2, "외로": -1.2, "불안": -1.2, "걱정": -0.8, "아프": -1.0, "아팠": -1.0,
+    "아파": -1.0, "싫": -1.0, "스트레스": -1.2, "후회": -1.0, "실망": -1.2, "최악": -1.5, "귀찮": -0.6,
+    "무섭": -1.0, "무서": -1.0, "답답": -1.0, "서운": -1.0, "억울": -1.2, "눈물": -0.8, "망했": -1.2,
+    "ㅠㅠ": -0.6, "ㅜㅜ": -0.6, "😢": -1.0, "😭": -1.0, "🥲": -0.4,
+}
+
+# 감정 표현을 강하게 만드는 부사
+INTENSIFIERS = ("너무", "정말", "진짜", "완전", "엄청", "매우", "되게", "아주", "넘")
+
+# 어간 앞/뒤에 붙어 의미를 뒤집는 부정 표현
+NEGATION_PREFIX = r"(?:안|못|안\s+|못\s+)"
+NEGATION_SUFFIX = r"[가-힣]{0,2}(?:지\s*(?:않|못|마)|진\s*않|지도\s*않|\s*없)"
+
+# 여러 텍스트를 한 문자열로 이어 붙일 때 쓰는 구분자 (부정 표현의 \s 나 한글 범위에 걸리지 않는 문자)
+TEXT_SEPARATOR = "\x00"
+
+# 점수 -> 기분 분류 기준
+HAPPY_THRESHOLD = 0.25
+SAD_THRESHOLD = -0.25
+
+MoodResult = namedtuple("MoodResult", ["label", "score"])
+
+
+def _message_text(message):
+    """대화 메시지(dict 또는 문자열)에서 텍스트만 꺼내는 함수"""
+    if isinstance(message, str):
+        return message
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content or "")
+
+
+def term_alternation(terms):
+    """
+    어휘 목록을 접두사 트리 모양의 정규식으로 만드는 함수
+
+    "a|ab|ac" 처럼 나열하면 위치마다 어휘를 하나씩 시도하므로, "a(?:b|c)?" 처럼 공통 접두사를 묶어
+    비용이 어휘 수에 비례하지 않게 한다. 같은 위치에서는 가장 긴 어휘가 잡힌다.
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if "" in node:
+            return f"(?:{'|'.join(branches)})?"
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    return build(trie)
+
+
+def label_for_score(score):
+    if score >= HAPPY_THRESHOLD:
+        return "happy"
+    if score <= SAD_THRESHOLD:
+        return "sad"
+    return "normal"
+
+
+class MoodClassifier:
+    """
+    어휘 사전 기반의 한국어 감정 분류기
+
+    GPT 호출 없이 CPU 에서 텍스트의 감정 점수(-1~1)와
+    happy/normal/sad 분류를 계산한다. 여러 텍스트를 한 번에 넣으면
+    (텍스트 수 x 어휘 수) 행렬을 만들어 NumPy 로 일괄 계산한다.
+    어휘는 하나의 정규식(어휘 전체의 alternation)으로 찾으므로, 비용은 어휘 수가 아니라 텍스트 길이와 등장 수에 비례한다.
+
+    Args:
+        lexicon (dict, optional): 어간 -> 가중치 사전, 기본값은 SENTIMENT_LEXICON
+    """
+    def __init__(self, lexicon=None):
+        lexicon = lexicon or SENTIMENT_LEXICON
+        self.terms = list(lexicon.keys())
+        self.weights = np.array([lexicon[t] for t in self.terms], dtype=np.float32)
+        self._index = {t: j for j, t in enumerate(self.terms)}
+        # 서로 다른 어휘가 겹쳐 있어도 모두 잡도록 위치마다 lookahead 로 확인 (같은 위치에서는 긴 어휘부터 시도)
+        # 그룹 1 은 전체 일치 범위, 그룹 2/3 은 어휘
+        # 어휘 첫 글자 문자 집합으로 먼저 걸러, 어휘가 시작할 수 없는 위치는 바로 건너뜀
+        alternation = term_alternation(self.terms)
+        first = "".join(sorted({re.escape(t[0]) for t in self.terms}))
+        self._term_pattern = re.compile(f"(?=[{first}])(?=(({alternation})))")
+        self._negated_pattern = re.compile(
+            rf"(?=[{first}안못])(?=({NEGATION_PREFIX}({alternation})|({alternation}){NEGATION_SUFFIX}))")
+        self._intensifier_pattern = re.compile("|".join(re.escape(word) for word in INTENSIFIERS))
+        logger.info(f"MoodClassifier 초기화: 어휘 {len(self.terms)}개")
+
+    def _features(self, texts):
+        """
+        텍스트 목록을 (등장 횟수, 부정 등장 횟수, 강조 부사 수) 행렬로 변환하는 메서드
+
+        텍스트를 구분자로 이어 붙여 정규식을 한 번씩만 돌리고, 찾은 위치로 텍스트 번호를 구한다.
+        """
+        joined = TEXT_SEPARATOR.join(texts)
+        starts = np.cumsum([0] + [len(t) + len(TEXT_SEPARATOR) for t in texts[:-1]])
+        counts = self._term_matrix(self._term_pattern, joined, starts)
+        negated = np.minimum(counts, self._term_matrix(self._negated_pattern, joined, starts))
+        positions = [m.start() for m in self._intensifier_pattern.finditer(joined)]
+        intensifiers = np.bincount(self._rows(starts, positions), minlength=len(texts)).astype(np.float32)
+        return counts, negated, intensifiers
+
+    @staticmethod
+    def _rows(starts, positions):
+        return np.searchsorted(starts, np.asarray(positions, dtype=np.int64), side="right") - 1
+
+    def _term_matrix(self, pattern, joined, starts):
+        """
+        pattern 이 잡은 어휘가 텍스트별로 몇 번 나왔는지 (텍스트 수 x 어휘 수) 행렬로 세는 메서드
+
+        같은 어휘끼리 겹친 일치는 str.count / findall 처럼 앞의 것만 센다.
+        """
+        matrix = np.zeros((len(starts), len(self.terms)), dtype=np.float32)
+        positions, columns = [], []
+        last_end = {}
+        for match in pattern.finditer(joined):
+            column = self._index[next(term for term in match.groups()[1:] if term is not None)]
+            start, end = match.span(1)
+            if start < last_end.get(column, 0):
+                continue
+            last_end[column] = end
+            positions.append(start)
+            columns.append(column)
+        if positions:
+            np.add.at(matrix, (self._rows(starts, positions), np.asarray(columns, dtype=np.int64)), 1.0)
+        return matrix
+
+    def score_texts(self, texts):
+        """
+        여러 텍스트의 감정 점수를 한 번에 계산하는 메서드
+
+        Args:
+            texts (list): 문자열 목록
+
+        Returns:
+            tuple: (scores, hits) - 감정 점수 배열(-1~1)과 감정 어휘 등장 수 배열
+        """
+        texts = [t or "" for t in texts]
+        if not texts:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+        counts, negated, intensifiers = self._features(texts)
+        # 부정된 등장은 부호를 뒤집어서 반영
+        raw = (counts - 2.0 * negated) @ self.weights
+        hits = counts.sum(axis=1)
+        boost = 1.0 + 0.25 * np.minimum(intensifiers, 4.0)
+        scores = np.tanh(raw * boost / np.sqrt(np.maximum(hits, 1.0)))
+        return scores.astype(np.float32), hits
+
+    def classify(self, text):
+        """
+        메시지 하나의 감정을 분류하는 메서드
+
+        Returns:
+            MoodResult: (label, score)
+        """
+        scores, _ = self.score_texts([text])
+        score = float(scores[0])
+        return MoodResult(label_for_score(score), score)
+
+    def classify_batch(self, texts):
+        """
+        여러 메시지의 감정을 한 번에 분류하는 메서드
+
+        Returns:
+            list: MoodResult 목록
+        """
+        scores, _ = self.score_texts(texts)
+        return [MoodResult(label_for_score(float(s)), float(s)) for s in scores]
+
+    def classify_day(self, conversation):
+        """
+        하루치 대화의 감정을 분류하는 메서드
+
+        사용자 메시지만 사용하며, 감정 어휘가 많이 등장한 메시지일수록 큰 가중치를 준다.
+
+        Args:
+            conversation (list): {"role": ..., "content": ...} 형식의 대화 목록
+
+        Returns:
+            MoodResult: (label, score)
+        """
+        return self.classify_days([conversation])[0]
+
+    def classify_days(self, conversations):
+        """
+        여러 날의 대화를 한 번에 분류하는 메서드 (재채점용 일괄 처리)
+
+        Args:
+            conversations (list): 날짜별 대화 목록의 목록
+
+        Returns:
+            list: 날짜별 MoodResult 목록
+        """
+        texts, day_index = [], []
+        for day, conversation in enumerate(conversations):
+            for message in conversation or []:
+                if isinstance(message, dict) and message.get("role", "user") != "user":
+                    continue
+                texts.append(_message_text(message))
+                day_index.append(day)
+
+        scores, hits = self.score_texts(texts)
+        day_index = np.array(day_index, dtype=np.int64)
+        n_days = len(conversations)
+        weighted = np.bincount(day_index, weights=scores * hits, minlength=n_days)
+        total_hits = np.bincount(day_index, weights=hits, minlength=n_days)
+        day_scores = np.divide(weighted, total_hits, out=np.zeros(n_days), where=total_hits > 0)
+        return [MoodResult(label_for_score(float(s)), float(s)) for s in day_scores]
+
+
+_default_classifier = None
+
+
+def get_classifier():
+    """기본 어휘 사전을 사용하는 공용 분류기를 반환하는 함수"""
+    global _default_classifier
+    if _default_classifier is None:
+        _default_classifier = MoodClassifier()
+    return _default_classifier
+
+
+if __name__ == "__main__":
+    setup_logging()
+    classifier = get_classifier()
+    for sample in ["오늘 너무 행복했어 ㅎㅎ", "그냥 평범한 하루였어", "일이 너무 힘들고 짜증났어 ㅠㅠ", "별로 좋지 않았어"]:
+        print(sample, classifier.classify(sample))
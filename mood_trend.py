@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import threading
+import logging
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+from logging_setup import setup_logging
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 등 fcntl 이 없으면 프로세스 간 잠금 없이 같은 프로세스 안에서만 직렬화
+    fcntl = None
+
+logger = logging.getLogger("MoodTrend")
+
+# 기분 -> int8 코드
+MOOD_CODES = {"sad": -1, "normal": 0, "happy": 1}
+CODE_MOODS = {code: mood for mood, code in MOOD_CODES.items()}
+
+WEEKDAYS = ["월", "화", "수", "목", "금", "토", "일"]
+
+# 기간별 조회 일수
+PERIOD_DAYS = {"week": 7, "month": 30, "year": 365}
+
+MoodSeries = namedtuple("MoodSeries", ["days", "codes", "scores"])
+
+
+def to_day(date):
+    """YYYY-MM-DD 문자열을 1970-01-01 기준 일수(int)로 변환하는 함수"""
+    return int(np.datetime64(str(date)[:10], "D").astype(np.int64))
+
+
+def parse_date(value):
+    """
+    YYYY-MM-DD 날짜 문자열을 검사해 그대로 반환하는 함수 (형식이 틀리면 None)
+    """
+    try:
+        return datetime.strptime(str(value).strip()[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+
+def from_day(day):
+    return str(np.datetime64(int(day), "D"))
+
+
+def empty_series():
+    return MoodSeries(np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.float32))
+
+
+class MoodSeriesStore:
+    """
+    사용자별 일간 기분 시계열을 저장하는 클래스
+
+    사용자마다 날짜(int32 일수), 기분 코드(int8), 감정 점수(float32) 배열을
+    날짜순으로 정렬해 .npz 파일 하나로 저장한다. 몇 년치 기록도 수십 KB 이내이다.
+
+    앱, batch_diary, backfill 이 서로 다른 프로세스에서 같은 파일에 쓰므로
+    기록할 때는 사용자별 잠금 파일(flock)을 잡고 파일을 다시 읽은 뒤 합쳐서 저장한다.
+    조회할 때는 메모리의 시계열을 쓰되 파일 수정 시각/크기가 바뀌었으면 다시 읽는다.
+
+    Args:
+        root (str): 시계열 파일 저장 디렉터리
+    """
+    def __init__(self, root="mood_series"):
+        self.root = root
+        self._series = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        logger.info(f"MoodSeriesStore 초기화: {root}")
+
+    def _path(self, user_id):
+        safe_id = "".join(c for c in str(user_id) if c.isalnum() or c in "-_")
+        return os.path.join(self.root, f"{safe_id}.npz")
+
+    @contextmanager
+    def _file_lock(self, user_id):
+        """다른 프로세스와 같은 사용자 파일을 동시에 고치지 않도록 잡는 잠금"""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self._path(user_id)}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self, user_id):
+        """
+        사용자의 기분 시계열을 반환하는 메서드 (없으면 빈 시계열)
+        """
+        with self._lock:
+            return self._load_locked(str(user_id))
+
+    def _signature(self, user_id):
+        try:
+            stat = os.stat(self._path(user_id))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read(self, user_id):
+        path = self._path(user_id)
+        if not os.path.exists(path):
+            return empty_series()
+        with np.load(path) as data:
+            return MoodSeries(data["days"], data["codes"], data["scores"])
+
+    def _load_locked(self, user_id, fresh=False):
+        signature = self._signature(user_id)
+        cached = self._series.get(user_id)
+        if not fresh and cached is not None and cached[0] == signature:
+            return cached[1]
+        series = self._read(user_id)
+        self._series[user_id] = (signature, series)
+        return series
+
+    def record(self, user_id, date, mood, score=None):
+        """
+        하루의 기분을 기록하는 메서드 (같은 날짜가 있으면 덮어씀)
+
+        Args:
+            user_id (str): 사용자 ID
+            date (str): 날짜 (YYYY-MM-DD)
+            mood (str): happy/normal/sad
+            score (float, optional): 감정 점수(-1~1), 없으면 기분 코드를 그대로 사용
+        """
+        self.record_many(user_id, [(date, mood, score)])
+
+    def record_many(self, user_id, entries):
+        """
+        여러 날의 기분을 한 번에 기록하는 메서드
+
+        Args:
+            user_id (str): 사용자 ID
+            entries (list): (date, mood, score) 튜플 목록
+        """
+        if not entries:
+            return
+        user_id = str(user_id)
+        new_days = np.array([to_day(date) for date, _, _ in entries], dtype=np.int32)
+        new_codes = np.array([MOOD_CODES.get(mood, 0) for _, mood, _ in entries], dtype=np.int8)
+        new_scores = np.array(
+            [float(code) if score is None else score for (_, _, score), code in zip(entries, new_codes)],
+            dtype=np.float32
+        )
+        with self._lock, self._file_lock(user_id):
+            # 다른 프로세스가 쓴 기록을 지우지 않도록 잠금 안에서 파일 기준으로 다시 읽어 합침
+            series = self._load_locked(user_id, fresh=True)
+            # 새 기록이 우선하도록 뒤에 붙인 후 날짜별 마지막 값만 남김
+            days = np.concatenate([series.days, new_days])
+            codes = np.concatenate([series.codes, new_codes])
+            scores = np.concatenate([series.scores, new_scores])
+            order = np.argsort(days, kind="stable")
+            days, codes, scores = days[order], codes[order], scores[order]
+            keep = np.append(days[1:] != days[:-1], True)
+            series = MoodSeries(days[keep], codes[keep], scores[keep])
+
+            path = self._path(user_id)
+            tmp_path = f"{path}.tmp.npz"
+            np.savez(tmp_path, days=series.days, codes=series.codes, scores=series.scores)
+            os.replace(tmp_path, path)
+            self._series[user_id] = (self._signature(user_id), series)
+
+
+def slice_series(series, start_day, end_day):
+    """[start_day, end_day] 구간의 기록만 잘라내는 함수"""
+    lo = np.searchsorted(series.days, start_day, side="left")
+    hi = np.searchsorted(series.days, end_day, side="right")
+    return MoodSeries(series.days[lo:hi], series.codes[lo:hi], series.scores[lo:hi])
+
+
+def dense_scores(series, start_day, end_day):
+    """구간의 모든 날짜에 대해 점수 배열을 만드는 함수 (기록 없는 날은 NaN)"""
+    grid = np.full(end_day - start_day + 1, np.nan, dtype=np.float32)
+    grid[series.days - start_day] = series.scores
+    return grid
+
+
+def rolling_mean(grid, window=7):
+    """
+    NaN 을 건너뛰는 이동 평균을 계산하는 함수
+
+    누적합으로 계산하므로 구간 길이와 관계없이 O(n) 이다.
+    """
+    valid = ~np.isnan(grid)
+    values = np.where(valid, grid, 0.0)
+    csum = np.concatenate([[0.0], np.cumsum(values)])
+    ccount = np.concatenate([[0], np.cumsum(valid)])
+    idx = np.arange(1, len(grid) + 1)
+    lo = np.maximum(idx - window, 0)
+    sums = csum[idx] - csum[lo]
+    counts = ccount[idx] - ccount[lo]
+    return np.divide(sums, counts, out=np.full(len(grid), np.nan), where=counts > 0)
+
+
+def streaks(series, code):
+    """
+    특정 기분이 연속된 날 수를 계산하는 함수
+
+    기록이 없는 날이 끼면 연속이 끊긴 것으로 본다.
+
+    Returns:
+        dict: {"longest": 최장 연속 일수, "current": 마지막 기록 기준 현재 연속 일수}
+    """
+    if len(series.days) == 0:
+        return {"longest": 0, "current": 0}
+    match = series.codes == code
+    # 이전 기록과 하루 차이로 이어지고 기분이 같을 때만 연속
+    continues = np.concatenate([[False], (np.diff(series.days) == 1) & match[1:] & match[:-1]])
+    run_starts = match & ~continues
+    run_id = np.cumsum(run_starts)
+    run_lengths = np.bincount(run_id[match]) if match.any() else np.zeros(1, dtype=np.int64)
+    current = int(run_lengths[run_id[-1]]) if match[-1] else 0
+    return {"longest": int(run_lengths.max()), "current": current}
+
+
+def weekday_pattern(series):
+    """
+    요일별 평균 감정 점수와 기록 수를 계산하는 함수
+    """
+    # 1970-01-01 은 목요일(월=0 기준 3)
+    weekdays = (series.days.astype(np.int64) + 3) % 7
+    counts = np.bincount(weekdays, minlength=7)
+    sums = np.bincount(weekdays, weights=series.scores, minlength=7)
+    means = np.divide(sums, counts, out=np.full(7, np.nan), where=counts > 0)
+    return {
+        WEEKDAYS[i]: {"mean_score": None if np.isnan(means[i]) else round(float(means[i]), 3), "count": int(counts[i])}
+        for i in range(7)
+    }
+
+
+def monthly_summary(series):
+    """
+    월별 평균 감정 점수, 기분 분포와 전월 대비 변화량을 계산하는 함수
+    """
+    if len(series.days) == 0:
+        return []
+    months = series.days.astype("datetime64[D]").astype("datetime64[M]")
+    unique_months, month_idx = np.unique(months, return_inverse=True)
+    counts = np.bincount(month_idx)
+    means = np.bincount(month_idx, weights=series.scores) / counts
+    deltas = np.concatenate([[np.nan], np.diff(means)])
+    mood_counts = {
+        mood: np.bincount(month_idx, weights=(series.codes == code), minlength=len(unique_months))
+        for mood, code in MOOD_CODES.items()
+    }
+    return [
+        {
+            "month": str(unique_months[i]),
+            "mean_score": round(float(means[i]), 3),
+            "delta": None if np.isnan(deltas[i]) else round(float(deltas[i]), 3),
+            "days": int(counts[i]),
+            **{mood: int(mood_counts[mood][i]) for mood in MOOD_CODES}
+        }
+        for i in range(len(unique_months))
+    ]
+
+
+def trend_summary(series, period="month", end_date=None, window=7):
+    """
+    기간별 기분 추세 통계를 계산하는 함수
+
+    Args:
+        series (MoodSeries): 사용자 기분 시계열
+        period (str): week/month/year
+        end_date (str, optional): 기준일 (YYYY-MM-DD), 기본값은 오늘
+        window (int): 이동 평균 기간(일)
+
+    Returns:
+        dict: 추세 통계
+    """
+    end_day = to_day(end_date or datetime.now().strftime("%Y-%m-%d"))
+    start_day = end_day - PERIOD_DAYS.get(period, PERIOD_DAYS["month"]) + 1
+    window_series = slice_series(series, start_day, end_day)
+    grid = dense_scores(window_series, start_day, end_day)
+    rolling = rolling_mean(grid, window)
+
+    recorded = len(window_series.days)
+    distribution = {mood: int(np.count_nonzero(window_series.codes == code)) for mood, code in MOOD_CODES.items()}
+    return {
+        "period": period,
+        "start_date": from_day(start_day),
+        "end_date": from_day(end_day),
+        "recorded_days": recorded,
+        "mean_score": round(float(window_series.scores.mean()), 3) if recorded else None,
+        "distribution": distribution,
+        "rolling_mean": [None if np.isnan(v) else round(float(v), 3) for v in rolling],
+        "happy_streak": streaks(window_series, MOOD_CODES["happy"]),
+        "sad_streak": streaks(window_series, MOOD_CODES["sad"]),
+        "weekday_pattern": weekday_pattern(window_series),
+        "monthly": monthly_summary(window_series)
+    }
+
+
+def compact_stats_text(summary):
+    """
+    추세 통계를 주간 분석 프롬프트에 넣을 짧은 텍스트로 만드는 함수
+    """
+    if not summary or not summary["recorded_days"]:
+        return ""
+    dist = summary["distribution"]
+    lines = [
+        f"기간: {summary['start_date']} ~ {summary['end_date']} (기록 {summary['recorded_days']}일)",
+        f"평균 감정 점수: {summary['mean_score']:+.2f} (-1 부정 ~ +1 긍정)",
+        f"기분 분포: happy {dist['happy']}일, normal {dist['normal']}일, sad {dist['sad']}일",
+        f"연속 기록: 최근 happy {summary['happy_streak']['current']}일, sad {summary['sad_streak']['current']}일",
+    ]
+    weekday_means = {day: v["mean_score"] for day, v in summary["weekday_pattern"].items() if v["mean_score"] is not None}
+    if weekday_means:
+        best = max(weekday_means, key=weekday_means.get)
+        worst = min(weekday_means, key=weekday_means.get)
+        lines.append(f"요일 패턴: {best}요일이 가장 긍정적, {worst}요일이 가장 부정적")
+    if len(summary["monthly"]) >= 2 and summary["monthly"][-1]["delta"] is not None:
+        lines.append(f"전월 대비 감정 점수 변화: {summary['monthly'][-1]['delta']:+.2f}")
+    return "\n".join(lines)
+
+
+def weekly_trend_stats(store, user_id, weekly_data):
+    """
+    주간 분석 프롬프트에 넣을 최근 한 달 기분 추세 통계를 만드는 함수
+
+    week-status 와 사전 계산이 같은 캐시 키를 쓰도록 양쪽 모두 이 함수를 사용한다.
+    날짜 형식이 틀린 항목이 있거나 기록이 없으면 None 을 반환한다.
+    """
+    if not user_id or not weekly_data:
+        return None
+    dates = [parse_date(day.get("date")) for day in weekly_data]
+    if not all(dates):
+        logger.warning(f"주간 데이터 날짜 형식 오류, 기분 추세 생략 (사용자 {user_id})")
+        return None
+    return compact_stats_text(trend_summary(store.load(str(user_id)), "month", max(dates))) or None
+
+
+def backfill(store, input_path):
+    """
+    batch_diary 결과(JSONL)로 기분 시계열을 채우는 함수
+
+    일기 본문을 로컬 분류기로 일괄 재채점하여 점수를 함께 기록한다.
+
+    반환값:
+    - count: 기록한 일수
+    """
+    from mood_classifier import get_classifier
+
+    rows = []
+    with open(input_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                rows.append(json.loads(line))
+    results = get_classifier().classify_batch([row.get("diary") or "" for row in rows])
+
+    by_user = {}
+    for row, result in zip(rows, results):
+        by_user.setdefault(str(row["user_id"]), []).append((row["date"], row.get("mood", result.label), result.score))
+    for user_id, entries in by_user.items():
+        store.record_many(user_id, entries)
+    logger.info(f"기분 시계열 채우기 완료: 사용자 {len(by_user)}명, {len(rows)}일")
+    return len(rows)
+
+
+def main():
+    """메인 함수"""
+    setup_logging()
+    parser = argparse.ArgumentParser(description="하루니 기분 추세 도구")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="batch_diary 결과 파일로 기분 시계열 채우기")
+    backfill_parser.add_argument("input", nargs="+", help="batch_diary 결과 JSONL 파일")
+    report_parser = subparsers.add_parser("report", help="사용자 기분 추세 출력")
+    report_parser.add_argument("user_id")
+    report_parser.add_argument("--period", default="month", choices=sorted(PERIOD_DAYS))
+    report_parser.add_argument("--end-date", default=None)
+    args = parser.parse_args()
+
+    store = MoodSeriesStore(os.getenv("MOOD_SERIES_DIR", "mood_series"))
+    if args.command == "backfill":
+        for path in args.input:
+            backfill(store, path)
+    else:
+        summary = trend_summary(store.load(args.user_id), args.period, args.end_date)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
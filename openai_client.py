@@ -0,0 +1,282 @@
+import random
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+
+import openai
+from metrics import observe_llm_call
+
+logger = logging.getLogger("OpenAIClient")
+
+# 재시도할 HTTP 상태 코드 (5xx 는 별도로 처리)
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+class CircuitOpenError(Exception):
+    """회로 차단기가 열려 있어 호출을 보내지 않았을 때 발생하는 예외"""
+
+
+class DeadlineExceededError(Exception):
+    """재시도를 포함한 전체 호출 시간이 deadline 을 넘었을 때 발생하는 예외"""
+
+
+def is_retryable(error):
+    """재시도하면 성공할 수 있는 오류인지 판단하는 함수"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error):
+    """
+    오류 응답의 Retry-After(또는 retry-after-ms) 헤더를 초 단위로 반환하는 함수
+
+    반환값:
+    - seconds: 대기 시간(초), 헤더가 없으면 None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class CircuitBreaker:
+    """
+    연속 실패가 threshold 에 도달하면 reset_timeout 동안 호출을 차단하는 회로 차단기
+
+    reset_timeout 이 지나면 한 번의 시험 호출(half-open)을 허용하고,
+    성공하면 닫히고 실패하면 다시 열린다.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self._state_locked()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """상태는 그대로 두고 half-open 시험 호출 자리만 돌려주는 메서드 (서버 상태와 무관한 오류일 때)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"회로 차단기 열림: 연속 실패 {self._failures}회")
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """최근 호출 지연 시간을 보관하고 백분위수를 계산하는 클래스"""
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class ResilientOpenAI:
+    """
+    openai.OpenAI 클라이언트에 타임아웃, 재시도, 회로 차단기, 헤지 요청을 더한 래퍼
+
+    create_diary 의 client 와 같은 인터페이스(chat.completions.create, images.generate)를 제공한다.
+    내부 클라이언트는 max_retries=0 으로 만들어 재시도를 이 래퍼에서만 하도록 한다.
+
+    Args:
+        client (openai.OpenAI): 실제 요청을 보낼 클라이언트
+        chat_deadline (float): 채팅 호출 전체(재시도 포함) 제한 시간(초)
+        image_deadline (float): 이미지 생성 호출 전체 제한 시간(초)
+        attempt_timeout (float): 요청 한 번의 제한 시간(초)
+        max_retries (int): 최대 재시도 횟수
+        base_delay (float): 지수 백오프 시작 대기 시간(초)
+        max_delay (float): 백오프 최대 대기 시간(초)
+        failure_threshold (int): 회로 차단기가 열리는 연속 실패 횟수
+        reset_timeout (float): 회로 차단기가 열려 있는 시간(초)
+        hedge (bool): True 이면 첫 요청이 지연 백분위수를 넘길 때 두 번째 요청을 보냄 (채팅만)
+        hedge_percentile (float): 헤지 요청 기준 백분위수 (0~1)
+        hedge_min_samples (int): 헤지를 시작하기 위한 최소 지연 시간 표본 수
+        hedge_workers (int): 헤지 대상 첫 요청을 동시에 보낼 수 있는 최대 수 (넘으면 헤지 없이 호출)
+        hedge_max_in_flight (int): 동시에 진행할 수 있는 헤지 요청 수 (넘으면 헤지 요청을 보내지 않음)
+    """
+    def __init__(self, client, chat_deadline=60.0, image_deadline=120.0, attempt_timeout=45.0,
+                 max_retries=4, base_delay=1.0, max_delay=20.0, failure_threshold=5, reset_timeout=30.0,
+                 hedge=False, hedge_percentile=0.95, hedge_min_samples=20, hedge_workers=16, hedge_max_in_flight=4):
+        self._client = client
+        self.chat_deadline = chat_deadline
+        self.image_deadline = image_deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = {"chat": LatencyTracker(), "image": LatencyTracker()}
+        # 첫 요청과 헤지 요청은 서로 다른 풀에서 실행하고, 빈 자리가 없으면 큐에 넣지 않고 건너뜀
+        # (헤지 요청이 첫 요청 뒤에 줄을 서거나, 첫 요청이 헤지 요청 뒤에 줄을 서지 않도록)
+        self._primary_slots = threading.BoundedSemaphore(hedge_workers) if hedge else None
+        self._hedge_slots = threading.BoundedSemaphore(hedge_max_in_flight) if hedge else None
+        self._primary_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="openai-primary") if hedge else None
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_max_in_flight, thread_name_prefix="openai-hedge") if hedge else None
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+        self.images = SimpleNamespace(generate=self._images_generate)
+        logger.info(f"ResilientOpenAI 초기화 (hedge={hedge})")
+
+    def _chat_create(self, **kwargs):
+        return self._call("chat", self._client.chat.completions.create, kwargs, self.chat_deadline, self.hedge)
+
+    def _images_generate(self, **kwargs):
+        # 이미지 생성은 비용이 커서 헤지 요청을 보내지 않음
+        return self._call("image", self._client.images.generate, kwargs, self.image_deadline, False)
+
+    def _call(self, kind, fn, kwargs, deadline, hedge):
+        deadline_at = time.monotonic() + deadline
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceededError(f"OpenAI {kind} 호출 제한 시간 {deadline:.0f}초 초과")
+            timeout = min(self.attempt_timeout, remaining)
+
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"OpenAI {kind} 호출 차단됨 (회로 차단기 열림)")
+
+            start = time.monotonic()
+            try:
+                if hedge:
+                    result = self._hedged(kind, fn, kwargs, timeout)
+                else:
+                    result = fn(timeout=timeout, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # 4xx 등 요청 자체의 문제는 서버 상태를 알려주지 않으므로 차단기 상태를 바꾸지 않음
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                if time.monotonic() + delay >= deadline_at:
+                    logger.warning(f"OpenAI {kind} 재시도 중단: 남은 시간 부족")
+                    raise
+                logger.warning(f"OpenAI {kind} 호출 실패 ({type(e).__name__}), {delay:.1f}초 후 재시도 ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+                continue
+
+            elapsed = time.monotonic() - start
+            self.breaker.record_success()
+            self.latency[kind].add(elapsed)
+            observe_llm_call(f"openai_{kind}", elapsed)
+            return result
+
+    def _backoff_delay(self, attempt, error):
+        # 서버가 알려준 대기 시간이 있으면 우선, 없으면 full jitter 지수 백오프
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay * 3)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def _submit(executor, slots, fn, timeout, kwargs):
+        future = executor.submit(fn, timeout=timeout, **kwargs)
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def _hedged(self, kind, fn, kwargs, timeout):
+        """
+        첫 요청이 지연 백분위수 안에 끝나지 않으면 같은 요청을 하나 더 보내고
+        먼저 성공한 응답을 사용하는 메서드
+
+        첫 요청/헤지 요청 자리가 모두 차 있으면 기다리지 않고 헤지 없이 호출한다.
+        """
+        tracker = self.latency[kind]
+        hedge_after = tracker.percentile(self.hedge_percentile) if len(tracker) >= self.hedge_min_samples else None
+        if hedge_after is None or hedge_after >= timeout or not self._primary_slots.acquire(blocking=False):
+            return fn(timeout=timeout, **kwargs)
+        first = self._submit(self._primary_executor, self._primary_slots, fn, timeout, kwargs)
+
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+
+        if not self._hedge_slots.acquire(blocking=False):
+            logger.info(f"OpenAI {kind} 헤지 요청 생략 (진행 중인 헤지 요청이 가득 참)")
+            return first.result()
+        logger.info(f"OpenAI {kind} 헤지 요청 전송 ({hedge_after:.2f}초 초과)")
+        second = self._submit(self._hedge_executor, self._hedge_slots, fn, timeout, kwargs)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
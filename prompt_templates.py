@@ -0,0 +1,290 @@
+import json
+import os
+import logging
+from logging_setup import setup_logging
+from tokens import estimate_tokens, message_text, truncate_to_tokens
+
+logger = logging.getLogger("PromptTemplates")
+
+# ResponseAgent 시스템 프롬프트 템플릿
+# MBTI 별 페르소나 블록은 모듈을 불러올 때 한 번만 문장 형식으로 만들어 두고, 요청마다 이어 붙이기만 한다.
+
+# 시스템 프롬프트 + DB 정보 + 히스토리 + 현재 메시지의 최대 추정 토큰 수 (4K 컨텍스트에서 생성 여유분 제외)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+
+# 유저 정보 블록의 최대 추정 토큰 수
+USER_INFO_MAX_TOKENS = int(os.getenv("PROMPT_USER_INFO_MAX_TOKENS", "200"))
+
+# 히스토리를 줄여도 남겨 둘 최근 메시지 수
+MIN_HISTORY_MESSAGES = 2
+
+DEFAULT_MBTI = "DEFAULT"
+
+mbti_chat_guide = {
+    "INTJ": {
+        "대화스타일": "목표 지향적, 직설적인 언어 사용",
+        "말투": "간결하고 논리적, 중립적 톤",
+        "관심사": "체계, 미래 전략, 시스템, 통찰",
+        "갈등시반응": "감정 표현 최소화, 해결책 중심 대응",
+        "듣기태도": "실용적인 정보 위주로 선택적 청취"
+    },
+    "INTP": {
+        "대화스타일": "아이디어 탐색형, 주제 이탈 가능",
+        "말투": "중간에 뜸 들이거나 말수 적음",
+        "관심사": "개념, 가능성, 지식 체계",
+        "갈등시반응": "논리적 대응, 회피 경향",
+        "듣기태도": "새로운 아이디어에 반응, 감정적 요소엔 무심"
+    },
+    "ENTJ": {
+        "대화스타일": "주도적, 자기 주장 강함",
+        "말투": "단호하고 확신에 찬 어조",
+        "관심사": "조직화, 생산성, 리더십",
+        "갈등시반응": "논리로 압박, 감정적 접근 무시",
+        "듣기태도": "실질적 개선 제안 위주 청취"
+    },
+    "ENTP": {
+        "대화스타일": "유쾌하고 도전적, 아이디어 폭풍형",
+        "말투": "재치 있고 에너지 넘침",
+        "관심사": "창의성, 논쟁, 가능성 탐색",
+        "갈등시반응": "토론하듯 설득, 감정은 부차적",
+        "듣기태도": "즉흥적으로 맞춰가며 반응 관찰"
+    },
+    "INFJ": {
+        "대화스타일": "깊고 의미 있는 이야기 선호",
+        "말투": "차분하고 성찰적인 어조",
+        "관심사": "가치관, 관계의 본질",
+        "갈등시반응": "거리를 두고 관찰, 나중에 표현",
+        "듣기태도": "비언어적 신호까지 민감하게 감지"
+    },
+    "INFP": {
+        "대화스타일": "조용하지만 감성적, 시적인 표현 사용",
+        "말투": "내면을 반영한 부드러운 말투",
+        "관심사": "자아, 이상, 진정성, 예술",
+        "갈등시반응": "충돌 회피, 깊은 상처 가능",
+        "듣기태도": "감정에 민감, 진심으로 경청"
+    },
+    "ENFJ": {
+        "대화스타일": "타인의 감정을 살피며 리드",
+        "말투": "따뜻하고 설득력 있음",
+        "관심사": "조화, 공동체, 성장",
+        "갈등시반응": "먼저 화해 시도, 관계 우선",
+        "듣기태도": "상대 감정을 세심하게 포착"
+    },
+    "ENFP": {
+        "대화스타일": "열정적, 감정과 공감 중심",
+        "말투": "리액션 큼, 감탄사 풍부",
+        "관심사": "다양성, 가치, 사람",
+        "갈등시반응": "감정적이지만 빨리 회복",
+        "듣기태도": "깊은 공감력으로 경청"
+    },
+    "ISTJ": {
+        "대화스타일": "사실 중심, 논리적 설명 선호",
+        "말투": "단순하고 딱 부러짐",
+        "관심사": "의무, 규칙, 전통",
+        "갈등시반응": "원칙 중시, 감정보다 논리 강조",
+        "듣기태도": "요점 중심, 불필요한 말은 무시"
+    },
+    "ISFJ": {
+        "대화스타일": "조용하면서도 친절함",
+        "말투": "예의 바르고 배려 깊음",
+        "관심사": "봉사, 가족, 안정",
+        "갈등시반응": "회피, 마음속으로 상처",
+        "듣기태도": "상대 기분을 세심하게 고려"
+    },
+    "ESTJ": {
+        "대화스타일": "지시적, 해결책 중심",
+        "말투": "명확하고 직설적",
+        "관심사": "질서, 책임, 실행",
+        "갈등시반응": "정면 돌파, 논쟁 불사",
+        "듣기태도": "효율 중심 정보에만 반응"
+    },
+    "ESFJ": {
+        "대화스타일": "사교적, 감정 고려형",
+        "말투": "친근하고 따뜻한 어조",
+        "관심사": "기대 충족, 관계 유지",
+        "갈등시반응": "오해에 민감, 감정적으로 반응",
+        "듣기태도": "정서적 교류에 집중"
+    },
+    "ISTP": {
+        "대화스타일": "실용적, 간결함 중시",
+        "말투": "직설적, 불필요한 말 없음",
+        "관심사": "기계, 구조, 분석",
+        "갈등시반응": "감정 억제, 거리두기",
+        "듣기태도": "필요한 정보에만 집중"
+    },
+    "ISFP": {
+        "대화스타일": "조용하고 섬세한 표현 선호",
+        "말투": "부드럽고 감각적",
+        "관심사": "아름다움, 가치, 개인의 자유",
+        "갈등시반응": "회피, 침묵, 내면화",
+        "듣기태도": "감정의 흐름에 맞춰 경청"
+    },
+    "ESTP": {
+        "대화스타일": "직관적, 즉흥적, 유쾌한 접근",
+        "말투": "직접적이고 에너지 넘침",
+        "관심사": "자극, 행동, 경험",
+        "갈등시반응": "정면돌파 또는 농담으로 넘김",
+        "듣기태도": "흥미 위주로 선택적 경청"
+    },
+    "ESFP": {
+        "대화스타일": "감정적이고 활발, 사람 중심",
+        "말투": "감탄사와 리액션 많음",
+        "관심사": "즐거움, 감정 공유, 사람",
+        "갈등시반응": "감정적으로 격해지나 금방 풀림",
+        "듣기태도": "정서적 연결 중심으로 경청"
+    }
+}
+
+# MBTI 를 모르거나 잘못된 값일 때 사용할 무난한 대화 특성
+DEFAULT_CHAT_GUIDE = {
+    "대화스타일": "편안하고 자연스러운 대화",
+    "말투": "다정하고 부드러운 어조",
+    "관심사": "일상, 감정, 하루의 경험",
+    "갈등시반응": "공감 먼저, 차분하게 대응",
+    "듣기태도": "끝까지 들어주며 감정에 공감"
+}
+
+GUIDE_LABELS = {
+    "대화스타일": "대화 스타일",
+    "말투": "말투",
+    "관심사": "관심사",
+    "갈등시반응": "갈등 시 반응",
+    "듣기태도": "듣기 태도"
+}
+
+SYSTEM_HEADER = """너는 대화 어시스턴트야.
+너는 항상 유저의 일상을 궁금해하며 이야기를 잘 들어줘야해.
+또한, 대화가 끊이지 않게 계속해서 후속 질문을 해야해.
+단, 말이 너무 길어지지 않도록 주의해. 가능한 3문장을 넘어서지 마."""
+
+SYSTEM_FOOTER = """너의 특성은 다음과 같아. 이를 반영해서 답변 하도록 해.
+- 이름은 '하루'야. 단, 사용자가 물어보지 않는한 너의 이름을 소개할 필요는 없어.
+- 상대방의 감정과 관심에 주의를 기울여서 답변하도록 해.
+- 대화 상대의 감정에 따라 적절한 반응하도록 해.
+- 긍정적인 감정 표현을 자주 하도록 해.
+- AI라는 것을 절대 티내지마.
+- 한번의 대화에서 질문은 한가지만 하도록 하고, 말이 너무 길어지지 않도록 해.
+- 과거와 현재를 명확하게 구분해서 답변하도록 해.
+
+이 대화를 통해 유저의 일기를 작성하는 것이 목표야.
+따라서, 일기를 작성해기 위해 필요한 정보들을 유저로부터 이끌어내야해.
+그러기 위해서 적절한 질문을 통해 유저가 일상에서 겪은 일들을 궁금해하며, 어떤 기분이었는지를 알아내야해."""
+
+
+def compile_persona(guide):
+    """MBTI 대화 특성 딕셔너리를 "- 항목: 내용" 형식의 문장 블록으로 만드는 함수"""
+    lines = [f"- {GUIDE_LABELS.get(key, key)}: {value}" for key, value in guide.items()]
+    return "유저의 대화 특성은 다음과 같아. 이를 잘 고려해서 답변 하도록 해.\n" + "\n".join(lines)
+
+
+# 모듈을 불러올 때 한 번만 만드는 페르소나 블록과 토큰 수
+PERSONA_BLOCKS = {mbti: compile_persona(guide) for mbti, guide in mbti_chat_guide.items()}
+PERSONA_BLOCKS[DEFAULT_MBTI] = compile_persona(DEFAULT_CHAT_GUIDE)
+PERSONA_TOKENS = {mbti: estimate_tokens(block) for mbti, block in PERSONA_BLOCKS.items()}
+BASE_TOKENS = estimate_tokens(SYSTEM_HEADER) + estimate_tokens(SYSTEM_FOOTER)
+
+
+def normalize_mbti(user_mbti):
+    """대소문자/공백을 정리하고, 알 수 없는 값이면 DEFAULT 를 반환하는 함수"""
+    mbti = str(user_mbti or "").strip().upper()
+    if mbti not in mbti_chat_guide:
+        if user_mbti:
+            logger.warning(f"알 수 없는 MBTI: {user_mbti} - 기본 대화 특성 사용")
+        return DEFAULT_MBTI
+    return mbti
+
+
+def render_user_info(user_info):
+    """유저 정보를 "항목: 값" 줄로 정리하고 토큰 한도로 자르는 함수"""
+    if not user_info:
+        return "(정보 없음)"
+    if isinstance(user_info, dict):
+        text = "\n".join(f"- {key}: {value}" for key, value in user_info.items() if value not in (None, ""))
+    elif isinstance(user_info, (list, tuple)):
+        text = "\n".join(f"- {item}" for item in user_info)
+    else:
+        text = str(user_info).strip()
+    return truncate_to_tokens(text, USER_INFO_MAX_TOKENS)
+
+
+def build_system_msg(user_info, user_mbti):
+    """미리 만든 블록을 이어 붙여 ResponseAgent 시스템 프롬프트를 만드는 함수"""
+    persona = PERSONA_BLOCKS[normalize_mbti(user_mbti)]
+    return f"{SYSTEM_HEADER}\n\n유저 정보:\n{render_user_info(user_info)}\n\n{persona}\n\n{SYSTEM_FOOTER}"
+
+
+def _message_tokens(message):
+    # 메시지마다 role/구분자 몫으로 4토큰을 더함
+    return estimate_tokens(message_text(message)) + 4
+
+
+def fit_to_budget(system_msg, user_message, db_context=None, history=None, budget=PROMPT_TOKEN_BUDGET):
+    """
+    조립한 프롬프트가 예산 안에 들어오도록 히스토리와 DB 정보를 줄이는 함수
+
+    1. 오래된 히스토리부터 제거 (최근 MIN_HISTORY_MESSAGES 개는 유지)
+    2. 그래도 넘치면 DB 정보를 남은 예산만큼 자름
+    3. 그래도 넘치면 남은 히스토리도 제거
+
+    반환값:
+    - db_context: 줄인 DB 정보 (없으면 None)
+    - history: 줄인 히스토리 (원본 리스트를 바꾸지 않음)
+    - usage: {"system", "db_context", "history", "message", "total", "budget", "trimmed"} 토큰 수 딕셔너리
+    """
+    history = list(history or [])
+    fixed = estimate_tokens(system_msg) + estimate_tokens(user_message)
+    db_tokens = estimate_tokens(db_context) if db_context else 0
+    history_tokens = [_message_tokens(message) for message in history]
+    trimmed = []
+
+    def total():
+        return fixed + db_tokens + sum(history_tokens)
+
+    while total() > budget and len(history) > MIN_HISTORY_MESSAGES:
+        history.pop(0)
+        history_tokens.pop(0)
+        if "history" not in trimmed:
+            trimmed.append("history")
+
+    if total() > budget and db_context:
+        # 잘린 표시("...")가 차지할 토큰 1개를 남겨 둠
+        available = max(0, budget - fixed - sum(history_tokens) - 1)
+        db_context = truncate_to_tokens(db_context, available)
+        db_tokens = estimate_tokens(db_context)
+        trimmed.append("db_context")
+
+    if total() > budget and history:
+        history, history_tokens = [], []
+        if "history" not in trimmed:
+            trimmed.append("history")
+
+    usage = {
+        "system": estimate_tokens(system_msg),
+        "db_context": db_tokens,
+        "history": sum(history_tokens),
+        "message": estimate_tokens(user_message),
+        "total": total(),
+        "budget": budget,
+        "trimmed": trimmed
+    }
+    if trimmed:
+        logger.warning(f"프롬프트 예산 초과로 축소: {', '.join(trimmed)} (약 {usage['total']}/{budget}토큰)")
+    return db_context, history, usage
+
+
+def template_report():
+    """템플릿별 추정 토큰 수를 반환하는 함수 (유저 정보/DB 정보/히스토리 제외)"""
+    return {
+        "base": BASE_TOKENS,
+        "personas": {mbti: BASE_TOKENS + tokens for mbti, tokens in PERSONA_TOKENS.items()},
+        "user_info_max": USER_INFO_MAX_TOKENS,
+        "budget": PROMPT_TOKEN_BUDGET
+    }
+
+
+logger.info(f"프롬프트 템플릿 준비: 페르소나 {len(PERSONA_BLOCKS)}개, 시스템 프롬프트 약 {BASE_TOKENS + max(PERSONA_TOKENS.values())}토큰 이하")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    print(json.dumps(template_report(), ensure_ascii=False, indent=2))
@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import threading
+import time
+import logging
+from collections import defaultdict
+from types import SimpleNamespace
+
+import numpy as np
+from cache_store import stable_hash
+from metrics import count_cache, current_stage
+from logging_setup import setup_logging
+
+logger = logging.getLogger("Replay")
+
+# LLM/OpenAI 호출 기록 및 재생
+# - live: 기록하지 않음 (기본값)
+# - record: 실제 호출 결과를 HARUNI_REPLAY_PATH 에 한 줄씩 추가
+# - replay: 실제 호출 없이 기록된 응답을 프롬프트 해시로 찾아 돌려줌
+LLM_MODE = os.getenv("HARUNI_LLM_MODE", "live")
+REPLAY_PATH = os.getenv("HARUNI_REPLAY_PATH", os.path.join("replay", "llm_calls.jsonl"))
+
+# True 이면 재생 시 기록된 호출 시간만큼 기다림 (성능 측정용)
+REPLAY_LATENCY = os.getenv("HARUNI_REPLAY_LATENCY") == "1"
+
+
+class ReplayMissError(KeyError):
+    """재생 모드에서 기록되지 않은 프롬프트가 들어왔을 때 발생하는 예외"""
+
+
+def llm_key(model_id, system_message, msg, msg_history):
+    return stable_hash(["llm", model_id, system_message, msg, msg_history or []])
+
+
+def openai_key(kind, kwargs):
+    return stable_hash(["openai", kind, kwargs])
+
+
+class ReplayLog:
+    """
+    프롬프트 해시를 키로 호출 결과를 JSONL 로 기록하고 재생하는 클래스
+
+    프롬프트 원문은 저장하지 않고 해시와 길이만 남겨 로그를 작게 유지한다.
+    같은 프롬프트가 여러 번 기록되면 재생할 때도 기록된 순서대로 돌려준다.
+
+    Args:
+        path (str): 기록 파일 경로
+        mode (str): "record" 또는 "replay"
+        simulate_latency (bool): 재생 시 기록된 호출 시간만큼 대기할지 여부
+    """
+    def __init__(self, path=REPLAY_PATH, mode="replay", simulate_latency=REPLAY_LATENCY):
+        self.path = path
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+        self._entries = defaultdict(list)
+        self._cursor = defaultdict(int)
+        self._lock = threading.Lock()
+        if mode == "replay":
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        logger.info(f"ReplayLog 초기화: {path} ({mode}, {sum(len(v) for v in self._entries.values())}건)")
+
+    def _load(self):
+        for entry in iter_entries(self.path):
+            self._entries[entry["key"]].append(entry)
+
+    def record(self, key, kind, backend, response, elapsed, prompt_chars, usage=None):
+        entry = {
+            "key": key,
+            "kind": kind,
+            "backend": backend,
+            "agent": current_stage(),
+            "prompt_chars": prompt_chars,
+            "response_chars": len(response) if isinstance(response, str) else None,
+            "elapsed": round(elapsed, 4),
+            "usage": usage,
+            "response": response
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def lookup(self, key):
+        """
+        기록된 응답을 반환하는 메서드 (없으면 ReplayMissError)
+        """
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                count_cache("replay", False)
+                raise ReplayMissError(f"기록되지 않은 호출: {key[:12]}")
+            # 같은 프롬프트는 기록된 순서대로, 다 쓰면 마지막 응답을 반복
+            index = min(self._cursor[key], len(entries) - 1)
+            self._cursor[key] += 1
+        count_cache("replay", True)
+        entry = entries[index]
+        if self.simulate_latency and entry.get("elapsed"):
+            time.sleep(entry["elapsed"])
+        return entry
+
+
+_replay_log = None
+_replay_lock = threading.Lock()
+
+
+def get_replay_log():
+    """
+    HARUNI_LLM_MODE 가 record/replay 이면 공유 ReplayLog 를, live 이면 None 을 반환하는 함수
+    """
+    global _replay_log
+    if LLM_MODE not in ("record", "replay"):
+        return None
+    with _replay_lock:
+        if _replay_log is None:
+            _replay_log = ReplayLog(REPLAY_PATH, LLM_MODE)
+        return _replay_log
+
+
+class ReplayOpenAI:
+    """
+    create_diary 의 OpenAI 클라이언트를 감싸 호출을 기록/재생하는 래퍼
+
+    chat.completions.create 는 응답 내용과 usage 를, images.generate 는 이미지 URL 을 기록한다.
+    재생 모드에서는 client 없이(None) 사용할 수 있다.
+    """
+    def __init__(self, client, log):
+        self._client = client
+        self.log = log
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+        self.images = SimpleNamespace(generate=self._images_generate)
+
+    def _chat_create(self, **kwargs):
+        key = openai_key("chat", kwargs)
+        if self.log.mode == "replay":
+            entry = self.log.lookup(key)
+            usage = SimpleNamespace(**(entry.get("usage") or {}))
+            message = SimpleNamespace(role="assistant", content=entry["response"])
+            return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")], usage=usage)
+
+        start = time.perf_counter()
+        response = self._client.chat.completions.create(**kwargs)
+        usage = getattr(response, "usage", None)
+        usage = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None)
+        } if usage is not None else None
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in kwargs.get("messages", []))
+        self.log.record(key, "openai_chat", kwargs.get("model"), response.choices[0].message.content,
+                        time.perf_counter() - start, prompt_chars, usage)
+        return response
+
+    def _images_generate(self, **kwargs):
+        key = openai_key("image", kwargs)
+        if self.log.mode == "replay":
+            entry = self.log.lookup(key)
+            return SimpleNamespace(created=int(time.time()), data=[SimpleNamespace(url=url) for url in entry["response"]])
+
+        start = time.perf_counter()
+        response = self._client.images.generate(**kwargs)
+        urls = [d.url for d in response.data]
+        self.log.record(key, "openai_image", kwargs.get("model"), urls,
+                        time.perf_counter() - start, len(kwargs.get("prompt", "")))
+        return response
+
+
+def wrap_openai(client):
+    """기록/재생 모드이면 client 를 ReplayOpenAI 로 감싸서 반환하는 함수"""
+    log = get_replay_log()
+    if log is None:
+        return client
+    logger.info(f"OpenAI 호출 {log.mode} 모드")
+    return ReplayOpenAI(client, log)
+
+
+def iter_entries(path):
+    if not os.path.exists(path):
+        logger.warning(f"기록 파일 없음: {path}")
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def summarize(path):
+    """
+    기록 파일의 호출 종류/에이전트별 건수, 길이와 시간 분포를 계산하는 함수
+
+    반환값:
+    - stats: {"kind/agent": {"calls", "unique_prompts", "prompt_chars", "response_chars", "elapsed", ...}} 딕셔너리
+      분포 항목은 {"p50", "p90", "p99", "max"} 형식, OpenAI 호출은 usage 의 토큰 수 분포도 포함
+    """
+    fields = ("prompt_chars", "response_chars", "prompt_tokens", "completion_tokens", "elapsed")
+    groups = defaultdict(lambda: {"keys": set(), **{field: [] for field in fields}})
+    for entry in iter_entries(path):
+        group = groups[f"{entry['kind']}/{entry.get('agent') or 'unknown'}"]
+        group["keys"].add(entry["key"])
+        values = {**(entry.get("usage") or {}), **entry}
+        for field in fields:
+            if values.get(field) is not None:
+                group[field].append(values[field])
+
+    def distribution(values):
+        if not values:
+            return None
+        p50, p90, p99 = np.percentile(np.asarray(values, dtype=np.float64), [50, 90, 99])
+        return {"p50": round(float(p50), 3), "p90": round(float(p90), 3), "p99": round(float(p99), 3), "max": max(values)}
+
+    stats = {}
+    for name, group in sorted(groups.items()):
+        stats[name] = {
+            "calls": len(group["elapsed"]),
+            "unique_prompts": len(group["keys"]),
+            **{field: distribution(group[field]) for field in fields if group[field]}
+        }
+    return stats
+
+
+def main():
+    setup_logging()
+    parser = argparse.ArgumentParser(description="LLM/OpenAI 호출 기록 통계")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stats_parser = subparsers.add_parser("stats", help="기록 파일의 호출 수와 길이/시간 분포 출력")
+    stats_parser.add_argument("--path", default=REPLAY_PATH, help="기록 파일 경로")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(summarize(args.path), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
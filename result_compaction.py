@@ -0,0 +1,238 @@
+import json
+import os
+import logging
+from collections import OrderedDict
+from tokens import estimate_tokens
+
+logger = logging.getLogger("ResultCompaction")
+
+# LLM 이 만든 SQL 의 결과를 프롬프트에 넣기 전에 크기를 제한/압축하는 도구
+
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "200"))
+QUERY_MAX_BYTES = int(os.getenv("QUERY_MAX_BYTES", str(64 * 1024)))
+QUERY_FETCH_BATCH = int(os.getenv("QUERY_FETCH_BATCH", "50"))
+QUERY_TOKEN_BUDGET = int(os.getenv("QUERY_TOKEN_BUDGET", "1500"))
+
+# 긴 문자열 컬럼을 자를 길이 (글자 수)
+TEXT_MAX_CHARS = int(os.getenv("QUERY_TEXT_MAX_CHARS", "120"))
+
+# 프롬프트에 필요 없는 컬럼 (식별자, 이미지 URL, 개인정보 등)
+DROP_COLUMNS = frozenset(
+    c.strip() for c in os.getenv("QUERY_DROP_COLUMNS", "id,chat_id,diary_id,password,email,image_url,created_at,updated_at").split(",") if c.strip()
+)
+
+# 날짜별 요약에 사용할 날짜 컬럼 후보
+DATE_COLUMNS = ("sending_date", "date", "diary_date", "created_date")
+
+# 날짜 안에서 정렬에 사용할 시간 컬럼 후보
+TIME_COLUMNS = ("sending_time", "time")
+
+
+def _row_bytes(row):
+    return len(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def fetch_bounded(cursor, max_rows=QUERY_MAX_ROWS, max_bytes=QUERY_MAX_BYTES, batch_size=QUERY_FETCH_BATCH):
+    """
+    fetchmany 로 결과를 나눠 읽고 행 수/바이트 한도에서 멈추는 함수
+
+    반환값:
+    - rows: 읽은 행 목록
+    - truncated: 한도 때문에 읽기를 멈췄으면 True
+    """
+    rows = []
+    total_bytes = 0
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return rows, False
+        for row in batch:
+            total_bytes += _row_bytes(row)
+            if len(rows) >= max_rows or total_bytes > max_bytes:
+                logger.warning(f"쿼리 결과 한도 도달: {len(rows)}행, {total_bytes}바이트")
+                return rows, True
+            rows.append(row)
+
+
+def project_columns(rows):
+    """
+    불필요한 컬럼을 빼고, 모든 행에서 값이 같은 컬럼은 한 번만 남기는 함수
+
+    반환값:
+    - rows: 컬럼을 줄인 행 목록
+    - common: 모든 행에 공통인 컬럼 값 딕셔너리
+    """
+    if not rows:
+        return rows, {}
+    columns = [c for c in rows[0].keys() if c not in DROP_COLUMNS]
+    common = {}
+    if len(rows) > 1:
+        for column in columns:
+            first = rows[0].get(column)
+            if all(row.get(column) == first for row in rows):
+                common[column] = first
+    keep = [c for c in columns if c not in common]
+    return [{c: row.get(c) for c in keep} for row in rows], common
+
+
+def _shorten(value, max_chars):
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + "..."
+    return value
+
+
+def _summarize_by_day(rows, date_column, max_chars):
+    days = OrderedDict()
+    for row in rows:
+        day = str(row.get(date_column))
+        summary = days.setdefault(day, {date_column: day, "count": 0, "samples": []})
+        summary["count"] += 1
+        if len(summary["samples"]) < 2:
+            sample = {k: _shorten(v, max_chars) for k, v in row.items() if k != date_column and isinstance(v, str)}
+            summary["samples"].append(sample)
+    return list(days.values())
+
+
+def _render(payload):
+    return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def compact_results(rows, truncated=False, token_budget=QUERY_TOKEN_BUDGET):
+    """
+    쿼리 결과를 토큰 예산 안에 들어오도록 단계적으로 줄여 JSON 문자열로 반환하는 함수
+
+    1. 불필요/공통 컬럼 제거
+    2. 긴 문자열 컬럼 자르기
+    3. 날짜 컬럼이 있으면 날짜별 건수와 예시 2개로 요약
+    4. 그래도 넘치면 뒤쪽 행을 버리고 버린 행 수를 기록
+
+    Args:
+        rows (list): dictionary 커서로 읽은 행 목록
+        truncated (bool): fetch_bounded 에서 한도로 잘렸는지 여부
+        token_budget (int): 결과 JSON 의 최대 추정 토큰 수
+
+    Returns:
+        str: {"rows": [...], "common": {...}, "omitted_rows": n, "note": "..."} 형식의 JSON 문자열
+    """
+    rows, common = project_columns(rows)
+    payload = {"rows": rows}
+    if common:
+        payload["common"] = common
+    notes = []
+    if truncated:
+        notes.append(f"결과가 많아 앞의 {len(rows)}행만 읽었습니다.")
+
+    def finish(stage):
+        if notes:
+            payload["note"] = " ".join(notes)
+        rendered = _render(payload)
+        logger.info(f"쿼리 결과 압축: {stage}, {len(payload['rows'])}행, 약 {estimate_tokens(rendered)}토큰")
+        return rendered
+
+    if estimate_tokens(_render(payload)) <= token_budget:
+        return finish("원본")
+
+    payload["rows"] = [{k: _shorten(v, TEXT_MAX_CHARS) for k, v in row.items()} for row in rows]
+    if common:
+        payload["common"] = {k: _shorten(v, TEXT_MAX_CHARS) for k, v in common.items()}
+    notes.append(f"긴 문자열은 {TEXT_MAX_CHARS}자로 잘랐습니다.")
+    if estimate_tokens(_render(payload)) <= token_budget:
+        return finish("문자열 자르기")
+
+    date_column = next((c for c in DATE_COLUMNS if rows and c in rows[0]), None)
+    if date_column:
+        payload["rows"] = _summarize_by_day(rows, date_column, TEXT_MAX_CHARS // 2)
+        notes.append(f"{date_column} 기준 날짜별 건수와 예시로 요약했습니다.")
+        if estimate_tokens(_render(payload)) <= token_budget:
+            return finish("날짜별 요약")
+
+    # 예산에 맞을 때까지 뒤쪽 행 제거 (이진 탐색)
+    all_rows = payload["rows"]
+    low, high = 0, len(all_rows)
+    while low < high:
+        middle = (low + high + 1) // 2
+        payload["rows"] = all_rows[:middle]
+        if estimate_tokens(_render(payload)) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    payload["rows"] = all_rows[:low]
+    payload["omitted_rows"] = len(all_rows) - low
+    return finish("행 제거")
+
+
+def _format_row(row, time_column):
+    rest = {k: v.strip() if isinstance(v, str) else v for k, v in row.items() if k != time_column}
+    rest = {k: v for k, v in rest.items() if v not in (None, "")}
+    parts = []
+    if "sender" in rest and "content" in rest:
+        parts.append(f"{rest.pop('sender')}: {_shorten(rest.pop('content'), TEXT_MAX_CHARS)}")
+    parts.extend(f"{k}={_shorten(v, TEXT_MAX_CHARS)}" for k, v in rest.items())
+    prefix = f"{str(row[time_column])[:5]} " if time_column and row.get(time_column) is not None else ""
+    return f"- {prefix}{' | '.join(parts)}"
+
+
+def format_context(rows, truncated=False, token_budget=QUERY_TOKEN_BUDGET):
+    """
+    쿼리 결과를 응답 생성 프롬프트에 바로 넣을 날짜별 텍스트 블록으로 만드는 함수
+
+    LLM 분석 단계(analyze_results) 없이 사용하므로 결과를 있는 그대로 정리만 한다.
+    예산을 넘으면 최근 날짜부터 채우고 오래된 행을 생략한다.
+
+    Args:
+        rows (list): dictionary 커서로 읽은 행 목록
+        truncated (bool): fetch_bounded 에서 한도로 잘렸는지 여부
+        token_budget (int): 블록의 최대 추정 토큰 수
+
+    Returns:
+        str: 예) "조회 결과 3건\n[2025-01-02]\n- 21:10 user: 영화 봤어\n..."
+    """
+    rows, common = project_columns(rows)
+    date_column = next((c for c in DATE_COLUMNS if rows and c in rows[0]), None)
+    if date_column is None:
+        date_column = next((c for c in DATE_COLUMNS if c in common), None)
+    time_column = next((c for c in TIME_COLUMNS if rows and c in rows[0]), None)
+
+    header = [f"조회 결과 {len(rows)}건" + (" (결과가 많아 일부만 읽음)" if truncated else "")]
+    shared = {k: v for k, v in common.items() if k != date_column}
+    if shared:
+        header.append("공통: " + ", ".join(f"{k}={_shorten(v, TEXT_MAX_CHARS)}" for k, v in shared.items()))
+
+    days = OrderedDict()
+    for row in rows:
+        day = str(row.get(date_column) if date_column in row else common.get(date_column, "")) if date_column else ""
+        days.setdefault(day, []).append({k: v for k, v in row.items() if k != date_column})
+
+    # 최근 날짜부터 예산 안에 들어오는 행만 고름
+    used = estimate_tokens("\n".join(header))
+    selected = {}
+    omitted = 0
+    for day in sorted(days, reverse=True):
+        day_rows = sorted(days[day], key=lambda r: str(r.get(time_column, ""))) if time_column else days[day]
+        lines = []
+        cost = estimate_tokens(f"[{day}]") if day else 0
+        for row in reversed(day_rows):
+            line = _format_row(row, time_column)
+            line_tokens = estimate_tokens(line)
+            if used + cost + line_tokens > token_budget:
+                omitted += len(day_rows) - len(lines)
+                break
+            lines.append(line)
+            cost += line_tokens
+        if lines:
+            selected[day] = lines[::-1]
+            used += cost
+        if omitted:
+            omitted += sum(len(days[d]) for d in days if d < day)
+            break
+
+    blocks = list(header)
+    for day in sorted(selected):
+        if day:
+            blocks.append(f"[{day}]")
+        blocks.extend(selected[day])
+    if omitted:
+        blocks.append(f"(오래된 {omitted}건 생략)")
+    context = "\n".join(blocks)
+    logger.info(f"쿼리 결과 블록: {len(rows) - omitted}/{len(rows)}행, 약 {estimate_tokens(context)}토큰")
+    return context
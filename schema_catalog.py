@@ -0,0 +1,119 @@
+import os
+import logging
+
+logger = logging.getLogger("SchemaCatalog")
+
+# SQL 프롬프트에 넣을 스키마를 필요한 테이블만 짧은 형식으로 만드는 도구
+# 예) chats(id bigint PK, user_id int -> users.id, content text "대화 내용", sending_date date) -- 채팅 기록
+
+# possible_tables 에 외래 키로 연결된 테이블도 함께 넣을지 여부
+SCHEMA_FK_NEIGHBORS = os.getenv("SCHEMA_FK_NEIGHBORS", "1") == "1"
+
+# 컬럼/테이블 설명을 자를 길이 (0 이면 설명을 넣지 않음)
+SCHEMA_COMMENT_MAX_CHARS = int(os.getenv("SCHEMA_COMMENT_MAX_CHARS", "30"))
+
+
+def load_catalog(cursor, database):
+    """
+    information_schema 에서 테이블/컬럼/외래 키 정보를 한 번에 읽는 함수
+
+    반환값:
+    - catalog: {table: {"comment": str, "columns": [{"name", "type", "key", "comment"}], "foreign_keys": {컬럼: "테이블.컬럼"}}}
+    """
+    cursor.execute("""
+        SELECT TABLE_NAME, TABLE_COMMENT
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = %s
+        ORDER BY TABLE_NAME
+    """, (database,))
+    catalog = {row["TABLE_NAME"]: {"comment": row["TABLE_COMMENT"] or "", "columns": [], "foreign_keys": {}}
+               for row in cursor.fetchall()}
+
+    cursor.execute("""
+        SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, COLUMN_KEY, COLUMN_COMMENT
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = %s
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+    """, (database,))
+    for row in cursor.fetchall():
+        table = catalog.get(row["TABLE_NAME"])
+        if table is not None:
+            table["columns"].append({
+                "name": row["COLUMN_NAME"],
+                "type": row["COLUMN_TYPE"],
+                "key": row["COLUMN_KEY"],
+                "comment": row["COLUMN_COMMENT"] or ""
+            })
+
+    cursor.execute("""
+        SELECT TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+        FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = %s AND REFERENCED_TABLE_NAME IS NOT NULL
+    """, (database,))
+    for row in cursor.fetchall():
+        table = catalog.get(row["TABLE_NAME"])
+        if table is not None:
+            table["foreign_keys"][row["COLUMN_NAME"]] = f"{row['REFERENCED_TABLE_NAME']}.{row['REFERENCED_COLUMN_NAME']}"
+
+    logger.info(f"스키마 정보 로드: 테이블 {len(catalog)}개")
+    return catalog
+
+
+def select_tables(catalog, tables=None, neighbors=SCHEMA_FK_NEIGHBORS):
+    """
+    프롬프트에 넣을 테이블 목록을 고르는 함수
+
+    tables 가 비어 있거나 아는 테이블이 하나도 없으면 모든 테이블을 사용한다.
+    neighbors 가 True 이면 고른 테이블과 외래 키로 직접 연결된 테이블도 포함한다.
+
+    Returns:
+        tuple: 정렬된 테이블 이름
+    """
+    selected = {t for t in (tables or []) if isinstance(t, str) and t in catalog}
+    if not selected:
+        return tuple(sorted(catalog))
+    if neighbors:
+        linked = set()
+        for name, info in catalog.items():
+            references = {ref.split(".", 1)[0] for ref in info["foreign_keys"].values()}
+            if name in selected:
+                linked |= references
+            elif references & selected:
+                linked.add(name)
+        selected |= linked & set(catalog)
+    return tuple(sorted(selected))
+
+
+def _comment(text):
+    if not text or not SCHEMA_COMMENT_MAX_CHARS:
+        return ""
+    text = " ".join(text.split())
+    return text if len(text) <= SCHEMA_COMMENT_MAX_CHARS else text[:SCHEMA_COMMENT_MAX_CHARS] + "..."
+
+
+def render_compact(catalog, tables):
+    """
+    테이블마다 한 줄의 DDL 비슷한 형식으로 스키마를 만드는 함수
+
+    기본값, NULL 여부 등 쿼리 작성에 덜 필요한 정보는 빼고 PK, 외래 키, 짧은 설명만 남긴다.
+    """
+    lines = []
+    for name in tables:
+        info = catalog[name]
+        columns = []
+        for column in info["columns"]:
+            text = f"{column['name']} {column['type']}"
+            if column["key"] == "PRI":
+                text += " PK"
+            if column["name"] in info["foreign_keys"]:
+                text += f" -> {info['foreign_keys'][column['name']]}"
+            comment = _comment(column["comment"])
+            if comment:
+                text += f' "{comment}"'
+            columns.append(text)
+        line = f"{name}({', '.join(columns)})"
+        table_comment = _comment(info["comment"])
+        if table_comment:
+            line += f" -- {table_comment}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger("SingleFlight")
+
+# 끝난 요청의 결과를 같은 키의 재시도에 돌려줄 시간(초)
+IDEMPOTENCY_TTL = float(os.getenv("HARUNI_IDEMPOTENCY_TTL", "300"))
+
+# 보관할 최대 결과 수 (넘으면 오래된 것부터 삭제)
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("HARUNI_IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    같은 키의 작업을 한 번만 실행하고 결과를 나눠 주는 클래스
+
+    - 실행 중인 키로 다시 요청하면 새로 실행하지 않고 진행 중인 작업의 결과를 기다림 (joined)
+    - 끝난 지 ttl 초가 지나지 않은 키는 저장된 결과를 바로 돌려줌 (replayed)
+    - 작업이 예외로 끝나면 기다리던 요청에도 같은 예외를 전달하고 결과는 저장하지 않음
+
+    사용 예:
+        result, kind = flight.do(key, lambda: answer(...))
+
+    Args:
+        ttl (float): 결과 보관 시간(초)
+        max_entries (int): 보관할 최대 결과 수
+    """
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._calls = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, now):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        expires, result = entry
+        if expires <= now:
+            del self._results[key]
+            return None
+        return result
+
+    def do(self, key, fn):
+        """
+        키에 대해 fn 을 한 번만 실행하는 메서드
+
+        Returns:
+            tuple: (결과, "leader" | "joined" | "replayed")
+        """
+        with self._lock:
+            result = self._lookup(key, time.monotonic())
+            if result is not None:
+                return result, "replayed"
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, "joined"
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                if call.error is None:
+                    self._results[key] = (time.monotonic() + self.ttl, call.result)
+                    self._results.move_to_end(key)
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            call.done.set()
+        return call.result, "leader"
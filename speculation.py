@@ -0,0 +1,136 @@
+import contextvars
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger("Speculation")
+
+# DB 판단(check_db_relevance)과 병렬로 DB 없는 응답을 미리 만드는 모드
+# 대부분의 대화는 DB 조회가 필요 없으므로, 판단이 끝나기 전에 응답 생성을 시작해 두고
+# DB 가 필요하다고 나오면 취소/폐기한다.
+SPECULATIVE_REPLY = os.getenv("HARUNI_SPECULATIVE_REPLY", "0") == "1"
+
+# 추측 응답을 만드는 스레드 수 (동시에 처리하는 사용자 수보다 작으면 일부 요청은 추측 없이 처리)
+SPECULATION_WORKERS = int(os.getenv("HARUNI_SPECULATION_WORKERS", "4"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# 빈 추측 스레드 수, 자리가 없으면 큐에 넣지 않고 추측을 건너뜀 (밀린 추측은 어차피 늦어 쓸모가 없음)
+_slots = threading.BoundedSemaphore(SPECULATION_WORKERS)
+
+# 현재 스레드에서 실행 중인 추측 작업의 취소 신호 (llm.py 가 호출 사이사이 확인)
+_cancel_event = contextvars.ContextVar("speculation_cancel", default=None)
+
+
+class SpeculationCancelled(Exception):
+    """추측 응답이 폐기되어 LLM 호출을 중단했을 때 발생하는 예외"""
+
+
+def check_cancelled():
+    """현재 작업이 폐기된 추측 응답이면 SpeculationCancelled 를 발생시키는 함수"""
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise SpeculationCancelled("추측 응답 폐기됨")
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix="speculation")
+        return _executor
+
+
+def speculate(fn, *args, **kwargs):
+    """
+    빈 추측 스레드가 있으면 Speculation 을 시작하는 함수
+
+    Returns:
+        Speculation: 시작한 추측 작업, 스레드가 모두 사용 중이면 None
+    """
+    if not _slots.acquire(blocking=False):
+        metrics.count_speculation("skipped")
+        logger.info("추측 스레드가 모두 사용 중이라 추측 응답 생략")
+        return None
+    try:
+        return Speculation(fn, *args, **kwargs)
+    except Exception:
+        _slots.release()
+        raise
+
+
+class Speculation:
+    """
+    함수를 백그라운드 스레드에서 미리 실행하고, 결과를 쓰거나(use) 버리는(discard) 작업
+
+    직접 만들지 않고 speculate() 로 시작한다 (추측 스레드 자리를 잡은 뒤 생성, 끝나면 자리 반환).
+
+    추측 작업은 별도의 요청 추적 정보에 단계 시간과 LLM 호출을 기록하고,
+    결과를 쓰면 현재 요청의 추적 정보에 합치고, 버리면 낭비량 지표로 기록한다.
+
+    사용 예:
+        speculation = speculate(response_agent.generate_response, question, history, None, user_info, user_mbti)
+        ...
+        speculation.discard()            # DB 가 필요한 경우
+        response, history = speculation.use()  # DB 가 필요 없는 경우
+    """
+    def __init__(self, fn, *args, **kwargs):
+        self._cancel = threading.Event()
+        self._request_id = metrics.current_request_id()
+        self._trace = None
+        self.started = time.perf_counter()
+        self.finished = None
+        context = contextvars.copy_context()
+        self.future = _get_executor().submit(context.run, self._run, fn, args, kwargs)
+        self.future.add_done_callback(lambda _: _slots.release())
+
+    def _run(self, fn, args, kwargs):
+        _cancel_event.set(self._cancel)
+        metrics.start_request(self._request_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.finished = time.perf_counter()
+            self._trace = metrics.finish_request()
+
+    @property
+    def discarded(self):
+        return self._cancel.is_set()
+
+    def discard(self):
+        """추측 결과를 쓰지 않기로 하고, 아직 실행 중이면 다음 LLM 호출 지점에서 중단시키는 메서드"""
+        if self._cancel.is_set():
+            return
+        self._cancel.set()
+        metrics.count_speculation("discarded")
+        self.future.add_done_callback(self._record_waste)
+
+    def use(self):
+        """
+        추측 결과를 기다려 반환하는 메서드
+
+        Raises:
+            Exception: 추측 작업에서 난 예외 (호출한 쪽에서 일반 경로로 다시 생성)
+        """
+        head_start = time.perf_counter() - self.started
+        try:
+            result = self.future.result()
+        except Exception:
+            metrics.count_speculation("failed")
+            self._record_waste(self.future)
+            raise
+        metrics.count_speculation("hit")
+        metrics.observe_speculation_head_start(head_start)
+        metrics.merge_trace(self._trace)
+        return result
+
+    def _record_waste(self, future):
+        seconds = (self.finished or time.perf_counter()) - self.started
+        llm_calls = self._trace["llm_calls"] if self._trace else []
+        metrics.record_speculation_waste(seconds, llm_calls)
+        logger.info(f"추측 응답 폐기: {seconds:.2f}초, LLM 호출 {len(llm_calls)}회")
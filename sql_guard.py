@@ -0,0 +1,191 @@
+import json
+import os
+import re
+import threading
+import time
+import logging
+from metrics import count_sql_guard
+
+logger = logging.getLogger("SQLGuard")
+
+# LLM 이 만든 SQL 을 실행하기 전에 검사하는 도구
+# - SELECT 한 문장만 허용
+# - LIMIT 이 없거나 너무 크면 LIMIT 을 넣음
+# - EXPLAIN 의 예상 검사 행 수가 기준을 넘으면 거부
+# - MAX_EXECUTION_TIME 힌트로 실행 시간 제한
+
+SQL_GUARD_LIMIT = int(os.getenv("SQL_GUARD_LIMIT", "201"))
+SQL_GUARD_MAX_EXAMINED_ROWS = int(os.getenv("SQL_GUARD_MAX_EXAMINED_ROWS", "100000"))
+SQL_GUARD_TIMEOUT_MS = int(os.getenv("SQL_GUARD_TIMEOUT_MS", "3000"))
+
+# 정규화한 SQL 과 EXPLAIN 결과를 기록할 파일 (index_advisor.py 입력), 빈 값이면 기록하지 않음
+SQL_QUERY_LOG = os.getenv("SQL_QUERY_LOG", os.path.join("sql_log", "queries.jsonl"))
+
+# 문자열 리터럴 안의 키워드는 검사하지 않도록 미리 지움
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|`[^`]*`")
+# 리터럴을 먼저 매칭해야 '%#운동%' 같은 값 안의 #, --, /* 를 주석으로 보지 않음
+LITERAL_OR_COMMENT = re.compile(
+    rf"(?P<literal>{STRING_LITERAL.pattern})|(?P<comment>/\*(?!\+).*?\*/|--[^\n]*|#[^\n]*)", re.DOTALL)
+
+FORBIDDEN = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|REPLACE|MERGE|DROP|ALTER|CREATE|TRUNCATE|RENAME|GRANT|REVOKE|"
+    r"LOCK|UNLOCK|CALL|LOAD|HANDLER|SET|DO|INTO|OUTFILE|DUMPFILE|SLEEP|BENCHMARK|GET_LOCK)\b",
+    re.IGNORECASE
+)
+FOR_UPDATE = re.compile(r"\bFOR\s+(UPDATE|SHARE)\b|\bLOCK\s+IN\s+SHARE\s+MODE\b", re.IGNORECASE)
+TRAILING_LIMIT = re.compile(r"\bLIMIT\s+(\d+)(?:\s*,\s*(\d+))?(?:\s+OFFSET\s+(\d+))?\s*$", re.IGNORECASE)
+HINT = re.compile(r"/\*\+.*?\*/", re.DOTALL)
+NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+# EXPLAIN 결과 중 기록할 항목
+PLAN_FIELDS = ("table", "type", "possible_keys", "key", "key_len", "rows", "filtered", "Extra")
+
+_log_lock = threading.Lock()
+
+
+def strip_comments(sql):
+    """
+    문자열 리터럴은 그대로 두고 주석만 지우는 함수 (/*+ 힌트 */ 는 유지)
+    """
+    return LITERAL_OR_COMMENT.sub(lambda m: m.group("literal") or " ", sql)
+
+
+def normalize_sql(sql):
+    """
+    리터럴을 ? 로 바꾸고 공백을 정리해 같은 모양의 쿼리가 같은 문자열이 되도록 하는 함수
+    """
+    normalized = HINT.sub(" ", sql)
+    normalized = re.sub(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"", "?", normalized)
+    normalized = NUMBER_LITERAL.sub("?", normalized)
+    normalized = IN_LIST.sub("IN (?)", normalized)
+    return re.sub(r"\s+", " ", normalized).strip()
+
+
+def record_query(sql, plan, estimate, rejected, path=SQL_QUERY_LOG):
+    """
+    정규화한 SQL 과 EXPLAIN 결과를 JSONL 파일에 한 줄 추가하는 함수
+
+    원문 리터럴(사용자 ID, 날짜 등)은 남기지 않는다.
+    """
+    if not path:
+        return
+    entry = {
+        "ts": round(time.time(), 3),
+        "sql": normalize_sql(sql),
+        "rows": estimate,
+        "rejected": rejected,
+        "plan": [{field: step.get(field) for field in PLAN_FIELDS} for step in plan]
+    }
+    line = json.dumps(entry, ensure_ascii=False, default=str)
+    try:
+        with _log_lock:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"쿼리 기록 실패: {e}")
+
+
+class SQLGuardError(Exception):
+    """검사를 통과하지 못해 실행하지 않은 쿼리에 대한 예외"""
+
+
+class SQLGuard:
+    """
+    LLM 이 생성한 SQL 을 검사하고 제한을 붙여 실행하는 클래스
+
+    Args:
+        limit (int): 결과 행 수 상한 (LIMIT 이 없거나 더 크면 이 값으로 바꿈)
+        max_examined_rows (int): EXPLAIN 예상 검사 행 수 상한
+        timeout_ms (int): 쿼리 실행 시간 제한(밀리초)
+    """
+    def __init__(self, limit=SQL_GUARD_LIMIT, max_examined_rows=SQL_GUARD_MAX_EXAMINED_ROWS, timeout_ms=SQL_GUARD_TIMEOUT_MS):
+        self.limit = limit
+        self.max_examined_rows = max_examined_rows
+        self.timeout_ms = timeout_ms
+
+    def _reject(self, reason, query):
+        logger.warning(f"SQL 거부: {reason} - {query[:200]}")
+        count_sql_guard("rejected")
+        raise SQLGuardError(reason)
+
+    def prepare(self, query):
+        """
+        쿼리를 검사하고 LIMIT 과 실행 시간 힌트를 붙여 반환하는 메서드
+
+        Raises:
+            SQLGuardError: SELECT 한 문장이 아니거나 금지된 구문이 있을 때
+        """
+        sql = strip_comments(query or "").strip().rstrip(";").strip()
+        if not sql:
+            self._reject("빈 쿼리", query or "")
+        scrubbed = STRING_LITERAL.sub("''", sql)
+        if ";" in scrubbed:
+            self._reject("여러 문장은 실행할 수 없음", sql)
+        if not re.match(r"^\(?\s*SELECT\b", scrubbed, re.IGNORECASE):
+            self._reject("SELECT 문만 실행할 수 있음", sql)
+        forbidden = FORBIDDEN.search(scrubbed)
+        if forbidden:
+            self._reject(f"허용되지 않는 구문: {forbidden.group(1).upper()}", sql)
+        if FOR_UPDATE.search(scrubbed):
+            self._reject("잠금 읽기는 허용되지 않음", sql)
+
+        limit_match = TRAILING_LIMIT.search(scrubbed)
+        if limit_match is None:
+            sql = f"{sql} LIMIT {self.limit}"
+        else:
+            # LIMIT n / LIMIT offset, n / LIMIT n OFFSET m
+            count = int(limit_match.group(2) or limit_match.group(1))
+            if count > self.limit:
+                offset = limit_match.group(3) if limit_match.group(3) else (limit_match.group(1) if limit_match.group(2) else None)
+                tail = f"LIMIT {self.limit}" + (f" OFFSET {offset}" if offset else "")
+                sql = TRAILING_LIMIT.sub(tail, sql)
+                logger.info(f"LIMIT {count} -> {self.limit} 로 축소")
+
+        # 첫 SELECT 바로 뒤에 실행 시간 제한 힌트 추가
+        return re.sub(r"^(\(?\s*SELECT)\b", rf"\1 /*+ MAX_EXECUTION_TIME({self.timeout_ms}) */", sql, count=1, flags=re.IGNORECASE)
+
+    def estimate_rows(self, cursor, sql):
+        """
+        EXPLAIN 결과로 예상 검사 행 수를 계산하는 메서드
+
+        조인은 중첩 루프로 보고 각 단계의 rows 를 곱한 값을 상한으로 사용한다.
+
+        반환값:
+        - estimate: 예상 검사 행 수
+        - full_scans: 전체 스캔(type=ALL)하는 테이블 목록
+        - plan: EXPLAIN 결과 행 목록
+        """
+        cursor.execute(f"EXPLAIN {sql}")
+        plan = cursor.fetchall()
+        estimate = 1
+        full_scans = []
+        for step in plan:
+            estimate *= max(1, int(step.get("rows") or 1))
+            if step.get("type") == "ALL":
+                full_scans.append(step.get("table"))
+        return estimate, full_scans, plan
+
+    def execute(self, cursor, query):
+        """
+        검사, EXPLAIN 비용 확인 후 쿼리를 실행하는 메서드
+
+        Returns:
+            str: 실제로 실행한 SQL
+
+        Raises:
+            SQLGuardError: 검사 또는 비용 기준을 통과하지 못했을 때
+        """
+        sql = self.prepare(query)
+        estimate, full_scans, plan = self.estimate_rows(cursor, sql)
+        scan_note = f", 전체 스캔: {', '.join(str(t) for t in full_scans)}" if full_scans else ""
+        record_query(sql, plan, estimate, rejected=estimate > self.max_examined_rows)
+        if estimate > self.max_examined_rows:
+            self._reject(f"예상 검사 행 수 {estimate}건이 기준 {self.max_examined_rows}건을 초과함{scan_note}", sql)
+        logger.info(f"SQL 실행: 예상 검사 행 수 {estimate}건{scan_note}")
+        count_sql_guard("allowed")
+        cursor.execute(sql)
+        return sql
@@ -2,15 +2,6 @@ import json
 import logging
 from agent.llm import llm, ModelProvider
 
-# 로깅 설정
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("haruni.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("StyleAgent")
 
 # 현재 responseAgent에서 간소화 버전 사용 중
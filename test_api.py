@@ -1,16 +1,8 @@
 import requests
 import json
 import logging
+from logging_setup import setup_logging
 
-# 로깅 설정
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("haruni.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger("TestAPI")
 
 def test_chat_api():
@@ -57,6 +49,7 @@ def test_chat_api():
     logger.info("API 테스트 완료")
         
 if __name__ == "__main__":
+    setup_logging()
     logger.info("테스트 스크립트 시작")
     test_chat_api()
     logger.info("테스트 스크립트 종료") 
\ No newline at end of file
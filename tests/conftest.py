@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# 저장소 루트의 모듈(sql_guard 등)을 패키지(__init__.py) 없이 바로 가져오도록 경로 추가
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 테스트 중에는 쿼리 기록 파일을 만들지 않음
+os.environ.setdefault("SQL_QUERY_LOG", "")
+
+# OpenAI 대신 로컬 대체 클라이언트(fake_openai.py)를 쓰고, 디스크 캐시는 임시 디렉터리에 둠
+os.environ.setdefault("HARUNI_FAKE_OPENAI", "1")
+os.environ.setdefault("HARUNI_CACHE_DIR", tempfile.mkdtemp(prefix="haruni-test-cache-"))
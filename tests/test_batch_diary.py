@@ -0,0 +1,66 @@
+import json
+
+import create_diary
+from batch_diary import run_batch
+from image_store import ImageStore
+
+DATE = "2026-10-14"
+CONVERSATIONS = {
+    "u1": [{"role": "user", "content": "오늘 친구랑 산책해서 좋았어"}, {"role": "assistant", "content": "좋았겠다!"}],
+    "u2": [{"role": "user", "content": "회사 일이 많아서 힘들었어"}],
+}
+
+
+def _run(tmp_path, conversations=CONVERSATIONS):
+    return run_batch(
+        conversations, DATE, str(tmp_path / "diaries.jsonl"), str(tmp_path / "diaries.jsonl.checkpoint"),
+        concurrency=2, rpm=0, batch_size=1, image_store=ImageStore(str(tmp_path / "images"))
+    )
+
+
+def _rows(tmp_path):
+    with open(tmp_path / "diaries.jsonl", encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_writes_diaries_with_stored_images(tmp_path):
+    stats = _run(tmp_path)
+    assert (stats["succeeded"], stats["failed"], stats["skipped"]) == (2, 0, 0)
+
+    rows = {row["user_id"]: row for row in _rows(tmp_path)}
+    assert set(rows) == {"u1", "u2"}
+    for row in rows.values():
+        assert row["date"] == DATE and row["diary"]
+        # 만료되는 OpenAI URL 대신 저장된 이미지 주소를 기록
+        assert row["image_digest"] and row["image_url"] == f"/api/v1/images/{row['image_digest']}"
+        assert ImageStore(str(tmp_path / "images")).exists(row["image_digest"])
+
+    with open(tmp_path / "diaries.jsonl.checkpoint", encoding="utf-8") as file:
+        assert json.load(file) == {"date": DATE, "done": ["u1", "u2"]}
+
+
+def test_rerun_skips_checkpointed_users(tmp_path):
+    _run(tmp_path)
+    stats = _run(tmp_path)
+    assert (stats["total"], stats["skipped"]) == (0, 2)
+    assert len(_rows(tmp_path)) == 2
+
+
+def test_resume_after_crash_before_checkpoint(tmp_path):
+    # u1 결과는 기록됐지만 체크포인트 저장 전에 중단되고, 다음 줄은 쓰는 도중 잘린 상태
+    _run(tmp_path, {"u1": CONVERSATIONS["u1"]})
+    (tmp_path / "diaries.jsonl.checkpoint").unlink()
+    with open(tmp_path / "diaries.jsonl", "a", encoding="utf-8") as file:
+        file.write('{"user_id": "u2", "da')
+
+    stats = _run(tmp_path)
+    assert (stats["total"], stats["skipped"]) == (1, 1)
+    assert sorted(row["user_id"] for row in _rows(tmp_path)) == ["u1", "u2"]
+
+
+def test_image_failure_keeps_diary(tmp_path, monkeypatch):
+    monkeypatch.setattr(create_diary, "create_daily_diary_image", lambda illustration: None)
+    stats = _run(tmp_path, {"u1": CONVERSATIONS["u1"]})
+    assert stats["succeeded"] == 1
+    [row] = _rows(tmp_path)
+    assert row["diary"] and row["image_url"] is None and row["image_digest"] is None
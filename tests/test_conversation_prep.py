@@ -0,0 +1,37 @@
+from conversation_prep import apply_budget, preprocess_conversation
+from tokens import estimate_tokens
+
+
+CONVERSATION = [
+    {"role": "user", "content": "오늘 회사에서 발표를 했어"},
+    {"role": "assistant", "content": "우와 정말 멋지다!!! 발표는 어땠어? 떨리지는 않았어?"},
+    {"role": "user", "content": "조금 떨렸는데 잘 끝났어"},
+    {"role": "assistant", "content": "잘했네~~~ 오늘 저녁은 푹 쉬어!"},
+]
+
+
+def test_budget_matches_single_pass():
+    prepared, stats = preprocess_conversation(CONVERSATION)
+    budget = stats["tokens_out"] - 1
+    budgeted, budgeted_stats = apply_budget(prepared, stats, budget)
+    assert (budgeted, budgeted_stats) == preprocess_conversation(CONVERSATION, budget)
+
+
+def test_budget_drops_oldest_assistant_and_updates_stats():
+    prepared, stats = preprocess_conversation(CONVERSATION)
+    budget = stats["tokens_out"] - 1
+    budgeted, budgeted_stats = apply_budget(prepared, stats, budget)
+
+    assert [m["role"] for m in budgeted] == ["user", "user", "assistant"]
+    assert budgeted_stats["messages_in"] == stats["messages_in"]
+    assert budgeted_stats["messages_out"] == len(budgeted)
+    assert budgeted_stats["tokens_out"] == sum(estimate_tokens(m["content"]) for m in budgeted)
+    assert budgeted_stats["tokens_saved"] == stats["tokens_in"] - budgeted_stats["tokens_out"]
+    # 원래 결과는 바뀌지 않음 (구간 요약 방식에서 그대로 다시 쓸 수 있도록)
+    assert len(prepared) == stats["messages_out"] == 4
+
+
+def test_within_budget_is_unchanged():
+    prepared, stats = preprocess_conversation(CONVERSATION)
+    assert apply_budget(prepared, stats, stats["tokens_out"]) == (prepared, stats)
+    assert apply_budget(prepared, stats, 0) == (prepared, stats)
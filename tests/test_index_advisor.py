@@ -0,0 +1,33 @@
+from index_advisor import advise
+
+
+def _shapes(*sqls):
+    return {sql: {"count": 1, "rejected": 0, "rows": [100], "plan": {}} for sql in sqls}
+
+
+def _ddl(report):
+    return [rec["ddl"] for rec in report["recommendations"]]
+
+
+def test_join_without_catalog_skips_referenced_primary_key():
+    report = advise(_shapes("SELECT c.content FROM chats c JOIN users u ON c.user_id = u.id WHERE u.name = ?"))
+    assert _ddl(report) == [
+        "ALTER TABLE `chats` ADD INDEX `idx_chats_user_id` (`user_id`);",
+        "ALTER TABLE `users` ADD INDEX `idx_users_name` (`name`);",
+    ]
+
+
+def test_primary_key_lookup_is_not_recommended():
+    report = advise(_shapes("SELECT * FROM diaries WHERE id = ? AND date > ?"))
+    assert report["recommendations"] == []
+
+
+def test_catalog_primary_key_is_used():
+    catalog = {"chats": {"columns": {"chat_id", "user_id"}, "indexes": {"PRIMARY": ["chat_id"]}, "rows": 10}}
+    report = advise(_shapes("SELECT * FROM chats WHERE chat_id = ?", "SELECT * FROM chats WHERE id = ?"), catalog)
+    assert _ddl(report) == ["ALTER TABLE `chats` ADD INDEX `idx_chats_id` (`id`);"]
+
+
+def test_join_on_primary_key_alone_recommends_only_referencing_side():
+    report = advise(_shapes("SELECT c.content FROM chats c JOIN users u ON c.user_id = u.id"))
+    assert _ddl(report) == ["ALTER TABLE `chats` ADD INDEX `idx_chats_user_id` (`user_id`);"]
@@ -0,0 +1,33 @@
+import numpy as np
+
+from mood_classifier import MoodClassifier, term_alternation
+
+
+def test_term_alternation_prefers_longest_term():
+    import re
+    pattern = re.compile(term_alternation(["무서", "무섭", "좋", "좋아"]))
+    assert [m.group() for m in pattern.finditer("무섭고 무서워 좋아 좋")] == ["무섭", "무서", "좋아", "좋"]
+
+
+def test_features_count_each_term_like_str_count():
+    classifier = MoodClassifier({"ㅋㅋ": 0.5, "무서": -1.0, "서운": -1.0})
+    counts, negated, _ = classifier._features(["ㅋㅋㅋㅋㅋ", "너무서운"])
+    assert counts.tolist() == [[2, 0, 0], [0, 1, 1]]
+    assert not negated.any()
+
+
+def test_negation_counted_once_per_occurrence():
+    classifier = MoodClassifier({"좋": 1.0, "싫": -1.0})
+    counts, negated, intensifiers = classifier._features(["안 좋지 않았어 정말 좋아", "", "진짜 너무 싫지 않아"])
+    assert counts.tolist() == [[2, 0], [0, 0], [0, 1]]
+    assert negated.tolist() == [[1, 0], [0, 0], [0, 1]]
+    assert intensifiers.tolist() == [1, 0, 2]
+
+
+def test_batch_matches_single_texts():
+    classifier = MoodClassifier()
+    texts = ["오늘 너무 행복했어 ㅎㅎ", "별로 좋지 않았어", "", "일이 힘들고 짜증났어 ㅠㅠ"]
+    scores, _ = classifier.score_texts(texts)
+    single = [classifier.classify(text).score for text in texts]
+    assert np.allclose(scores, single)
+    assert [r.label for r in classifier.classify_batch(texts)] == ["happy", "sad", "normal", "sad"]
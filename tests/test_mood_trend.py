@@ -0,0 +1,26 @@
+from mood_trend import MoodSeriesStore, to_day
+
+
+def test_separate_stores_do_not_erase_each_other(tmp_path):
+    # 앱과 batch_diary 처럼 서로 다른 저장소 객체가 같은 디렉터리에 기록하는 경우
+    app_store = MoodSeriesStore(str(tmp_path))
+    batch_store = MoodSeriesStore(str(tmp_path))
+    app_store.record("u1", "2026-10-01", "happy")
+    assert len(batch_store.load("u1").days) == 1
+
+    batch_store.record("u1", "2026-10-02", "sad")
+    app_store.record("u1", "2026-10-03", "normal")
+
+    for store in (app_store, batch_store):
+        series = store.load("u1")
+        assert series.days.tolist() == [to_day("2026-10-01"), to_day("2026-10-02"), to_day("2026-10-03")]
+        assert series.codes.tolist() == [1, -1, 0]
+
+
+def test_same_day_keeps_latest_entry(tmp_path):
+    store = MoodSeriesStore(str(tmp_path))
+    store.record("u1", "2026-10-01", "happy")
+    store.record_many("u1", [("2026-10-01", "sad", -0.5), ("2026-10-01", "normal", 0.1)])
+    series = MoodSeriesStore(str(tmp_path)).load("u1")
+    assert series.days.tolist() == [to_day("2026-10-01")]
+    assert series.codes.tolist() == [0]
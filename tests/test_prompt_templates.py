@@ -0,0 +1,30 @@
+from prompt_templates import _message_tokens, fit_to_budget
+from tokens import message_text
+
+
+def _wrapped_assistant(text):
+    # responseAgent.generate_response 가 히스토리에 저장하는 하루니 응답 형식
+    return [{"role": "assistant", "content": [{"type": "text", "text": text}]}]
+
+
+def test_message_text_unwraps_history_entries():
+    assert message_text(_wrapped_assistant("안녕")) == "안녕"
+    assert message_text({"role": "user", "content": "오늘"}) == "오늘"
+    assert message_text([{"role": "assistant", "content": {"type": "text", "text": "응답"}}]) == "응답"
+
+
+def test_list_wrapped_turn_is_counted():
+    assert _message_tokens(_wrapped_assistant("가" * 1000)) == 1004
+
+
+def test_long_list_wrapped_turn_is_trimmed():
+    history = [
+        {"role": "user", "content": "첫 질문"},
+        _wrapped_assistant("가" * 1000),
+        {"role": "user", "content": "두 번째 질문"},
+        _wrapped_assistant("짧은 답"),
+    ]
+    _, trimmed, usage = fit_to_budget("시스템", "질문", history=history, budget=200)
+    assert trimmed == history[2:]
+    assert usage["trimmed"] == ["history"]
+    assert usage["total"] <= 200
@@ -0,0 +1,91 @@
+import pytest
+from sql_guard import SQLGuard, SQLGuardError, strip_comments
+
+# sql_guard.SQLGuard.prepare 단위 테스트 (DB 없이 실행)
+# python -m pytest -q tests
+
+HINT = "/*+ MAX_EXECUTION_TIME(3000) */"
+
+
+@pytest.fixture
+def guard():
+    return SQLGuard(limit=201, timeout_ms=3000)
+
+
+def test_comment_markers_inside_literals_are_kept(guard):
+    sql = guard.prepare("SELECT content FROM chats WHERE content LIKE '%#운동%';")
+    assert sql == f"SELECT {HINT} content FROM chats WHERE content LIKE '%#운동%' LIMIT 201"
+
+    sql = guard.prepare("SELECT content FROM chats WHERE content = 'a -- b' AND user_id = 5")
+    assert "content = 'a -- b' AND user_id = 5 LIMIT 201" in sql
+
+    sql = guard.prepare("SELECT content FROM chats WHERE content = '/* x */' AND user_id = 5")
+    assert "content = '/* x */' AND user_id = 5 LIMIT 201" in sql
+
+
+def test_real_comments_are_removed():
+    assert strip_comments("SELECT 1 -- 설명\nFROM chats # 끝") .split() == ["SELECT", "1", "FROM", "chats"]
+    assert strip_comments("SELECT /* a */ 1 FROM t") == "SELECT   1 FROM t"
+    assert strip_comments("SELECT /*+ BKA(t) */ 1 FROM t") == "SELECT /*+ BKA(t) */ 1 FROM t"
+
+
+def test_comment_cannot_hide_filter(guard):
+    # 주석 뒤의 조건은 지워지지만 LIMIT 은 주석 밖에 붙어야 함
+    sql = guard.prepare("SELECT * FROM chats WHERE user_id = 5 -- LIMIT 100000")
+    assert sql.endswith("WHERE user_id = 5 LIMIT 201")
+
+
+def test_limit_injected_when_missing(guard):
+    assert guard.prepare("SELECT * FROM diaries").endswith("FROM diaries LIMIT 201")
+
+
+def test_small_limit_is_kept(guard):
+    assert guard.prepare("SELECT * FROM diaries LIMIT 10").endswith("LIMIT 10")
+
+
+@pytest.mark.parametrize("query, tail", [
+    ("SELECT * FROM chats LIMIT 5000", "LIMIT 201"),
+    ("SELECT * FROM chats LIMIT 20, 5000", "LIMIT 201 OFFSET 20"),
+    ("SELECT * FROM chats LIMIT 5000 OFFSET 40", "LIMIT 201 OFFSET 40"),
+])
+def test_large_limit_is_clamped(guard, query, tail):
+    assert guard.prepare(query).endswith(tail)
+
+
+def test_execution_time_hint_added(guard):
+    assert guard.prepare("select id from users").startswith(f"select {HINT} id")
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM chats; DROP TABLE chats",
+    "SELECT * FROM chats; SELECT * FROM users",
+    "SELECT 1 /* ; */; DELETE FROM chats",
+])
+def test_multiple_statements_rejected(guard, query):
+    with pytest.raises(SQLGuardError):
+        guard.prepare(query)
+
+
+def test_semicolon_inside_literal_allowed(guard):
+    assert "content = 'a; b'" in guard.prepare("SELECT * FROM chats WHERE content = 'a; b'")
+
+
+@pytest.mark.parametrize("query", [
+    "DELETE FROM chats",
+    "UPDATE users SET nickname = 'x'",
+    "INSERT INTO chats VALUES (1)",
+    "WITH t AS (SELECT 1) SELECT * FROM t",
+    "SELECT * INTO OUTFILE '/tmp/x' FROM users",
+    "SELECT * FROM users FOR UPDATE",
+    "SELECT SLEEP(10)",
+    "-- SELECT\nDROP TABLE users",
+    "",
+])
+def test_non_select_rejected(guard, query):
+    with pytest.raises(SQLGuardError):
+        guard.prepare(query)
+
+
+def test_keywords_inside_literals_allowed(guard):
+    sql = guard.prepare("SELECT * FROM chats WHERE content = 'delete this; update that'")
+    assert "'delete this; update that'" in sql
@@ -0,0 +1,63 @@
+import math
+import re
+
+# 프롬프트 길이를 토크나이저 없이 대략 계산하기 위한 도구
+# Gemma 토크나이저 기준으로 한글 음절은 대략 1토큰, 영문/숫자/기호는 약 4글자당 1토큰으로 본다.
+
+HANGUL_PATTERN = re.compile(r"[가-힣ㄱ-ㆎ]")
+ASCII_PATTERN = re.compile(r"[\x21-\x7e]")
+
+
+def estimate_tokens(text):
+    """
+    문자열의 토큰 수를 추정하는 함수
+
+    Args:
+        text (str): 대상 문자열 (문자열이 아니면 str() 로 변환)
+
+    Returns:
+        int: 추정 토큰 수
+    """
+    if not text:
+        return 0
+    text = str(text)
+    hangul = len(HANGUL_PATTERN.findall(text))
+    ascii_chars = len(ASCII_PATTERN.findall(text))
+    other = len(text) - hangul - ascii_chars - text.count(" ") - text.count("\n")
+    return hangul + math.ceil(ascii_chars / 4) + max(0, other)
+
+
+def message_text(message):
+    """
+    대화 히스토리 항목에서 텍스트만 꺼내는 함수
+
+    responseAgent 는 하루니 응답을 [{"role": "assistant", "content": [{"type": "text", "text": ...}]}] 처럼
+    리스트로 감싸 저장하므로, 리스트 -> 메시지 -> content 부분 순서로 풀어서 읽는다.
+    """
+    if message is None:
+        return ""
+    if isinstance(message, list):
+        return " ".join(text for text in (message_text(item) for item in message) if text)
+    if isinstance(message, dict):
+        if "content" not in message:
+            # {"type": "text", "text": ...} 형식의 content 부분
+            return str(message.get("text", ""))
+        return message_text(message["content"])
+    return str(message)
+
+
+def truncate_to_tokens(text, max_tokens, suffix="..."):
+    """
+    추정 토큰 수가 max_tokens 이하가 되도록 문자열 끝을 자르는 함수
+    """
+    text = str(text)
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + suffix
@@ -0,0 +1,94 @@
+import os
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger("UserLock")
+
+# 사용자 한 명당 동시에 기다릴 수 있는 요청 수 (처리 중인 요청 포함)
+USER_QUEUE_DEPTH = int(os.getenv("HARUNI_USER_QUEUE_DEPTH", "3"))
+
+# 앞선 요청이 끝나기를 기다리는 최대 시간(초)
+USER_QUEUE_TIMEOUT = float(os.getenv("HARUNI_USER_QUEUE_TIMEOUT", "120"))
+
+
+class QueueFullError(Exception):
+    """사용자별 대기열이 가득 찼거나 대기 시간이 지나 요청을 받을 수 없을 때 발생하는 예외"""
+
+
+class _Slot:
+    def __init__(self):
+        self.next_ticket = 0
+        self.serving = 0
+        self.skipped = set()
+        self.condition = threading.Condition()
+
+    @property
+    def pending(self):
+        return self.next_ticket - self.serving
+
+
+class KeyedLock:
+    """
+    같은 키(사용자)의 작업은 도착 순서대로 하나씩, 다른 키의 작업은 병렬로 실행하는 잠금
+
+    키마다 번호표(ticket)를 나눠 주고 번호 순서대로 실행하므로 FIFO 순서가 보장된다.
+    대기 중인 작업이 max_pending 에 도달하면 QueueFullError 로 바로 거절한다.
+
+    사용 예:
+        with user_locks.hold(user_id):
+            ...
+
+    Args:
+        max_pending (int): 키당 최대 대기 작업 수 (실행 중인 작업 포함)
+        timeout (float): 차례를 기다리는 최대 시간(초)
+    """
+    def __init__(self, max_pending=USER_QUEUE_DEPTH, timeout=USER_QUEUE_TIMEOUT):
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def pending(self, key):
+        with self._lock:
+            slot = self._slots.get(key)
+            return slot.pending if slot else 0
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = _Slot()
+            with slot.condition:
+                if slot.pending >= self.max_pending:
+                    logger.warning(f"사용자 대기열 가득 참: {key} ({slot.pending}건 대기)")
+                    raise QueueFullError(f"이전 요청을 처리 중입니다. 잠시 후 다시 시도해주세요. ({slot.pending}건 대기)")
+                ticket = slot.next_ticket
+                slot.next_ticket += 1
+
+        acquired = False
+        try:
+            with slot.condition:
+                acquired = slot.condition.wait_for(lambda: slot.serving == ticket, timeout=self.timeout)
+            if not acquired:
+                raise QueueFullError(f"이전 요청이 {self.timeout:.0f}초 안에 끝나지 않았습니다.")
+            yield
+        finally:
+            self._release(key, slot, ticket, acquired)
+
+    def _release(self, key, slot, ticket, acquired):
+        with self._lock:
+            with slot.condition:
+                if acquired:
+                    slot.serving += 1
+                else:
+                    # 차례가 오기 전에 포기한 번호표는 차례가 왔을 때 건너뜀
+                    slot.skipped.add(ticket)
+                while slot.serving in slot.skipped:
+                    slot.skipped.discard(slot.serving)
+                    slot.serving += 1
+                slot.condition.notify_all()
+                if slot.pending == 0:
+                    # 대기 작업이 없으면 메모리 정리
+                    self._slots.pop(key, None)